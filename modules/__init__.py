@@ -2,11 +2,21 @@
 QwenGround Modules
 """
 
-from .perspective_adapter import PerspectiveAdapter
-from .reconstruction_3d import Reconstruction3D, PointCloud3D
-from .fusion_alignment import FusionAlignment
-from .object_lookup_table import ObjectLookupTable, Object3D
-from .visualization import Visualizer
+import importlib
+
+# 导出名称 -> 子模块；子模块在首次访问时才导入（PEP 562）
+_LAZY_IMPORTS = {
+    'PerspectiveAdapter': 'perspective_adapter',
+    'Reconstruction3D': 'reconstruction_3d',
+    'PointCloud3D': 'reconstruction_3d',
+    'FusionAlignment': 'fusion_alignment',
+    'ObjectLookupTable': 'object_lookup_table',
+    'Object3D': 'object_lookup_table',
+    'Visualizer': 'visualization',
+    'StageScheduler': 'stage_scheduler',
+    'SceneStore': 'scene_store',
+    'SceneContext': 'scene_store',
+}
 
 __all__ = [
     'PerspectiveAdapter',
@@ -15,6 +25,22 @@ __all__ = [
     'FusionAlignment',
     'ObjectLookupTable',
     'Object3D',
-    'Visualizer'
+    'Visualizer',
+    'StageScheduler',
+    'SceneStore',
+    'SceneContext'
 ]
 
+
+def __getattr__(name):
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
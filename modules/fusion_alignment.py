@@ -3,16 +3,22 @@ Fusion Alignment Module
 融合2D视图与3D空间描述，使用VLM进行grounding
 """
 
+import os
+import math
 import cv2
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Tuple, Optional
 from PIL import Image
 import logging
 
 from modules.object_lookup_table import ObjectLookupTable, Object3D
-from modules.reconstruction_3d import PointCloud3D
-from utils.vlm_client import QwenVLMClient
+from modules.reconstruction_3d import PointCloud3D, Reconstruction3D
+from utils.vlm_client import QwenVLMClient, QueryAnalysis
 from utils.object_detector import ObjectDetector
+from utils.text_embedder import TextEmbedder
+from utils.json_constraint import grounding_answer_schema
+from utils.response_parser import parse_candidate_id
 
 logger = logging.getLogger(__name__)
 
@@ -22,60 +28,141 @@ class FusionAlignment:
     
     def __init__(self,
                  vlm_client: QwenVLMClient,
-                 object_detector: ObjectDetector):
+                 object_detector: ObjectDetector,
+                 bbox_sample_size: int = 16,
+                 bbox_crop_ratio: float = 0.6,
+                 bbox_percentile: float = 10.0,
+                 min_bbox_size: float = 0.05,
+                 num_workers: Optional[int] = None,
+                 text_embedder: Optional[TextEmbedder] = None,
+                 candidate_top_k: int = 20,
+                 candidate_min_score: float = 0.5,
+                 verify_with_vlm: bool = True,
+                 verify_max_images: int = 2,
+                 verify_tiles_per_image: int = 4):
         """
         Args:
             vlm_client: VLM客户端
             object_detector: 物体检测器
+            bbox_sample_size: 每个2D框内深度采样网格的边长（S×S个采样点）
+            bbox_crop_ratio: 深度采样区域相对2D框的比例（中心裁剪，减少背景像素）
+            bbox_percentile: 深度范围使用的分位数（取 [p, 100-p]）
+            min_bbox_size: 3D边界框各维度的最小尺寸（米）
+            num_workers: 3D提升阶段的并发线程数（默认按CPU核数）
+            text_embedder: 候选匹配使用的文本嵌入器（默认哈希n-gram + 概念词表）
+            candidate_top_k: 嵌入检索返回的最大候选数
+            candidate_min_score: 嵌入检索的最小余弦相似度
+            verify_with_vlm: 多个候选时是否用VLM进行视觉验证
+            verify_max_images: 验证时合成图像的最大数量
+            verify_tiles_per_image: 每张合成图像包含的关键帧数
         """
         self.vlm_client = vlm_client
         self.object_detector = object_detector
+        self.bbox_sample_size = bbox_sample_size
+        self.bbox_crop_ratio = bbox_crop_ratio
+        self.bbox_percentile = bbox_percentile
+        self.min_bbox_size = min_bbox_size
+        self.num_workers = num_workers or min(32, os.cpu_count() or 1)
+        self.text_embedder = text_embedder or TextEmbedder()
+        self.candidate_top_k = candidate_top_k
+        self.candidate_min_score = candidate_min_score
+        self.verify_with_vlm = verify_with_vlm
+        self.verify_max_images = verify_max_images
+        self.verify_tiles_per_image = verify_tiles_per_image
+        
+        # 哈希嵌入下检查概念词表：不同概念的词不应相互达到候选匹配阈值
+        if not self.text_embedder.model_name:
+            for term_a, term_b, score in self.text_embedder.find_concept_collisions(candidate_min_score):
+                logger.warning(f"概念词表冲突: '{term_a}' 与 '{term_b}' 相似度 {score:.2f} >= {candidate_min_score}")
     
     def build_olt_from_keyframes(self,
                                  keyframes: List[Dict],
-                                 pointcloud: PointCloud3D) -> ObjectLookupTable:
+                                 pointcloud: PointCloud3D,
+                                 detections: Optional[List[List[Dict]]] = None) -> ObjectLookupTable:
         """
         从关键帧构建Object Lookup Table
         
+        流水线分三个阶段：
+        1. 批量2D检测（所有关键帧分块送入YOLO）
+        2. 线程池中按帧并行进行向量化3D提升
+        3. 一次性插入OLT并合并重复物体
+        
         Args:
             keyframes: 关键帧列表
             pointcloud: 3D点云
+            detections: 预先计算好的逐帧检测结果（可选，省略时执行阶段1）
             
         Returns:
             填充好的OLT
         """
         logger.info("构建Object Lookup Table...")
         
-        olt = ObjectLookupTable()
+        # 阶段1: 批量检测
+        if detections is None:
+            detections = self.detect_keyframes(keyframes)
         
-        # 检测所有帧中的物体
-        for kf in keyframes:
-            frame = kf["frame"]
-            frame_id = kf["frame_id"]
-            
-            detections = self.object_detector.detect(frame)
-            logger.info(f"  帧 {frame_id}: 检测到 {len(detections)} 个物体")
+        # 阶段2: 并行3D提升
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            objects_per_frame = list(executor.map(
+                lambda args: self.lift_detections(args[0], args[1], pointcloud),
+                zip(keyframes, detections)
+            ))
+        
+        # 阶段3: 插入OLT
+        return self.build_olt_from_objects(
+            [obj for frame_objects in objects_per_frame for obj in frame_objects]
+        )
+    
+    def detect_keyframes(self, keyframes: List[Dict]) -> List[List[Dict]]:
+        """批量检测所有关键帧中的2D物体"""
+        detections = self.object_detector.detect_batch([kf["frame"] for kf in keyframes])
+        
+        for kf, frame_detections in zip(keyframes, detections):
+            logger.info(f"  帧 {kf['frame_id']}: 检测到 {len(frame_detections)} 个物体")
+        
+        return detections
+    
+    def lift_detections(self,
+                        keyframe: Dict,
+                        detections: List[Dict],
+                        pointcloud: Optional[PointCloud3D] = None) -> List[Object3D]:
+        """
+        将一帧的2D检测提升为3D物体
+        
+        关键帧带有深度图时不依赖点云，可以在重建完成前进行。
+        
+        Args:
+            keyframe: 关键帧
+            detections: 该帧的2D检测结果
+            pointcloud: 3D点云（关键帧没有深度图时回退使用）
             
-            # 为每个检测创建3D物体
-            for det in detections:
-                # 估计3D位置
-                bbox_3d, center_3d = self._estimate_3d_bbox(
-                    det, frame, pointcloud
-                )
-                
-                # 创建物体对象
-                obj = Object3D(
-                    object_id=-1,  # 将由OLT分配
-                    class_name=det["class_name"],
-                    confidence=det["confidence"],
-                    bbox_2d=det["bbox_norm"],
-                    bbox_3d=bbox_3d,
-                    center_3d=center_3d,
-                    frame_ids=[frame_id],
-                    attributes={"detection": det}
-                )
-                
-                olt.add_object(obj)
+        Returns:
+            尚未插入OLT的3D物体列表
+        """
+        frame_id = keyframe["frame_id"]
+        bboxes = self._estimate_3d_bboxes(detections, keyframe, pointcloud)
+        
+        objects = []
+        for det, (bbox_3d, center_3d) in zip(detections, bboxes):
+            objects.append(Object3D(
+                object_id=-1,  # 将由OLT分配
+                class_name=det["class_name"],
+                confidence=det["confidence"],
+                bbox_2d=det["bbox_norm"],
+                bbox_3d=bbox_3d,
+                center_3d=center_3d,
+                frame_ids=[frame_id],
+                attributes={"detection": det, "frame_id": frame_id}
+            ))
+        
+        return objects
+    
+    def build_olt_from_objects(self, objects: List[Object3D]) -> ObjectLookupTable:
+        """将3D物体一次性插入OLT并合并重复物体"""
+        olt = ObjectLookupTable()
+        
+        for obj in objects:
+            olt.add_object(obj)
         
         # 合并重复物体（同一物体在多帧中出现）
         olt.merge_duplicate_objects(iou_threshold=0.5, distance_threshold=0.5)
@@ -84,17 +171,114 @@ class FusionAlignment:
         
         return olt
     
+    def _estimate_3d_bboxes(self,
+                            detections: List[Dict],
+                            keyframe: Dict,
+                            pointcloud: Optional[PointCloud3D]) -> List[Tuple[List[float], List[float]]]:
+        """
+        批量估计同一帧中所有检测的3D边界框
+        
+        在每个2D框的中心区域按 S×S 网格采样深度像素，用分位数得到鲁棒的
+        深度范围，再按针孔模型把2D框反投影到该深度。全部检测一次向量化计算，
+        代价与点云规模无关。
+        
+        Args:
+            detections: 同一帧的2D检测结果
+            keyframe: 关键帧（包含 depth_map / camera_intrinsics / frame_offset）
+            pointcloud: 3D点云（关键帧没有深度图时回退使用）
+        
+        Returns:
+            每个检测对应的 (bbox_3d, center_3d)
+        """
+        if not detections:
+            return []
+        
+        depth_map = keyframe.get("depth_map")
+        if depth_map is None:
+            # 没有逐帧深度（如SfM重建），回退到基于点云的粗略估计
+            avg_depth = self._mean_pointcloud_depth(pointcloud)
+            return [
+                self._estimate_3d_bbox(det, keyframe["frame"], pointcloud, avg_depth)
+                for det in detections
+            ]
+        
+        h, w = depth_map.shape
+        intrinsics = keyframe.get("camera_intrinsics")
+        if intrinsics is None:
+            intrinsics = Reconstruction3D.default_intrinsics(w, h)
+        fx, fy = intrinsics[0, 0], intrinsics[1, 1]
+        cx, cy = intrinsics[0, 2], intrinsics[1, 2]
+        offset = np.asarray(keyframe.get("frame_offset", np.zeros(3)), dtype=np.float64)
+        
+        # 2D框（像素坐标）: (D, 4)
+        boxes = np.clip(np.asarray([det["bbox_norm"] for det in detections], dtype=np.float64), 0.0, 1.0)
+        boxes = boxes * np.array([w, h, w, h])
+        box_centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        box_sizes = boxes[:, 2:] - boxes[:, :2]
+        
+        # 中心裁剪区域内的 S×S 采样网格: u (D, S), v (D, S)
+        grid = (np.arange(self.bbox_sample_size) + 0.5) / self.bbox_sample_size * 2 - 1
+        half = box_sizes / 2 * self.bbox_crop_ratio
+        u = np.clip((box_centers[:, 0:1] + half[:, 0:1] * grid).astype(np.int64), 0, w - 1)
+        v = np.clip((box_centers[:, 1:2] + half[:, 1:2] * grid).astype(np.int64), 0, h - 1)
+        
+        # 采样深度: (D, S*S)，无效深度置为NaN
+        z = depth_map[v[:, :, None], u[:, None, :]].reshape(len(detections), -1).astype(np.float64)
+        z[(z <= 0) | (z >= 10.0)] = np.nan
+        has_depth = ~np.all(np.isnan(z), axis=1)
+        
+        results: List[Optional[Tuple[List[float], List[float]]]] = [None] * len(detections)
+        
+        if has_depth.any():
+            z_valid = z[has_depth]
+            z_near = np.nanpercentile(z_valid, self.bbox_percentile, axis=1)
+            z_far = np.nanpercentile(z_valid, 100 - self.bbox_percentile, axis=1)
+            z_center = (z_near + z_far) / 2
+            
+            # 按针孔模型反投影2D框中心和尺寸
+            x_3d = (box_centers[has_depth, 0] - cx) * z_center / fx + offset[0]
+            y_3d = (box_centers[has_depth, 1] - cy) * z_center / fy + offset[1]
+            z_3d = z_center + offset[2]
+            
+            width_3d = np.maximum(box_sizes[has_depth, 0] * z_center / fx, self.min_bbox_size)
+            height_3d = np.maximum(box_sizes[has_depth, 1] * z_center / fy, self.min_bbox_size)
+            depth_3d = np.maximum(z_far - z_near, self.min_bbox_size)
+            
+            for i, det_idx in enumerate(np.flatnonzero(has_depth)):
+                center_3d = [float(x_3d[i]), float(y_3d[i]), float(z_3d[i])]
+                bbox_3d = center_3d + [float(width_3d[i]), float(height_3d[i]), float(depth_3d[i])]
+                results[det_idx] = (bbox_3d, center_3d)
+        
+        # 框内没有有效深度的检测回退到粗略估计（使用该帧的平均深度）
+        if not has_depth.all():
+            valid_depth = depth_map[(depth_map > 0) & (depth_map < 10.0)]
+            avg_depth = float(valid_depth.mean()) + offset[2] if valid_depth.size else None
+            for det_idx in np.flatnonzero(~has_depth):
+                results[det_idx] = self._estimate_3d_bbox(
+                    detections[det_idx], keyframe["frame"], pointcloud, avg_depth
+                )
+        
+        return results
+    
+    def _mean_pointcloud_depth(self, pointcloud: Optional[PointCloud3D]) -> Optional[float]:
+        """点云平均深度（每帧只计算一次，供回退估计使用）"""
+        if pointcloud is None or pointcloud.points.shape[0] == 0:
+            return None
+        return float(np.mean(pointcloud.points[:, 2]))
+    
     def _estimate_3d_bbox(self,
                          detection: Dict,
                          image: np.ndarray,
-                         pointcloud: PointCloud3D) -> Tuple[List[float], List[float]]:
+                         pointcloud: Optional[PointCloud3D],
+                         avg_depth: Optional[float] = None) -> Tuple[List[float], List[float]]:
         """
-        从2D检测和点云估计3D边界框
+        从2D检测和点云粗略估计3D边界框（没有逐帧深度时的回退方法）
         
         Args:
             detection: 2D检测结果
             image: 图像
             pointcloud: 3D点云
+            avg_depth: 预先计算的点云平均深度（可选）
             
         Returns:
             (bbox_3d, center_3d)
@@ -111,7 +295,7 @@ class FusionAlignment:
         # 将2D框投影到点云（简化版本）
         # 实际应用中需要准确的相机-点云对应关系
         
-        if pointcloud.points.shape[0] == 0:
+        if avg_depth is None and (pointcloud is None or pointcloud.points.shape[0] == 0):
             # 如果没有点云，使用默认值
             logger.warning("点云为空，使用默认3D边界框")
             center_3d = [0.0, 0.0, 1.0]
@@ -119,7 +303,8 @@ class FusionAlignment:
             return bbox_3d, center_3d
         
         # 估计深度（使用点云的平均深度）
-        avg_depth = np.mean(pointcloud.points[:, 2])
+        if avg_depth is None:
+            avg_depth = np.mean(pointcloud.points[:, 2])
         
         # 简化：假设物体在视野中心附近
         cx_norm = (x1_norm + x2_norm) / 2
@@ -148,7 +333,8 @@ class FusionAlignment:
     def ground_target_object(self,
                             query: str,
                             keyframes: List[Dict],
-                            olt: ObjectLookupTable) -> Optional[Object3D]:
+                            olt: ObjectLookupTable,
+                            query_analysis: Optional[QueryAnalysis] = None) -> Optional[Object3D]:
         """
         使用VLM定位目标物体
         
@@ -156,6 +342,7 @@ class FusionAlignment:
             query: 自然语言查询
             keyframes: 关键帧列表
             olt: Object Lookup Table
+            query_analysis: 已解析的查询（可选，省略时在此解析）
             
         Returns:
             定位到的目标物体，如果失败返回None
@@ -163,12 +350,13 @@ class FusionAlignment:
         logger.info(f"开始定位目标: '{query}'")
         
         # 步骤1: 解析查询
-        query_components = self.vlm_client.extract_query_components(query)
-        logger.info(f"查询解析: {query_components}")
+        if query_analysis is None:
+            query_analysis = self.vlm_client.analyze_query(query)
+            logger.info(f"查询解析: {query_analysis.components}")
         
-        target_name = query_components.get("target", "").strip()
-        anchor_name = query_components.get("anchor", "").strip()
-        relation = query_components.get("relation")
+        target_name = query_analysis.target
+        anchor_name = query_analysis.anchor
+        relation = query_analysis.relation
         
         if not target_name:
             logger.error("无法从查询中提取目标物体")
@@ -199,7 +387,7 @@ class FusionAlignment:
             return target_candidates[0]
         
         best_candidate = self._verify_with_vlm(
-            query, target_candidates, keyframes
+            query, target_candidates, keyframes, olt
         )
         
         if best_candidate:
@@ -219,34 +407,21 @@ class FusionAlignment:
         if candidates:
             return candidates
         
-        # 模糊匹配（包含关系）
-        target_lower = target_name.lower()
-        fuzzy_candidates = []
-        
-        for obj in olt.objects:
-            if target_lower in obj.class_name.lower() or obj.class_name.lower() in target_lower:
-                fuzzy_candidates.append(obj)
+        # 嵌入检索（同义词、复数、开放词汇）
+        olt.build_embedding_index(self.text_embedder)
+        matches = olt.search_by_embedding(
+            self.text_embedder.embed_one(target_name),
+            top_k=self.candidate_top_k,
+            min_score=self.candidate_min_score
+        )
         
-        # 同义词匹配（简化版）
-        if not fuzzy_candidates:
-            synonyms = self._get_synonyms(target_name)
-            for synonym in synonyms:
-                fuzzy_candidates.extend(olt.get_objects_by_class(synonym))
+        if matches:
+            logger.debug(
+                f"嵌入匹配 '{target_name}': "
+                + ", ".join(f"{obj.class_name}({score:.2f})" for obj, score in matches)
+            )
         
-        return fuzzy_candidates
-    
-    def _get_synonyms(self, class_name: str) -> List[str]:
-        """获取类别名称的同义词"""
-        # 简化的同义词词典
-        synonym_dict = {
-            "laptop": ["computer", "notebook"],
-            "phone": ["mobile", "cellphone", "smartphone"],
-            "bottle": ["container"],
-            "cup": ["mug", "glass"],
-            "person": ["people", "man", "woman"],
-        }
-        
-        return synonym_dict.get(class_name.lower(), [])
+        return [obj for obj, _ in matches]
     
     def _filter_by_spatial_relation(self,
                                     candidates: List[Object3D],
@@ -254,6 +429,11 @@ class FusionAlignment:
                                     relation: str,
                                     olt: ObjectLookupTable) -> List[Object3D]:
         """根据空间关系过滤候选物体"""
+        if relation not in olt.SPATIAL_RELATIONS:
+            # inside/behind/front 等关系无法按坐标判断，保留所有候选交给VLM验证
+            logger.warning(f"不支持按坐标判断空间关系 '{relation}'，跳过空间关系过滤")
+            return candidates
+        
         # 查找锚点物体
         anchor_objects = self._find_candidate_objects(anchor_name, olt)
         
@@ -282,26 +462,119 @@ class FusionAlignment:
     def _verify_with_vlm(self,
                         query: str,
                         candidates: List[Object3D],
-                        keyframes: List[Dict]) -> Optional[Object3D]:
+                        keyframes: List[Dict],
+                        olt: ObjectLookupTable) -> Optional[Object3D]:
         """
         使用VLM验证候选物体（选择最佳匹配）
         
-        简化版本：根据置信度和出现次数选择
-        完整版本应该使用VLM对每个候选进行视觉验证
+        所有候选按编号标注到少量合成图像上，只调用一次VLM回答编号，
+        调用次数与候选数量无关。VLM失败或回答无法解析时回退到置信度最高的候选。
         """
-        # 选择置信度最高的候选
-        best_candidate = max(candidates, key=lambda c: c.confidence)
+        # 回退：选择置信度最高的候选
+        fallback = max(candidates, key=lambda c: c.confidence)
         
-        # TODO: 使用VLM进行视觉验证
-        # 这里应该生成带有标注的图像，然后让VLM判断哪个是正确的
+        if not self.verify_with_vlm:
+            return fallback
         
-        return best_candidate
+        try:
+            images, shown_ids = self._render_candidate_composites(candidates, keyframes, olt)
+            if not images:
+                return fallback
+            
+            content = [{"type": "image", "image": img} for img in images]
+            content.append({
+                "type": "text",
+                "text": f"""图像中用方框和 "[编号] 类别" 标签标出了候选物体。
+查询: "{query}"
+候选编号: {shown_ids}
+
+哪个编号的物体最符合查询？以JSON格式返回，例如 {{"id": {shown_ids[0]}}}，不要其他文字。"""
+            })
+            
+            # 约束解码：只允许输出 {"id": 候选编号}
+            answer, response = self.vlm_client.generate_json(
+                [{"role": "user", "content": content}],
+                grounding_answer_schema(shown_ids),
+                max_tokens=16,
+                temperature=0.0
+            )
+            chosen_id = answer.get("id") if answer else None
+            if chosen_id not in shown_ids:
+                chosen_id = parse_candidate_id(response, shown_ids)
+        except Exception as e:
+            logger.warning(f"VLM验证失败，使用置信度最高的候选: {e}")
+            return fallback
+        
+        if chosen_id is None:
+            logger.warning(f"无法解析VLM验证回答: {response!r}")
+            return fallback
+        
+        logger.info(f"VLM选择候选 ID: {chosen_id}")
+        return next(c for c in candidates if c.object_id == chosen_id)
+    
+    def _render_candidate_composites(self,
+                                     candidates: List[Object3D],
+                                     keyframes: List[Dict],
+                                     olt: ObjectLookupTable) -> Tuple[List[Image.Image], List[int]]:
+        """
+        将候选物体标注到关键帧上，并拼接为少量合成图像
+        
+        Returns:
+            (合成图像列表(RGB), 图像中出现的候选ID列表)
+        """
+        frames_by_id = {kf["frame_id"]: kf["frame"] for kf in keyframes}
+        
+        # 按候选的来源帧分组（bbox_2d属于该帧）
+        groups: Dict[int, List[int]] = {}
+        for obj in candidates:
+            frame_id = (obj.attributes or {}).get("frame_id")
+            if frame_id is None and obj.frame_ids:
+                frame_id = obj.frame_ids[0]
+            if frame_id in frames_by_id:
+                groups.setdefault(frame_id, []).append(obj.object_id)
+        
+        # 候选多的帧优先，受合成图像总容量限制
+        capacity = self.verify_max_images * self.verify_tiles_per_image
+        selected = sorted(groups.items(), key=lambda item: len(item[1]), reverse=True)[:capacity]
+        
+        if len(selected) < len(groups):
+            logger.warning(f"候选分布在 {len(groups)} 帧中，仅展示其中 {len(selected)} 帧")
+        
+        tiles = [
+            self.create_annotated_image(frames_by_id[frame_id], olt, frame_id, object_ids=ids)
+            for frame_id, ids in selected
+        ]
+        shown_ids = sorted(obj_id for _, ids in selected for obj_id in ids)
+        
+        images = []
+        for start in range(0, len(tiles), self.verify_tiles_per_image):
+            composite = self._tile_images(tiles[start:start + self.verify_tiles_per_image])
+            images.append(Image.fromarray(cv2.cvtColor(composite, cv2.COLOR_BGR2RGB)))
+        
+        return images, shown_ids
+    
+    def _tile_images(self, tiles: List[np.ndarray], tile_width: int = 640) -> np.ndarray:
+        """将多张图像按网格拼接（统一缩放到相同尺寸）"""
+        h, w = tiles[0].shape[:2]
+        tile_height = int(round(h * tile_width / w))
+        
+        cols = 1 if len(tiles) == 1 else 2
+        rows = math.ceil(len(tiles) / cols)
+        canvas = np.zeros((rows * tile_height, cols * tile_width, 3), dtype=np.uint8)
+        
+        for idx, tile in enumerate(tiles):
+            r, c = divmod(idx, cols)
+            canvas[r * tile_height:(r + 1) * tile_height, c * tile_width:(c + 1) * tile_width] = \
+                cv2.resize(tile, (tile_width, tile_height), interpolation=cv2.INTER_AREA)
+        
+        return canvas
     
     def create_annotated_image(self,
                               image: np.ndarray,
                               olt: ObjectLookupTable,
                               frame_id: int,
-                              highlight_id: Optional[int] = None) -> np.ndarray:
+                              highlight_id: Optional[int] = None,
+                              object_ids: Optional[List[int]] = None) -> np.ndarray:
         """
         创建带标注的图像（用于VLM输入）
         
@@ -310,6 +583,7 @@ class FusionAlignment:
             olt: Object Lookup Table
             frame_id: 帧ID
             highlight_id: 要高亮的物体ID
+            object_ids: 只标注这些物体（可选，默认标注该帧所有物体）
             
         Returns:
             标注后的图像
@@ -318,6 +592,8 @@ class FusionAlignment:
         
         # 获取该帧中的所有物体
         objects_in_frame = olt.get_objects_in_frame(frame_id)
+        if object_ids is not None:
+            objects_in_frame = [obj for obj in objects_in_frame if obj.object_id in object_ids]
         
         h, w = image.shape[:2]
         
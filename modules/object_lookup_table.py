@@ -4,13 +4,15 @@ Object Lookup Table (OLT)
 """
 
 import numpy as np
-import pandas as pd
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, TYPE_CHECKING
 from dataclasses import dataclass, asdict
 import logging
 from pathlib import Path
 import json
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 logger = logging.getLogger(__name__)
 
 
@@ -45,10 +47,14 @@ class Object3D:
 class ObjectLookupTable:
     """物体查找表：管理所有检测到的物体"""
     
+    # _check_spatial_relation 能判断的空间关系（其余关系无法按坐标判断）
+    SPATIAL_RELATIONS = ("on", "above", "below", "left", "right", "near")
+    
     def __init__(self):
         self.objects: List[Object3D] = []
         self.next_id = 0
         self._spatial_index = None  # 用于快速空间查询的索引
+        self._embedding_matrix = None  # (N, D) 物体文本嵌入矩阵，用于向量化检索
     
     def add_object(self, obj: Object3D) -> int:
         """
@@ -65,6 +71,7 @@ class ObjectLookupTable:
             self.next_id += 1
         
         self.objects.append(obj)
+        self._embedding_matrix = None
         logger.debug(f"添加物体: ID={obj.object_id}, 类别={obj.class_name}")
         
         return obj.object_id
@@ -85,6 +92,67 @@ class ObjectLookupTable:
         return [obj for obj in self.objects 
                 if obj.frame_ids and frame_id in obj.frame_ids]
     
+    def build_embedding_index(self, embedder) -> np.ndarray:
+        """
+        构建物体文本嵌入索引（类别名称 + 字符串属性）
+        
+        Args:
+            embedder: 文本嵌入器（utils.text_embedder.TextEmbedder）
+        
+        Returns:
+            (N, D) 嵌入矩阵
+        """
+        if self._embedding_matrix is not None and len(self._embedding_matrix) == len(self.objects):
+            return self._embedding_matrix
+        
+        missing = [obj for obj in self.objects if obj.embedding is None]
+        if missing:
+            texts = []
+            for obj in missing:
+                attribute_words = [
+                    v for v in (obj.attributes or {}).values() if isinstance(v, str)
+                ]
+                texts.append(" ".join(attribute_words + [obj.class_name]))
+            
+            for obj, vec in zip(missing, embedder.embed(texts)):
+                obj.embedding = vec
+        
+        if self.objects:
+            self._embedding_matrix = np.stack([obj.embedding for obj in self.objects])
+        else:
+            self._embedding_matrix = np.zeros((0, embedder.dim), dtype=np.float32)
+        
+        return self._embedding_matrix
+    
+    def search_by_embedding(self,
+                            query_embedding: np.ndarray,
+                            top_k: int = 20,
+                            min_score: float = 0.5) -> List[Tuple[Object3D, float]]:
+        """
+        余弦相似度top-k检索（需先调用 build_embedding_index）
+        
+        Args:
+            query_embedding: 归一化的查询嵌入 (D,)
+            top_k: 返回的最大数量
+            min_score: 最小相似度
+        
+        Returns:
+            [(物体, 相似度)]，按相似度降序
+        """
+        if self._embedding_matrix is None or len(self._embedding_matrix) == 0:
+            return []
+        
+        scores = self._embedding_matrix @ query_embedding
+        
+        k = min(top_k, len(scores))
+        top_indices = np.argpartition(-scores, k - 1)[:k]
+        top_indices = top_indices[np.argsort(-scores[top_indices])]
+        
+        return [
+            (self.objects[i], float(scores[i]))
+            for i in top_indices if scores[i] >= min_score
+        ]
+    
     def find_nearest_object(self, 
                            center_3d: np.ndarray,
                            class_name: Optional[str] = None,
@@ -241,6 +309,7 @@ class ObjectLookupTable:
         
         logger.info(f"合并前: {len(self.objects)} 个物体, 合并后: {len(merged_objects)} 个物体")
         self.objects = merged_objects
+        self._embedding_matrix = None
     
     def _is_duplicate(self, 
                      obj1: Object3D, 
@@ -326,8 +395,10 @@ class ObjectLookupTable:
             attributes=base_obj.attributes
         )
     
-    def to_dataframe(self) -> pd.DataFrame:
+    def to_dataframe(self) -> "pd.DataFrame":
         """转换为Pandas DataFrame"""
+        import pandas as pd
+        
         data = []
         for obj in self.objects:
             row = {
@@ -365,6 +436,7 @@ class ObjectLookupTable:
         
         self.objects = [Object3D.from_dict(obj_dict) for obj_dict in data['objects']]
         self.next_id = data['next_id']
+        self._embedding_matrix = None
         
         logger.info(f"从 {input_path} 加载了 {len(self.objects)} 个物体")
     
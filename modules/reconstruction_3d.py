@@ -4,10 +4,10 @@
 """
 
 import cv2
+import threading
 import numpy as np
-import open3d as o3d
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Callable
 import logging
 from dataclasses import dataclass
 
@@ -29,54 +29,64 @@ class Reconstruction3D:
     def __init__(self,
                  depth_model_type: str = "MiDaS_small",
                  voxel_size: float = 0.05,
-                 use_gpu: bool = True):
+                 use_gpu: bool = True,
+                 depth_scale: float = 5.0):
         """
         Args:
             depth_model_type: 深度估计模型类型
             voxel_size: 体素下采样大小
             use_gpu: 是否使用GPU
+            depth_scale: 归一化深度到真实尺度的缩放系数（米）
         """
         self.depth_model_type = depth_model_type
         self.voxel_size = voxel_size
         self.use_gpu = use_gpu
+        self.depth_scale = depth_scale
         self.depth_model = None
         self.depth_transform = None
+        self._init_lock = threading.Lock()
         
     def initialize_depth_model(self):
         """初始化MiDaS深度估计模型"""
         if self.depth_model is not None:
             return
         
-        try:
-            import torch
-            logger.info(f"加载深度估计模型: {self.depth_model_type}")
-            
-            # 加载MiDaS模型
-            if self.depth_model_type == "MiDaS_small":
-                self.depth_model = torch.hub.load("intel-isl/MiDaS", "MiDaS_small")
-            elif self.depth_model_type == "DPT_Large":
-                self.depth_model = torch.hub.load("intel-isl/MiDaS", "DPT_Large")
-            else:
-                self.depth_model = torch.hub.load("intel-isl/MiDaS", "DPT_Hybrid")
-            
-            # 加载transforms
-            midas_transforms = torch.hub.load("intel-isl/MiDaS", "transforms")
-            
-            if self.depth_model_type == "MiDaS_small":
-                self.depth_transform = midas_transforms.small_transform
-            else:
-                self.depth_transform = midas_transforms.dpt_transform
+        # 可能被后台预加载线程和首次使用同时调用
+        with self._init_lock:
+            if self.depth_model is not None:
+                return
             
-            if self.use_gpu and torch.cuda.is_available():
-                self.depth_model = self.depth_model.to("cuda")
-                logger.info("深度模型已移至GPU")
+            try:
+                import torch
+                logger.info(f"加载深度估计模型: {self.depth_model_type}")
+                
+                # 加载MiDaS模型（完全初始化后再赋值，避免其他线程看到未就绪的模型）
+                if self.depth_model_type == "MiDaS_small":
+                    depth_model = torch.hub.load("intel-isl/MiDaS", "MiDaS_small")
+                elif self.depth_model_type == "DPT_Large":
+                    depth_model = torch.hub.load("intel-isl/MiDaS", "DPT_Large")
+                else:
+                    depth_model = torch.hub.load("intel-isl/MiDaS", "DPT_Hybrid")
+                
+                # 加载transforms
+                midas_transforms = torch.hub.load("intel-isl/MiDaS", "transforms")
+                
+                if self.depth_model_type == "MiDaS_small":
+                    self.depth_transform = midas_transforms.small_transform
+                else:
+                    self.depth_transform = midas_transforms.dpt_transform
+                
+                if self.use_gpu and torch.cuda.is_available():
+                    depth_model = depth_model.to("cuda")
+                    logger.info("深度模型已移至GPU")
+                
+                depth_model.eval()
+                self.depth_model = depth_model
+                logger.info("深度估计模型加载完成")
             
-            self.depth_model.eval()
-            logger.info("深度估计模型加载完成")
-            
-        except Exception as e:
-            logger.error(f"深度模型加载失败: {e}")
-            raise
+            except Exception as e:
+                logger.error(f"深度模型加载失败: {e}")
+                raise
     
     def estimate_depth(self, image: np.ndarray) -> np.ndarray:
         """
@@ -138,13 +148,7 @@ class Reconstruction3D:
         
         # 如果没有提供相机内参，使用估计值
         if camera_intrinsics is None:
-            focal_length = w * 1.2  # 经验值
-            cx, cy = w / 2, h / 2
-            camera_intrinsics = np.array([
-                [focal_length, 0, cx],
-                [0, focal_length, cy],
-                [0, 0, 1]
-            ])
+            camera_intrinsics = self.default_intrinsics(w, h)
         
         # 生成像素网格
         u, v = np.meshgrid(np.arange(w), np.arange(h))
@@ -153,7 +157,7 @@ class Reconstruction3D:
         depth = depth_map.flatten()
         
         # 深度缩放（将归一化深度转换为真实尺度，这里使用经验值）
-        depth = depth * 5.0  # 假设场景深度在5米内
+        depth = depth * self.depth_scale  # 假设场景深度在5米内
         
         # 反投影到3D
         fx, fy = camera_intrinsics[0, 0], camera_intrinsics[1, 1]
@@ -185,15 +189,28 @@ class Reconstruction3D:
             metadata={"camera_intrinsics": camera_intrinsics}
         )
     
+    @staticmethod
+    def default_intrinsics(width: int, height: int) -> np.ndarray:
+        """估计的相机内参（无标定信息时使用）"""
+        focal_length = width * 1.2  # 经验值
+        cx, cy = width / 2, height / 2
+        return np.array([
+            [focal_length, 0, cx],
+            [0, focal_length, cy],
+            [0, 0, 1]
+        ])
+    
     def reconstruct_from_keyframes(self,
                                    keyframes: List[Dict],
-                                   method: str = "depth") -> PointCloud3D:
+                                   method: str = "depth",
+                                   on_frame_ready: Optional[Callable[[Dict], None]] = None) -> PointCloud3D:
         """
         从关键帧重建3D场景
         
         Args:
             keyframes: 关键帧列表
             method: 重建方法 ["depth", "sfm"]
+            on_frame_ready: 单帧深度写入关键帧后的回调（可选，用于流水线调度）
             
         Returns:
             合并的点云
@@ -201,13 +218,15 @@ class Reconstruction3D:
         logger.info(f"开始3D重建，方法: {method}")
         
         if method == "depth":
-            return self._reconstruct_from_depth(keyframes)
+            return self._reconstruct_from_depth(keyframes, on_frame_ready)
         elif method == "sfm":
-            return self._reconstruct_from_sfm(keyframes)
+            return self._reconstruct_from_sfm(keyframes, on_frame_ready)
         else:
             raise ValueError(f"不支持的重建方法: {method}")
     
-    def _reconstruct_from_depth(self, keyframes: List[Dict]) -> PointCloud3D:
+    def _reconstruct_from_depth(self,
+                                keyframes: List[Dict],
+                                on_frame_ready: Optional[Callable[[Dict], None]] = None) -> PointCloud3D:
         """使用深度估计进行重建"""
         all_points = []
         all_colors = []
@@ -227,6 +246,14 @@ class Reconstruction3D:
             offset = self._compute_frame_offset(idx, len(keyframes))
             pcd.points += offset
             
+            # 保留逐帧深度和相机参数，供检测框的3D提升使用
+            kf["depth_map"] = (depth_map * self.depth_scale).astype(np.float32)
+            kf["camera_intrinsics"] = pcd.metadata["camera_intrinsics"]
+            kf["frame_offset"] = offset
+            
+            if on_frame_ready is not None:
+                on_frame_ready(kf)
+            
             all_points.append(pcd.points)
             if pcd.colors is not None:
                 all_colors.append(pcd.colors)
@@ -247,7 +274,9 @@ class Reconstruction3D:
         
         return merged_pcd
     
-    def _reconstruct_from_sfm(self, keyframes: List[Dict]) -> PointCloud3D:
+    def _reconstruct_from_sfm(self,
+                              keyframes: List[Dict],
+                              on_frame_ready: Optional[Callable[[Dict], None]] = None) -> PointCloud3D:
         """
         使用SfM（Structure from Motion）进行重建
         这是简化版本，实际应用建议使用COLMAP
@@ -260,10 +289,12 @@ class Reconstruction3D:
             return self._reconstruct_with_open3d_odometry(keyframes)
         except Exception as e:
             logger.warning(f"Open3D odometry失败，回退到深度方法: {e}")
-            return self._reconstruct_from_depth(keyframes)
+            return self._reconstruct_from_depth(keyframes, on_frame_ready)
     
     def _reconstruct_with_open3d_odometry(self, keyframes: List[Dict]) -> PointCloud3D:
         """使用Open3D的RGBD Odometry"""
+        import open3d as o3d
+        
         # 这是一个简化的实现
         # 实际使用时需要更复杂的特征匹配和位姿估计
         
@@ -342,6 +373,8 @@ class Reconstruction3D:
     
     def _downsample_pointcloud(self, pcd: PointCloud3D) -> PointCloud3D:
         """下采样点云"""
+        import open3d as o3d
+        
         # 转换为Open3D格式
         o3d_pcd = o3d.geometry.PointCloud()
         o3d_pcd.points = o3d.utility.Vector3dVector(pcd.points)
@@ -363,6 +396,8 @@ class Reconstruction3D:
     
     def save_pointcloud(self, pcd: PointCloud3D, output_path: str):
         """保存点云为PLY文件"""
+        import open3d as o3d
+        
         o3d_pcd = o3d.geometry.PointCloud()
         o3d_pcd.points = o3d.utility.Vector3dVector(pcd.points)
         
@@ -377,6 +412,8 @@ class Reconstruction3D:
     
     def load_pointcloud(self, input_path: str) -> PointCloud3D:
         """加载PLY点云文件"""
+        import open3d as o3d
+        
         o3d_pcd = o3d.io.read_point_cloud(str(input_path))
         
         points = np.asarray(o3d_pcd.points)
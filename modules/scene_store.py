@@ -0,0 +1,365 @@
+"""
+Scene Store - 场景构建结果的持久化
+把与查询无关的场景（关键帧、点云、OLT、2D检测结果）按 输入内容哈希 + 场景配置哈希 保存，
+之后对同一输入的查询可以跳过关键帧提取、3D重建和物体检测，直接进入定位步骤
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+import numpy as np
+import cv2
+import logging
+
+from modules.reconstruction_3d import PointCloud3D
+from modules.object_lookup_table import ObjectLookupTable
+
+logger = logging.getLogger(__name__)
+
+
+# 存储格式版本：格式变化时旧的场景目录自动失效
+SCENE_FORMAT_VERSION = 1
+
+# 影响场景构建结果的配置项（None表示整节）；只影响定位的配置项（候选匹配、VLM验证、
+# 空间关系阈值等）和只影响速度的配置项（批大小、并发）不参与哈希
+SCENE_CONFIG_KEYS = {
+    'reconstruction': ('keyframe_count', 'depth_model', 'method', 'voxel_size', 'min_confidence'),
+    'detection': ('yolo_model', 'conf_threshold', 'iou_threshold'),
+    'perspective': None,
+    'fusion': ('merge_iou_threshold', 'merge_distance_threshold',
+               'bbox_sample_size', 'bbox_crop_ratio', 'bbox_percentile'),
+}
+
+# 关键帧中不保存的大数组（只在构建OLT时使用）
+_DROPPED_KEYFRAME_KEYS = ("frame", "depth_map")
+
+_MANIFEST = "manifest.json"
+
+
+@dataclass
+class SceneContext:
+    """已构建的场景（与查询无关，可被多个查询复用）"""
+    input_path: str
+    input_type: str
+    keyframes: List[Dict]
+    pointcloud: PointCloud3D
+    olt: ObjectLookupTable
+    build_time: float = 0.0  # 场景构建（或加载）耗时（秒）
+    detections: Optional[List[List[Dict]]] = None  # 逐帧2D检测结果
+    source: str = "built"  # 来源: built / cache
+
+
+def hash_input(input_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    计算输入内容哈希（视频文件内容，或图像文件夹中所有文件的相对路径和内容）
+    
+    Args:
+        input_path: 视频文件或图像文件夹
+        chunk_size: 读取块大小
+    
+    Returns:
+        十六进制哈希
+    """
+    path = Path(input_path)
+    digest = hashlib.blake2b(digest_size=16)
+    files = [path] if path.is_file() else sorted(p for p in path.rglob("*") if p.is_file())
+    
+    for file_path in files:
+        if file_path != path:
+            digest.update(str(file_path.relative_to(path)).encode("utf-8") + b"\0")
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    
+    return digest.hexdigest()
+
+
+def input_fingerprint(input_path: str) -> tuple:
+    """
+    输入的文件列表指纹：每个文件的 (相对路径, 大小, 修改时间)
+    
+    文件夹自身的修改时间只在增删文件时变化，原地重写其中的图像不会改变它
+    """
+    path = Path(input_path)
+    files = [path] if path.is_file() else sorted(p for p in path.rglob("*") if p.is_file())
+    
+    fingerprint = []
+    for file_path in files:
+        stat = file_path.stat()
+        fingerprint.append((str(file_path.relative_to(path)), stat.st_size, stat.st_mtime_ns))
+    return tuple(fingerprint)
+
+
+def hash_config(config: Dict) -> str:
+    """计算影响场景构建的配置项的哈希（见 SCENE_CONFIG_KEYS）"""
+    relevant = {}
+    for section, keys in SCENE_CONFIG_KEYS.items():
+        values = config.get(section) or {}
+        relevant[section] = dict(values) if keys is None else {k: values.get(k) for k in keys}
+    
+    data = json.dumps(relevant, sort_keys=True, default=str)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _to_jsonable(value: Any) -> Any:
+    """转换为可JSON序列化的结构（numpy数组带dtype标记，以便还原）"""
+    if isinstance(value, np.ndarray):
+        return {"__ndarray__": value.tolist(), "dtype": str(value.dtype)}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {k: _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(v) for v in value]
+    return value
+
+
+def _from_jsonable(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "__ndarray__" in value:
+            return np.array(value["__ndarray__"], dtype=value["dtype"])
+        return {k: _from_jsonable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_from_jsonable(v) for v in value]
+    return value
+
+
+class SceneStore:
+    """
+    场景构建结果的版本化存储
+    
+    每个场景保存在 root_dir/v{版本}/{输入哈希}-{配置哈希}/ 下：
+        manifest.json      元数据（版本、输入、构建耗时、统计）
+        keyframes/*.jpg    关键帧图像（JPEG）
+        keyframes.json     关键帧元数据（帧号、时间戳、相机内参等，不含深度图）
+        pointcloud.npz     点云（相对质心的float16坐标 + uint8颜色，压缩）
+        olt.json           Object Lookup Table（不含文本嵌入，定位时按当前嵌入器重新计算）
+        detections.json    逐帧2D检测结果
+    
+    先写入临时目录再重命名，并发写入同一场景时不会读到不完整的结果。
+    """
+    
+    def __init__(self, root_dir: str, jpeg_quality: int = 95):
+        """
+        Args:
+            root_dir: 存储根目录
+            jpeg_quality: 关键帧JPEG质量
+        """
+        self.root_dir = Path(root_dir).expanduser()
+        self.version_dir = self.root_dir / f"v{SCENE_FORMAT_VERSION}"
+        self.jpeg_quality = jpeg_quality
+        self._input_hashes: Dict[tuple, str] = {}  # (路径, 文件列表指纹) -> 内容哈希
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "saves": 0}
+    
+    def scene_key(self, input_path: str, config: Dict) -> str:
+        """
+        计算场景键（输入内容哈希 + 场景配置哈希）
+        
+        同一进程内，每个文件的大小和修改时间都未变的输入不重复计算内容哈希
+        （见 input_fingerprint；文件夹自身的修改时间不反映其中文件的原地重写）。
+        """
+        path = Path(input_path).resolve()
+        cache_key = (str(path), input_fingerprint(str(path)))
+        
+        with self._lock:
+            input_digest = self._input_hashes.get(cache_key)
+        
+        if input_digest is None:
+            start = time.time()
+            input_digest = hash_input(str(path))
+            logger.debug(f"输入哈希 {input_digest} (耗时: {time.time() - start:.2f}s)")
+            with self._lock:
+                self._input_hashes[cache_key] = input_digest
+        
+        return f"{input_digest}-{hash_config(config)}"
+    
+    def scene_dir(self, key: str) -> Path:
+        return self.version_dir / key
+    
+    @staticmethod
+    def is_scene_dir(path: str) -> bool:
+        """路径是否为保存的场景目录"""
+        return (Path(path) / _MANIFEST).is_file()
+    
+    def load(self, key: str) -> Optional[SceneContext]:
+        """
+        按场景键加载
+        
+        Returns:
+            SceneContext，不存在时返回None
+        """
+        scene_dir = self.scene_dir(key)
+        if not self.is_scene_dir(str(scene_dir)):
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        
+        try:
+            scene = self.load_dir(str(scene_dir))
+        except Exception as e:
+            logger.warning(f"场景缓存损坏，将重新构建: {scene_dir} ({e})")
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        
+        with self._lock:
+            self.stats["hits"] += 1
+        return scene
+    
+    @staticmethod
+    def load_dir(scene_dir: str) -> SceneContext:
+        """
+        从场景目录加载
+        
+        Args:
+            scene_dir: 场景目录（包含 manifest.json）
+        
+        Returns:
+            SceneContext
+        """
+        start = time.time()
+        scene_dir = Path(scene_dir)
+        
+        with open(scene_dir / _MANIFEST, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("version") != SCENE_FORMAT_VERSION:
+            raise ValueError(f"不支持的场景格式版本: {manifest.get('version')}")
+        
+        with open(scene_dir / "keyframes.json", 'r', encoding='utf-8') as f:
+            keyframes = _from_jsonable(json.load(f))
+        for i, kf in enumerate(keyframes):
+            frame = cv2.imread(str(scene_dir / "keyframes" / f"{i:04d}.jpg"))
+            if frame is None:
+                raise IOError(f"无法读取关键帧: {i}")
+            kf["frame"] = frame
+        
+        with np.load(scene_dir / "pointcloud.npz") as data:
+            points = data["origin"] + data["points"].astype(np.float64)
+            colors = data["colors"].astype(np.float32) / 255.0 if "colors" in data else None
+        pointcloud = PointCloud3D(
+            points=points,
+            colors=colors,
+            metadata=_from_jsonable(manifest.get("pointcloud_metadata"))
+        )
+        
+        olt = ObjectLookupTable()
+        olt.load(str(scene_dir / "olt.json"))
+        
+        detections = None
+        detections_path = scene_dir / "detections.json"
+        if detections_path.is_file():
+            with open(detections_path, 'r', encoding='utf-8') as f:
+                detections = json.load(f)
+        
+        load_time = time.time() - start
+        logger.info(
+            f"加载场景: {scene_dir.name} ({len(keyframes)} 帧, {len(points)} 点, "
+            f"{len(olt)} 物体, 耗时: {load_time:.2f}s)"
+        )
+        
+        return SceneContext(
+            input_path=manifest["input_path"],
+            input_type=manifest["input_type"],
+            keyframes=keyframes,
+            pointcloud=pointcloud,
+            olt=olt,
+            build_time=load_time,
+            detections=detections,
+            source="cache"
+        )
+    
+    def save(self, key: str, scene: SceneContext) -> Path:
+        """
+        保存场景
+        
+        Args:
+            key: 场景键（scene_key 的返回值）
+            scene: 构建好的场景
+        
+        Returns:
+            场景目录
+        """
+        scene_dir = self.scene_dir(key)
+        tmp_dir = scene_dir.with_name(f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        (tmp_dir / "keyframes").mkdir(parents=True, exist_ok=True)
+        
+        try:
+            keyframe_meta = []
+            for i, kf in enumerate(scene.keyframes):
+                cv2.imwrite(
+                    str(tmp_dir / "keyframes" / f"{i:04d}.jpg"),
+                    kf["frame"],
+                    [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+                )
+                keyframe_meta.append({k: v for k, v in kf.items() if k not in _DROPPED_KEYFRAME_KEYS})
+            with open(tmp_dir / "keyframes.json", 'w', encoding='utf-8') as f:
+                json.dump(_to_jsonable(keyframe_meta), f, ensure_ascii=False)
+            
+            # 体素下采样后的点云精度远低于float16在场景尺度内的量化误差
+            points = np.asarray(scene.pointcloud.points, dtype=np.float64)
+            origin = points.mean(axis=0) if len(points) else np.zeros(3)
+            arrays = {
+                "origin": origin,
+                "points": (points - origin).astype(np.float16)
+            }
+            if scene.pointcloud.colors is not None:
+                arrays["colors"] = np.round(np.clip(scene.pointcloud.colors, 0.0, 1.0) * 255).astype(np.uint8)
+            np.savez_compressed(tmp_dir / "pointcloud.npz", **arrays)
+            
+            # 文本嵌入取决于定位时的嵌入器，不保存
+            olt_data = {
+                'objects': [dict(obj.to_dict(), embedding=None) for obj in scene.olt.objects],
+                'next_id': scene.olt.next_id
+            }
+            with open(tmp_dir / "olt.json", 'w', encoding='utf-8') as f:
+                json.dump(_to_jsonable(olt_data), f, ensure_ascii=False)
+            
+            if scene.detections is not None:
+                with open(tmp_dir / "detections.json", 'w', encoding='utf-8') as f:
+                    json.dump(_to_jsonable(scene.detections), f, ensure_ascii=False)
+            
+            manifest = {
+                "version": SCENE_FORMAT_VERSION,
+                "key": key,
+                "input_path": scene.input_path,
+                "input_type": scene.input_type,
+                "created": time.time(),
+                "build_time": scene.build_time,
+                "num_frames": len(scene.keyframes),
+                "num_points": int(len(points)),
+                "num_objects": len(scene.olt),
+                "pointcloud_metadata": _to_jsonable(scene.pointcloud.metadata)
+            }
+            # manifest最后写入，作为场景完整的标记
+            with open(tmp_dir / _MANIFEST, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2, ensure_ascii=False)
+            
+            try:
+                os.replace(tmp_dir, scene_dir)
+            except OSError:
+                if self.is_scene_dir(str(scene_dir)):
+                    # 其他进程已保存同一场景
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                else:
+                    # 残留的不完整目录
+                    shutil.rmtree(scene_dir, ignore_errors=True)
+                    os.replace(tmp_dir, scene_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        
+        with self._lock:
+            self.stats["saves"] += 1
+        logger.info(f"场景已保存至: {scene_dir}")
+        return scene_dir
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats)
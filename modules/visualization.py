@@ -4,17 +4,18 @@ Visualization Module
 """
 
 import numpy as np
-import open3d as o3d
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
 import cv2
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import List, Optional, Tuple, TYPE_CHECKING
 import logging
 
 from modules.reconstruction_3d import PointCloud3D
 from modules.object_lookup_table import Object3D
 
+# open3d和matplotlib导入较慢，在生成可视化时才导入
+if TYPE_CHECKING:
+    import open3d as o3d
+
 logger = logging.getLogger(__name__)
 
 
@@ -39,6 +40,7 @@ class Visualizer:
             show_interactive: 是否显示交互式窗口
         """
         logger.info("生成3D可视化...")
+        import open3d as o3d
         
         # 创建Open3D点云对象
         o3d_pcd = o3d.geometry.PointCloud()
@@ -90,7 +92,7 @@ class Visualizer:
     
     def _create_bbox_mesh(self, 
                          bbox_3d: List[float],
-                         color: List[float] = [0, 1, 0]) -> o3d.geometry.LineSet:
+                         color: List[float] = [0, 1, 0]) -> "o3d.geometry.LineSet":
         """
         创建3D边界框线框
         
@@ -101,6 +103,8 @@ class Visualizer:
         Returns:
             Open3D LineSet
         """
+        import open3d as o3d
+        
         x, y, z, w, h, d = bbox_3d
         
         # 计算8个角点
@@ -137,6 +141,8 @@ class Visualizer:
     
     def _save_visualization(self, geometries: List, output_path: str):
         """保存可视化结果"""
+        import open3d as o3d
+        
         output_path = Path(output_path)
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
@@ -167,6 +173,8 @@ class Visualizer:
             fps: 帧率
         """
         logger.info("生成旋转动画...")
+        import matplotlib.pyplot as plt
+        from matplotlib.animation import FuncAnimation
         
         try:
             # 使用matplotlib创建动画
@@ -331,6 +339,8 @@ class Visualizer:
             query: 查询文本
             output_path: 输出路径
         """
+        import matplotlib.pyplot as plt
+        
         fig = plt.figure(figsize=(15, 5))
         
         # 子图1: 点云俯视图
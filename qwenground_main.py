@@ -8,7 +8,8 @@ import argparse
 import sys
 from pathlib import Path
 
-from qwenground_system import QwenGroundSystem
+# 只导入轻量模块：--help 和参数校验不加载torch、open3d等重量级依赖，
+# QwenGroundSystem 在校验通过后才导入
 from utils.helpers import setup_logging, load_config, check_dependencies, print_banner
 
 
@@ -27,6 +28,13 @@ def parse_args():
   python qwenground_main.py --input_type images --input_path ./images/ \\
       --query "the laptop near the window"
   
+  # 同一场景的多个查询（场景只构建一次）
+  python qwenground_main.py --input_path video.mp4 --queries_file queries.txt
+  
+  # 缓存场景：第二次对同一视频的查询跳过重建，直接定位
+  python qwenground_main.py --input_path video.mp4 --query "..." \\
+      --scene_cache_dir ~/.cache/qwenground/scenes
+  
   # 使用配置文件
   python qwenground_main.py --config config/default.yaml \\
       --input_path video.mp4 --query "..."
@@ -41,13 +49,19 @@ def parse_args():
         help='输入路径（视频文件或图像文件夹）'
     )
     
-    parser.add_argument(
+    query_group = parser.add_mutually_exclusive_group(required=True)
+    query_group.add_argument(
         '--query',
         type=str,
-        required=True,
         help='自然语言查询，例如: "the red apple on the wooden table"'
     )
     
+    query_group.add_argument(
+        '--queries_file',
+        type=str,
+        help='查询文件（每行一个查询，# 开头为注释），场景只构建一次'
+    )
+    
     # 可选参数
     parser.add_argument(
         '--input_type',
@@ -118,6 +132,13 @@ def parse_args():
         help='保存中间结果（点云、OLT等）'
     )
     
+    parser.add_argument(
+        '--scene_cache_dir',
+        type=str,
+        default=None,
+        help='场景缓存目录：相同输入和场景配置的关键帧、点云和OLT只构建一次（--input_path 也可以直接指定缓存中的场景目录）'
+    )
+    
     parser.add_argument(
         '--log_level',
         type=str,
@@ -136,6 +157,32 @@ def parse_args():
     return parser.parse_args()
 
 
+def load_queries(path):
+    """读取查询文件（每行一个查询，忽略空行和 # 注释）"""
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+
+def print_batch_summary(batch_result, output_dir):
+    """打印批量运行结果摘要"""
+    metadata = batch_result.get('metadata', {})
+    print("\n" + "="*60)
+    print("📊 批量结果摘要:")
+    print("="*60)
+    for i, result in enumerate(batch_result['results']):
+        if result['success']:
+            print(f"[{i:03d}] ✓ {result['query']} -> {result['target_object']} "
+                  f"(置信度: {result['confidence']:.3f}, {result['metadata']['processing_time']}秒)")
+        else:
+            print(f"[{i:03d}] ✗ {result.get('query', '')} {result['error']}")
+    print(f"\n成功: {batch_result['num_succeeded']}/{batch_result['num_queries']}")
+    print(f"场景构建时间: {metadata.get('scene_build_time')}秒")
+    print(f"平均定位时间: {metadata.get('mean_grounding_time')}秒")
+    print(f"总时间: {metadata.get('total_time')}秒")
+    print(f"\n输出目录: {output_dir}")
+    print("="*60)
+
+
 def main():
     """主函数"""
     # 打印横幅
@@ -147,17 +194,31 @@ def main():
     # 设置日志
     setup_logging(log_level=args.log_level, log_file=args.log_file)
     
-    # 检查依赖
-    print("\n检查依赖...")
-    if not check_dependencies():
-        sys.exit(1)
-    
     # 验证输入路径
     input_path = Path(args.input_path)
     if not input_path.exists():
         print(f"\n❌ 错误: 输入路径不存在: {input_path}")
         sys.exit(1)
     
+    queries = None
+    if args.queries_file:
+        if not Path(args.queries_file).exists():
+            print(f"\n❌ 错误: 查询文件不存在: {args.queries_file}")
+            sys.exit(1)
+        queries = load_queries(args.queries_file)
+        if not queries:
+            print(f"\n❌ 错误: 查询文件为空: {args.queries_file}")
+            sys.exit(1)
+    
+    if args.config and not Path(args.config).exists():
+        print(f"\n❌ 错误: 配置文件不存在: {args.config}")
+        sys.exit(1)
+    
+    # 检查依赖
+    print("\n检查依赖...")
+    if not check_dependencies():
+        sys.exit(1)
+    
     # 加载配置
     config = None
     if args.config:
@@ -171,13 +232,15 @@ def main():
     print(f"  API模式: {'是' if args.use_api else '否'}")
     
     try:
+        from qwenground_system import QwenGroundSystem
         system = QwenGroundSystem(
             model_name=args.model_name,
             device=args.device,
             use_api=args.use_api,
             api_url=args.api_url,
             api_key=args.api_key,
-            config=config
+            config=config,
+            scene_cache_dir=args.scene_cache_dir
         )
     except Exception as e:
         print(f"\n❌ 系统初始化失败: {e}")
@@ -186,6 +249,26 @@ def main():
     # 运行系统
     print("\n开始处理...\n")
     
+    if queries is not None:
+        print(f"批量查询: {len(queries)} 个")
+        batch_result = system.run_batch(
+            input_path=str(input_path),
+            queries=queries,
+            input_type=args.input_type,
+            output_dir=args.output_dir,
+            visualize=not args.no_visualize,
+            save_intermediate=args.save_intermediate
+        )
+        
+        if not batch_result['success']:
+            print("\n❌ 处理失败:")
+            print(f"  错误: {batch_result['error']}")
+            sys.exit(1)
+        
+        print_batch_summary(batch_result, args.output_dir)
+        print("\n✅ 完成!")
+        return
+    
     result = system.run(
         input_path=str(input_path),
         query=args.query,
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+QwenGround Server
+常驻服务：模型只加载一次，通过本地HTTP（TCP或Unix socket）接收场景构建和查询请求
+
+接口:
+  GET    /health              健康检查
+  GET    /stats               各接口的延迟分位数、吞吐量、场景池和查询解析统计
+  GET    /scenes              已缓存的场景
+  POST   /scenes              构建（或从场景缓存加载）场景: {"input_path", "input_type"}
+  DELETE /scenes/<scene_id>   从场景池移除场景
+  POST   /query               定位: {"scene_id" 或 "input_path"/"input_type", "query" 或 "queries", "visualize"}
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import hashlib
+import argparse
+import threading
+import socketserver
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import logging
+
+from utils.helpers import setup_logging, load_config, check_dependencies, print_banner
+
+if TYPE_CHECKING:
+    # 系统和场景模块会加载torch、cv2等依赖，启动时在参数解析之后才导入
+    from qwenground_system import QwenGroundSystem
+    from modules.scene_store import SceneContext
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats:
+    """按接口统计请求延迟（最近 window 个请求的分位数）和吞吐量"""
+    
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self.start_time = time.time()
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+    
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+    
+    def end(self, endpoint: str, latency: float, error: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            self._latencies.setdefault(endpoint, deque(maxlen=self.window)).append(latency)
+            self._counts[endpoint] = self._counts.get(endpoint, 0) + 1
+            if error:
+                self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            uptime = time.time() - self.start_time
+            endpoints = {}
+            for endpoint, latencies in self._latencies.items():
+                values = sorted(latencies)
+                count = self._counts[endpoint]
+                endpoints[endpoint] = {
+                    "count": count,
+                    "errors": self._errors.get(endpoint, 0),
+                    "throughput": round(count / uptime, 3) if uptime > 0 else 0.0,
+                    "mean_ms": round(1000 * sum(values) / len(values), 2),
+                    "p50_ms": round(1000 * values[len(values) // 2], 2),
+                    "p95_ms": round(1000 * values[min(len(values) - 1, int(len(values) * 0.95))], 2),
+                    "max_ms": round(1000 * values[-1], 2)
+                }
+            
+            return {
+                "uptime": round(uptime, 1),
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "endpoints": endpoints
+            }
+
+
+class RequestError(ValueError):
+    """请求本身无效（缺少字段、类型错误、请求体不是JSON对象），返回400"""
+
+
+class ScenePool:
+    """
+    场景池：内存中的LRU场景缓存（最多 max_scenes 个）
+    
+    同一场景的并发请求只构建一次（SingleFlight），其余请求等待并共享结果；
+    不同场景的构建串行执行（深度估计和检测模型共用GPU，并发构建只会相互争抢）。
+    启用场景缓存目录时，被淘汰的场景之后可以从磁盘重新加载。
+    """
+    
+    def __init__(self, system: "QwenGroundSystem", max_scenes: int = 4, output_dir: str = "./outputs/server"):
+        """
+        Args:
+            system: QwenGround系统
+            max_scenes: 内存中保留的最大场景数
+            output_dir: 场景输出目录
+        """
+        self.system = system
+        self.output_dir = Path(output_dir)
+        self.max_scenes = max(1, max_scenes)
+        self._scenes: "OrderedDict[str, SceneContext]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        from utils.single_flight import SingleFlight
+        self._single_flight = SingleFlight()
+        self.stats = {"hits": 0, "builds": 0, "store_loads": 0, "evictions": 0}
+    
+    @staticmethod
+    def scene_id(input_path: str, input_type: str) -> str:
+        """场景ID：输入的绝对路径、类型和其中每个文件的大小与修改时间"""
+        from modules.scene_store import input_fingerprint
+        
+        path = Path(input_path).resolve()
+        data = f"{path}|{input_type}|{input_fingerprint(str(path))}"
+        return hashlib.blake2b(data.encode("utf-8"), digest_size=8).hexdigest()
+    
+    def get(self, scene_id: str) -> Optional["SceneContext"]:
+        with self._lock:
+            scene = self._scenes.get(scene_id)
+            if scene is not None:
+                self._scenes.move_to_end(scene_id)
+                self.stats["hits"] += 1
+            return scene
+    
+    def get_or_build(self, input_path: str, input_type: str = "video") -> Tuple[str, "SceneContext"]:
+        """
+        获取场景（不在池中时构建）
+        
+        Returns:
+            (场景ID, SceneContext)
+        """
+        scene_id = self.scene_id(input_path, input_type)
+        scene = self.get(scene_id)
+        if scene is not None:
+            return scene_id, scene
+        
+        def build() -> "SceneContext":
+            with self._build_lock:
+                built = self.system.build_scene(
+                    input_path, input_type, output_dir=str(self.output_dir / scene_id)
+                )
+            self._put(scene_id, built)
+            return built
+        
+        return scene_id, self._single_flight.do(scene_id, build)
+    
+    def _put(self, scene_id: str, scene: "SceneContext"):
+        with self._lock:
+            # 从场景缓存目录加载的场景不计入构建次数
+            self.stats["store_loads" if scene.source == "cache" else "builds"] += 1
+            self._scenes[scene_id] = scene
+            self._scenes.move_to_end(scene_id)
+            while len(self._scenes) > self.max_scenes:
+                evicted, _ = self._scenes.popitem(last=False)
+                self.stats["evictions"] += 1
+                logger.info(f"场景池已满，移除场景: {evicted}")
+    
+    def remove(self, scene_id: str) -> bool:
+        with self._lock:
+            return self._scenes.pop(scene_id, None) is not None
+    
+    def describe(self) -> List[Dict]:
+        with self._lock:
+            return [
+                {
+                    "scene_id": scene_id,
+                    "input_path": scene.input_path,
+                    "input_type": scene.input_type,
+                    "num_frames": len(scene.keyframes),
+                    "num_points": len(scene.pointcloud.points),
+                    "num_objects": len(scene.olt),
+                    "build_time": round(scene.build_time, 2),
+                    "source": scene.source
+                }
+                for scene_id, scene in self._scenes.items()
+            ]
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self._scenes)
+            stats["max_scenes"] = self.max_scenes
+        stats["shared_builds"] = self._single_flight.get_stats()["shared"]
+        return stats
+
+
+class GroundingRequestHandler(BaseHTTPRequestHandler):
+    """HTTP请求处理（JSON请求体和响应）"""
+    
+    protocol_version = "HTTP/1.1"
+    
+    def setup(self):
+        super().setup()
+        # 响应头和响应体分两次写出，关闭Nagle算法以免与延迟ACK叠加出约40ms的延迟
+        if self.connection.family in (socket.AF_INET, socket.AF_INET6):
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    
+    def log_message(self, format, *args):
+        logger.debug("%s - %s" % (self.address_string(), format % args))
+    
+    def address_string(self) -> str:
+        # Unix socket 的客户端地址不是 (host, port)
+        if isinstance(self.client_address, tuple):
+            return str(self.client_address[0])
+        return "unix"
+    
+    def _send_json(self, status: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _read_json(self) -> Dict:
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError as e:
+            raise RequestError(f"无效的 Content-Length: {e}") from e
+        if length == 0:
+            return {}
+        try:
+            data = json.loads(self.rfile.read(length))
+        except json.JSONDecodeError as e:
+            raise RequestError(f"请求体不是有效的JSON: {e}") from e
+        if not isinstance(data, dict):
+            raise RequestError("请求体必须是JSON对象")
+        return data
+    
+    def _handle(self, method: str):
+        path = self.path.split("?", 1)[0].rstrip("/") or "/"
+        endpoint = f"{method} /{path.strip('/').split('/')[0]}"
+        stats = self.server.latency_stats
+        stats.begin()
+        start = time.time()
+        status = 500
+        failed = False
+        
+        try:
+            status, payload = self.server.app.dispatch(method, path, self._read_json() if method == "POST" else {})
+            # 定位失败的查询仍返回200（结果中带错误信息），但计入该接口的错误数
+            failed = payload.get("num_failed", 0) > 0
+        except RequestError as e:
+            # 只有请求校验错误返回400；定位过程中的 ValueError/KeyError 是服务端错误
+            status, payload = 400, {"error": f"无效请求: {e}"}
+        except FileNotFoundError as e:
+            status, payload = 404, {"error": str(e)}
+        except Exception as e:
+            logger.error(f"请求处理失败: {e}", exc_info=True)
+            status, payload = 500, {"error": str(e)}
+        finally:
+            stats.end(endpoint, time.time() - start, error=status >= 400 or failed)
+        
+        self._send_json(status, payload)
+    
+    def do_GET(self):
+        self._handle("GET")
+    
+    def do_POST(self):
+        self._handle("POST")
+    
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+class GroundingApp:
+    """请求路由：场景构建、查询定位和统计"""
+    
+    def __init__(self, system: "QwenGroundSystem", scene_pool: ScenePool, output_dir: str):
+        self.system = system
+        self.scene_pool = scene_pool
+        self.output_dir = Path(output_dir)
+        self.latency_stats = LatencyStats()
+    
+    def dispatch(self, method: str, path: str, body: Dict) -> Tuple[int, Dict]:
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        if method == "GET" and path == "/stats":
+            return 200, self.get_stats()
+        if method == "GET" and path == "/scenes":
+            return 200, {"scenes": self.scene_pool.describe()}
+        if method == "POST" and path == "/scenes":
+            return 200, self.build_scene(body)
+        if method == "DELETE" and path.startswith("/scenes/"):
+            scene_id = path[len("/scenes/"):]
+            if not self.scene_pool.remove(scene_id):
+                raise FileNotFoundError(f"场景不存在: {scene_id}")
+            return 200, {"removed": scene_id}
+        if method == "POST" and path == "/query":
+            return 200, self.query(body)
+        
+        return 404, {"error": f"未知接口: {method} {path}"}
+    
+    def _resolve_scene(self, body: Dict) -> Tuple[str, "SceneContext"]:
+        if body.get("scene_id"):
+            if not isinstance(body["scene_id"], str):
+                raise RequestError("scene_id 必须是字符串")
+            scene = self.scene_pool.get(body["scene_id"])
+            if scene is None:
+                raise FileNotFoundError(f"场景不存在或已被移除: {body['scene_id']}")
+            return body["scene_id"], scene
+        
+        input_path = body.get("input_path")
+        if not isinstance(input_path, str) or not input_path:
+            raise RequestError("需要 scene_id 或 input_path")
+        input_type = body.get("input_type", "video")
+        if input_type not in ("video", "images"):
+            raise RequestError(f"不支持的 input_type: {input_type}")
+        if not Path(input_path).exists():
+            raise FileNotFoundError(f"输入路径不存在: {input_path}")
+        return self.scene_pool.get_or_build(input_path, input_type)
+    
+    def build_scene(self, body: Dict) -> Dict:
+        start = time.time()
+        scene_id, scene = self._resolve_scene(body)
+        return {
+            "scene_id": scene_id,
+            "num_frames": len(scene.keyframes),
+            "num_objects": len(scene.olt),
+            "build_time": round(scene.build_time, 2),
+            "source": scene.source,
+            "latency": round(time.time() - start, 3)
+        }
+    
+    def query(self, body: Dict) -> Dict:
+        if "queries" in body:
+            queries = body["queries"]
+            if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+                raise RequestError("queries 必须是字符串列表")
+        elif isinstance(body.get("query"), str):
+            queries = [body["query"]]
+        else:
+            raise RequestError("需要字符串 query 或字符串列表 queries")
+        
+        start = time.time()
+        scene_id, scene = self._resolve_scene(body)
+        scene_time = time.time() - start
+        
+        output_dir = self.output_dir / scene_id / uuid.uuid4().hex[:12]
+        results = self.system.ground_queries(
+            scene, queries, str(output_dir), visualize=bool(body.get("visualize", False))
+        )
+        
+        response = {
+            "scene_id": scene_id,
+            "num_failed": sum(1 for r in results if not r.get("success")),
+            "scene_time": round(scene_time, 3),
+            "latency": round(time.time() - start, 3)
+        }
+        if "queries" in body:
+            response["results"] = results
+        else:
+            response["result"] = results[0]
+        return response
+    
+    def get_stats(self) -> Dict:
+        return {
+            "requests": self.latency_stats.snapshot(),
+            "scene_pool": self.scene_pool.get_stats(),
+            "scene_store": self.system.scene_store.get_stats() if self.system.scene_store else None,
+            "query_parse_stats": self.system.vlm_client.get_parse_stats(),
+            "vlm_dedup_stats": self.system.vlm_client.get_dedup_stats()
+        }
+
+
+class GroundingHTTPServer(ThreadingHTTPServer):
+    """TCP服务器（每个连接一个线程）"""
+    
+    daemon_threads = True
+    
+    def __init__(self, address, app: GroundingApp):
+        self.app = app
+        self.latency_stats = app.latency_stats
+        super().__init__(address, GroundingRequestHandler)
+
+
+class GroundingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket服务器（本机客户端，无TCP开销）"""
+    
+    daemon_threads = True
+    
+    def __init__(self, socket_path: str, app: GroundingApp):
+        self.app = app
+        self.latency_stats = app.latency_stats
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, GroundingRequestHandler)
+    
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="QwenGround常驻服务：模型只加载一次，通过HTTP接收场景构建和查询请求",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  python qwenground_server.py --port 8080 --scene_cache_dir ~/.cache/qwenground/scenes
+  curl -X POST localhost:8080/scenes -d '{"input_path": "video.mp4"}'
+  curl -X POST localhost:8080/query -d '{"scene_id": "...", "query": "the red apple on the table"}'
+  
+  # Unix socket
+  python qwenground_server.py --unix_socket /tmp/qwenground.sock
+  curl --unix-socket /tmp/qwenground.sock localhost/stats
+        """
+    )
+    
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='监听地址 (默认: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080,
+                        help='监听端口 (默认: 8080)')
+    parser.add_argument('--unix_socket', type=str, default=None,
+                        help='Unix socket路径（指定时不监听TCP）')
+    parser.add_argument('--max_scenes', type=int, default=4,
+                        help='内存中保留的最大场景数 (默认: 4)')
+    parser.add_argument('--output_dir', type=str, default='./outputs/server',
+                        help='查询结果输出目录 (默认: ./outputs/server)')
+    parser.add_argument('--scene_cache_dir', type=str, default=None,
+                        help='场景缓存目录（被淘汰或重启后的场景从磁盘加载）')
+    parser.add_argument('--model_name', type=str, default='Qwen/Qwen2-VL-7B-Instruct',
+                        help='VLM模型名称 (默认: Qwen/Qwen2-VL-7B-Instruct)')
+    parser.add_argument('--device', type=str, choices=['cuda', 'cpu'], default='cuda',
+                        help='设备 (默认: cuda)')
+    parser.add_argument('--use_api', action='store_true',
+                        help='使用vLLM API模式')
+    parser.add_argument('--api_url', type=str, default='http://localhost:8000/v1',
+                        help='vLLM API服务器地址 (默认: http://localhost:8000/v1)')
+    parser.add_argument('--api_key', type=str, default=None,
+                        help='API密钥')
+    parser.add_argument('--config', type=str, default=None,
+                        help='配置文件路径（YAML格式）')
+    parser.add_argument('--log_level', type=str, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        default='INFO', help='日志级别 (默认: INFO)')
+    parser.add_argument('--log_file', type=str, default=None,
+                        help='日志文件路径（可选）')
+    
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    print_banner()
+    args = parse_args()
+    setup_logging(log_level=args.log_level, log_file=args.log_file)
+    
+    # 依赖检查只在启动时执行一次
+    print("\n检查依赖...")
+    if not check_dependencies():
+        sys.exit(1)
+    
+    config = load_config(args.config) if args.config else None
+    
+    from qwenground_system import QwenGroundSystem
+    
+    print(f"\n初始化QwenGround系统...")
+    system = QwenGroundSystem(
+        model_name=args.model_name,
+        device=args.device,
+        use_api=args.use_api,
+        api_url=args.api_url,
+        api_key=args.api_key,
+        config=config,
+        scene_cache_dir=args.scene_cache_dir
+    )
+    
+    scene_pool = ScenePool(system, max_scenes=args.max_scenes, output_dir=args.output_dir)
+    app = GroundingApp(system, scene_pool, args.output_dir)
+    
+    if args.unix_socket:
+        server = GroundingUnixServer(args.unix_socket, app)
+        address = f"unix:{args.unix_socket}"
+    else:
+        server = GroundingHTTPServer((args.host, args.port), app)
+        address = f"http://{args.host}:{args.port}"
+    
+    print(f"\n✅ 服务已启动: {address} (场景池上限: {args.max_scenes})")
+    
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n停止服务...")
+    finally:
+        server.server_close()
+        system.vlm_client.close()
+
+
+if __name__ == "__main__":
+    main()
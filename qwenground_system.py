@@ -5,7 +5,7 @@ QwenGround System - Main System Class
 
 import time
 from pathlib import Path
-from typing import Dict, Optional, Union
+from typing import Dict, List, Optional, Union
 import logging
 
 from modules.perspective_adapter import PerspectiveAdapter
@@ -13,8 +13,15 @@ from modules.reconstruction_3d import Reconstruction3D, PointCloud3D
 from modules.fusion_alignment import FusionAlignment
 from modules.object_lookup_table import ObjectLookupTable, Object3D
 from modules.visualization import Visualizer
-from utils.vlm_client import QwenVLMClient
+from modules.stage_scheduler import StageScheduler
+from modules.scene_store import SceneStore, SceneContext
+from utils.vlm_client import QwenVLMClient, QueryAnalysis, QUERY_PARSE_PROMPT_VERSION
+from utils.vlm_backend import MockBackend
+from utils.query_cache import QueryParseCache
+from utils.model_prefetcher import ModelPrefetcher
+from utils.image_encoding import ImageEncoder, MIN_PIXELS, MAX_PIXELS
 from utils.object_detector import ObjectDetector
+from utils.text_embedder import TextEmbedder
 from utils.helpers import save_json
 
 logger = logging.getLogger(__name__)
@@ -29,7 +36,8 @@ class QwenGroundSystem:
                  use_api: bool = False,
                  api_url: Optional[str] = None,
                  api_key: Optional[str] = None,
-                 config: Optional[Dict] = None):
+                 config: Optional[Dict] = None,
+                 scene_cache_dir: Optional[str] = None):
         """
         初始化QwenGround系统
         
@@ -40,6 +48,7 @@ class QwenGroundSystem:
             api_url: API服务器地址
             api_key: API密钥
             config: 配置字典（可选）
+            scene_cache_dir: 场景缓存目录（可选，覆盖配置中的 scene_cache.dir）
         """
         logger.info("初始化QwenGround系统...")
         
@@ -50,13 +59,52 @@ class QwenGroundSystem:
         # 初始化各个模块
         logger.info("初始化模块...")
         
-        # 1. VLM客户端
+        # 1. VLM客户端（本地模型延迟到首次使用或后台预加载时加载）
+        model_config = self.config.get('model', {})
+        vlm_config = self.config.get('vlm', {})
+        query_cache = QueryParseCache(
+            db_path=vlm_config.get('query_cache_path'),
+            max_entries=vlm_config.get('query_cache_size', 1024),
+            ttl=vlm_config.get('query_cache_ttl'),
+            version=QUERY_PARSE_PROMPT_VERSION
+        )
+        # model.backend 为 "mock" 时使用不需要模型的模拟后端（测试和基准测试用）
+        vlm_backend = None
+        if model_config.get('backend') == 'mock':
+            vlm_backend = MockBackend(
+                latency=model_config.get('mock_latency', 0.0),
+                token_latency=model_config.get('mock_token_latency', 0.0)
+            )
         self.vlm_client = QwenVLMClient(
             model_name=model_name,
             device=device,
             use_api=use_api,
             api_url=api_url,
-            api_key=api_key
+            api_key=api_key,
+            query_cache=query_cache,
+            rule_parse_threshold=vlm_config.get('rule_parse_threshold', 0.8),
+            api_max_concurrency=vlm_config.get('api_max_concurrency', 8),
+            api_max_retries=vlm_config.get('api_max_retries', 3),
+            api_timeout=vlm_config.get('api_timeout', 60.0),
+            image_encoder=ImageEncoder(
+                image_format=vlm_config.get('image_format', 'JPEG'),
+                quality=vlm_config.get('image_quality', 85),
+                min_pixels=vlm_config.get('image_min_pixels', MIN_PIXELS),
+                max_pixels=vlm_config.get('image_max_pixels', MAX_PIXELS),
+                cache_size=vlm_config.get('image_cache_size', 64)
+            ),
+            batch_max_size=vlm_config.get('batch_max_size', 1),
+            batch_timeout_ms=vlm_config.get('batch_timeout_ms', 10.0),
+            pixel_cache_size=vlm_config.get('pixel_cache_size', 16),
+            vision_cache_size=vlm_config.get('vision_cache_size', 0),
+            prefix_caching=vlm_config.get('prefix_caching', True),
+            constrained_decoding=vlm_config.get('constrained_decoding', True),
+            api_guided_mode=vlm_config.get('api_guided_mode', 'guided_json'),
+            lazy_load=model_config.get('lazy_load', True),
+            dtype=model_config.get('dtype', 'auto'),
+            quantization=model_config.get('quantization'),
+            backend=vlm_backend,
+            single_flight=vlm_config.get('single_flight', True)
         )
         
         # 2. 物体检测器
@@ -64,7 +112,8 @@ class QwenGroundSystem:
             model_name=self.config['detection']['yolo_model'],
             conf_threshold=self.config['detection']['conf_threshold'],
             iou_threshold=self.config['detection']['iou_threshold'],
-            device=device
+            device=device,
+            batch_size=self.config['detection'].get('batch_size', 8)
         )
         
         # 3. 视角适应模块
@@ -82,14 +131,51 @@ class QwenGroundSystem:
         )
         
         # 5. 融合对齐模块
+        fusion_config = self.config.get('fusion', {})
         self.fusion_alignment = FusionAlignment(
             vlm_client=self.vlm_client,
-            object_detector=self.object_detector
+            object_detector=self.object_detector,
+            bbox_sample_size=fusion_config.get('bbox_sample_size', 16),
+            bbox_crop_ratio=fusion_config.get('bbox_crop_ratio', 0.6),
+            bbox_percentile=fusion_config.get('bbox_percentile', 10.0),
+            num_workers=fusion_config.get('num_workers'),
+            text_embedder=TextEmbedder(model_name=fusion_config.get('text_embedding_model')),
+            candidate_top_k=fusion_config.get('candidate_top_k', 20),
+            candidate_min_score=fusion_config.get('candidate_min_score', 0.5),
+            verify_with_vlm=fusion_config.get('verify_with_vlm', True),
+            verify_max_images=fusion_config.get('verify_max_images', 2),
+            verify_tiles_per_image=fusion_config.get('verify_tiles_per_image', 4)
+        )
+        
+        # 6. 阶段调度器（深度估计与物体检测并发）
+        self.stage_scheduler = StageScheduler(
+            reconstruction_3d=self.reconstruction_3d,
+            fusion_alignment=self.fusion_alignment
         )
         
-        # 6. 可视化器
+        # 7. 可视化器
         self.visualizer = Visualizer()
         
+        # 8. 场景缓存（按输入内容和场景配置保存关键帧、点云、OLT和检测结果）
+        scene_cache_config = self.config.get('scene_cache', {})
+        scene_cache_dir = scene_cache_dir or scene_cache_config.get('dir')
+        self.scene_store = None
+        if scene_cache_dir:
+            self.scene_store = SceneStore(
+                scene_cache_dir,
+                jpeg_quality=scene_cache_config.get('jpeg_quality', 95)
+            )
+        
+        # 9. 后台预加载模型（与关键帧提取等前置步骤重叠）
+        self.model_prefetcher = None
+        if model_config.get('prefetch', True):
+            self.model_prefetcher = ModelPrefetcher([
+                ("YOLO", self.object_detector.initialize),
+                ("MiDaS", self.reconstruction_3d.initialize_depth_model),
+                ("VLM", self.vlm_client.ensure_model),
+            ])
+            self.model_prefetcher.start()
+        
         logger.info("系统初始化完成")
     
     def _default_config(self) -> Dict:
@@ -99,15 +185,54 @@ class QwenGroundSystem:
                 'keyframe_count': 15,
                 'depth_model': 'MiDaS_small',
                 'method': 'depth',  # 'depth' or 'sfm'
+                'overlap_detection': True,  # 深度估计与物体检测并发执行
             },
             'detection': {
                 'yolo_model': 'yolov8x.pt',
                 'conf_threshold': 0.25,
                 'iou_threshold': 0.5,
+                'batch_size': 8,
+            },
+            'fusion': {
+                'bbox_sample_size': 16,
+                'bbox_crop_ratio': 0.6,
+                'bbox_percentile': 10.0,
+                'num_workers': None,  # None表示按CPU核数
+                'text_embedding_model': None,  # None表示哈希n-gram + 概念词表
+                'candidate_top_k': 20,
+                'candidate_min_score': 0.5,
+                'verify_with_vlm': True,
+                'verify_max_images': 2,
+                'verify_tiles_per_image': 4,
             },
             'vlm': {
                 'max_tokens': 512,
                 'temperature': 0.1,
+                # 查询解析缓存（内存LRU + SQLite），路径为None时只使用内存
+                'query_cache_path': '~/.cache/qwenground/query_cache.sqlite',
+                'query_cache_size': 1024,
+                'query_cache_ttl': None,  # 秒，None表示永不过期
+                'rule_parse_threshold': 0.8,
+                'api_max_concurrency': 8,
+                'api_max_retries': 3,
+                'api_timeout': 60.0,
+                'image_format': 'JPEG',
+                'image_quality': 85,
+                'image_min_pixels': MIN_PIXELS,
+                'image_max_pixels': MAX_PIXELS,
+                'image_cache_size': 64,
+                'batch_max_size': 1,
+                'batch_timeout_ms': 10.0,
+                'pixel_cache_size': 16,
+                'vision_cache_size': 0,
+                'prefix_caching': True,
+                'constrained_decoding': True,
+                'api_guided_mode': 'guided_json',
+                'single_flight': True,
+            },
+            'scene_cache': {
+                'dir': None,  # None表示不缓存场景
+                'jpeg_quality': 95,
             }
         }
     
@@ -139,63 +264,311 @@ class QwenGroundSystem:
         logger.info(f"输入类型: {input_type}")
         logger.info("="*60)
         
+        start_time = time.time()
+        
+        try:
+            scene = self.build_scene(input_path, input_type, output_dir, save_intermediate)
+        except Exception as e:
+            logger.error(f"运行失败: {e}", exc_info=True)
+            return self._create_error_result(str(e))
+        
+        return self.ground_query(scene, query, output_dir, visualize=visualize, start_time=start_time)
+    
+    def run_batch(self,
+                  input_path: str,
+                  queries: List[str],
+                  input_type: str = "video",
+                  output_dir: str = "./outputs",
+                  visualize: bool = True,
+                  save_intermediate: bool = False) -> Dict:
+        """
+        对同一场景运行多个查询
+        
+        场景（关键帧、点云、OLT）只构建一次，所有查询的解析批量提交给VLM，
+        之后每个查询只执行定位步骤。每个查询的结果保存在 output_dir/query_XXX/ 下，
+        汇总保存为 output_dir/batch_results.json。
+        
+        Args:
+            input_path: 输入路径（视频文件或图像文件夹）
+            queries: 自然语言查询列表
+            input_type: 输入类型 ("video" 或 "images")
+            output_dir: 输出目录
+            visualize: 是否为每个查询生成可视化
+            save_intermediate: 是否保存中间结果
+        
+        Returns:
+            批量结果字典（results 与 queries 一一对应）
+        """
+        logger.info("="*60)
+        logger.info(f"开始批量运行QwenGround: {len(queries)} 个查询")
+        logger.info(f"输入: {input_path}")
+        logger.info("="*60)
+        
         start_time = time.time()
         output_dir = Path(output_dir)
-        output_dir.mkdir(parents=True, exist_ok=True)
         
         try:
-            # ===== 步骤1: 视角适应 =====
-            logger.info("\n[1/5] 视角适应：提取关键帧...")
-            step_start = time.time()
+            scene = self.build_scene(input_path, input_type, str(output_dir), save_intermediate)
+        except Exception as e:
+            logger.error(f"场景构建失败: {e}", exc_info=True)
+            return {
+                "success": False,
+                "error": str(e),
+                "num_queries": len(queries),
+                "results": [self._create_error_result(str(e)) for _ in queries]
+            }
+        
+        results = self.ground_queries(scene, queries, str(output_dir), visualize=visualize)
+        
+        total_time = time.time() - start_time
+        grounding_times = [r["metadata"]["processing_time"] for r in results if r.get("success")]
+        # 批量解析的耗时均摊在不同的查询上，按查询去重后求和即为解析总耗时
+        parse_time = sum({
+            r["query"]: r["query_analysis"]["parse_time"] for r in results if "query_analysis" in r
+        }.values())
+        
+        batch_result = {
+            "success": True,
+            "input_path": str(input_path),
+            "num_queries": len(queries),
+            "num_succeeded": len(grounding_times),
+            "results": results,
+            "metadata": {
+                "num_frames": len(scene.keyframes),
+                "num_objects": len(scene.olt),
+                "scene_build_time": round(scene.build_time, 2),
+                "scene_source": scene.source,
+                "query_parse_time": round(parse_time, 2),
+                "mean_grounding_time": round(sum(grounding_times) / len(grounding_times), 2) if grounding_times else None,
+                "total_time": round(total_time, 2),
+                "query_parse_stats": self.vlm_client.get_parse_stats()
+            }
+        }
+        save_json(batch_result, str(output_dir / "batch_results.json"))
+        
+        logger.info("\n" + "="*60)
+        logger.info(f"✅ 批量运行完成: {len(grounding_times)}/{len(queries)} 个查询成功")
+        logger.info(f"场景构建: {scene.build_time:.2f}s，总耗时: {total_time:.2f}s")
+        logger.info("="*60 + "\n")
+        
+        return batch_result
+    
+    def ground_queries(self,
+                       scene: SceneContext,
+                       queries: List[str],
+                       output_dir: str = "./outputs",
+                       visualize: bool = True) -> List[Dict]:
+        """
+        在同一场景中定位多个查询（解析批量提交，之后逐个定位）
+        
+        Args:
+            scene: build_scene 返回的场景
+            queries: 自然语言查询列表
+            output_dir: 输出目录（每个查询的结果保存在 query_XXX/ 下）
+            visualize: 是否为每个查询生成可视化
+        
+        Returns:
+            与 queries 一一对应的结果字典
+        """
+        output_dir = Path(output_dir)
+        
+        # 所有查询的解析一起提交（缓存和规则命中的查询不调用VLM）
+        parse_start = time.time()
+        analyses = self.vlm_client.analyze_queries(queries)
+        logger.info(f"  ✓ 解析 {len(queries)} 个查询 (耗时: {time.time() - parse_start:.2f}s)")
+        
+        results = []
+        for i, (query, analysis) in enumerate(zip(queries, analyses)):
+            logger.info(f"\n查询 {i + 1}/{len(queries)}: {query}")
+            result = self.ground_query(
+                scene,
+                query,
+                str(output_dir / f"query_{i:03d}"),
+                visualize=visualize,
+                query_analysis=analysis
+            )
+            result.setdefault("query", query)
+            results.append(result)
+        
+        return results
+    
+    def build_scene(self,
+                    input_path: str,
+                    input_type: str = "video",
+                    output_dir: str = "./outputs",
+                    save_intermediate: bool = False) -> SceneContext:
+        """
+        构建场景：提取关键帧、3D重建并构建OLT（与查询无关，可被多个查询复用）
+        
+        input_path 为保存的场景目录时直接加载；启用场景缓存时，
+        相同输入内容和场景配置的场景从缓存加载，新构建的场景写入缓存。
+        
+        Args:
+            input_path: 输入路径（视频文件、图像文件夹或保存的场景目录）
+            input_type: 输入类型 ("video" 或 "images")
+            output_dir: 输出目录（保存中间结果时使用）
+            save_intermediate: 是否保存中间结果
+        
+        Returns:
+            SceneContext
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        
+        scene_key = None
+        if SceneStore.is_scene_dir(input_path):
+            scene = self.load_scene(input_path)
+        else:
+            scene = None
+            if self.scene_store is not None:
+                scene_key = self.scene_store.scene_key(input_path, self.config)
+                scene = self.scene_store.load(scene_key)
+                if scene is not None:
+                    logger.info(f"\n[1-3/5] 从场景缓存加载 (耗时: {scene.build_time:.2f}s)")
             
-            if input_type == "video":
-                keyframes = self.perspective_adapter.extract_keyframes_from_video(
-                    input_path,
-                    method="hybrid"
-                )
-            else:  # images
-                keyframes = self.perspective_adapter.load_images_from_folder(input_path)
+            if scene is None:
+                scene = self._build_scene(input_path, input_type)
+                if scene_key is not None:
+                    try:
+                        self.scene_store.save(scene_key, scene)
+                    except Exception as e:
+                        logger.warning(f"场景缓存写入失败: {e}")
+        
+        if save_intermediate:
+            pcd_path = output_dir / "pointcloud.ply"
+            self.reconstruction_3d.save_pointcloud(scene.pointcloud, str(pcd_path))
             
-            logger.info(f"  ✓ 提取了 {len(keyframes)} 个关键帧 (耗时: {time.time()-step_start:.2f}s)")
+            olt_path = output_dir / "olt.json"
+            scene.olt.save(str(olt_path))
+        
+        return scene
+    
+    def load_scene(self, scene_dir: str) -> SceneContext:
+        """
+        加载保存的场景（场景缓存中的目录），之后可直接调用 ground_query
+        
+        Args:
+            scene_dir: 场景目录（包含 manifest.json）
+        
+        Returns:
+            SceneContext
+        """
+        scene = SceneStore.load_dir(scene_dir)
+        logger.info(f"\n[1-3/5] 加载场景: {scene_dir} (耗时: {scene.build_time:.2f}s)")
+        return scene
+    
+    def _build_scene(self, input_path: str, input_type: str) -> SceneContext:
+        """从视频或图像构建场景"""
+        start_time = time.time()
+        
+        # ===== 步骤1: 视角适应 =====
+        logger.info("\n[1/5] 视角适应：提取关键帧...")
+        step_start = time.time()
+        
+        if input_type == "video":
+            keyframes = self.perspective_adapter.extract_keyframes_from_video(
+                input_path,
+                method="hybrid"
+            )
+        else:  # images
+            keyframes = self.perspective_adapter.load_images_from_folder(input_path)
+        
+        logger.info(f"  ✓ 提取了 {len(keyframes)} 个关键帧 (耗时: {time.time()-step_start:.2f}s)")
+        
+        method = self.config['reconstruction']['method']
+        
+        if self.config['reconstruction'].get('overlap_detection', True):
+            # ===== 步骤2+3: 3D重建与OLT构建（并发） =====
+            logger.info("\n[2-3/5] 3D重建与物体检测（并发执行）...")
+            step_start = time.time()
+            
+            pointcloud, olt = self.stage_scheduler.run(keyframes, method=method)
+            detections = self.stage_scheduler.detections
             
+            logger.info(f"  ✓ 生成点云: {len(pointcloud.points)} 个点")
+            logger.info(f"  ✓ 检测到 {len(olt)} 个唯一物体 (耗时: {time.time()-step_start:.2f}s)")
+        else:
             # ===== 步骤2: 3D重建 =====
             logger.info("\n[2/5] 3D重建：生成点云...")
             step_start = time.time()
             
             pointcloud = self.reconstruction_3d.reconstruct_from_keyframes(
                 keyframes,
-                method=self.config['reconstruction']['method']
+                method=method
             )
             
             logger.info(f"  ✓ 生成点云: {len(pointcloud.points)} 个点 (耗时: {time.time()-step_start:.2f}s)")
             
-            if save_intermediate:
-                pcd_path = output_dir / "pointcloud.ply"
-                self.reconstruction_3d.save_pointcloud(pointcloud, str(pcd_path))
-            
             # ===== 步骤3: 构建OLT =====
             logger.info("\n[3/5] 构建Object Lookup Table...")
             step_start = time.time()
             
-            olt = self.fusion_alignment.build_olt_from_keyframes(keyframes, pointcloud)
+            detections = self.fusion_alignment.detect_keyframes(keyframes)
+            olt = self.fusion_alignment.build_olt_from_keyframes(keyframes, pointcloud, detections=detections)
             
             logger.info(f"  ✓ 检测到 {len(olt)} 个唯一物体 (耗时: {time.time()-step_start:.2f}s)")
-            
-            if save_intermediate:
-                olt_path = output_dir / "olt.json"
-                olt.save(str(olt_path))
-            
+        
+        return SceneContext(
+            input_path=str(input_path),
+            input_type=input_type,
+            keyframes=keyframes,
+            pointcloud=pointcloud,
+            olt=olt,
+            build_time=time.time() - start_time,
+            detections=detections
+        )
+    
+    def ground_query(self,
+                     scene: SceneContext,
+                     query: str,
+                     output_dir: str = "./outputs",
+                     visualize: bool = True,
+                     query_analysis: Optional[QueryAnalysis] = None,
+                     start_time: Optional[float] = None) -> Dict:
+        """
+        在已构建的场景中定位查询目标
+        
+        Args:
+            scene: build_scene 返回的场景
+            query: 自然语言查询
+            output_dir: 输出目录
+            visualize: 是否生成可视化
+            query_analysis: 已解析的查询（可选，省略时在此解析）
+            start_time: 计时起点（省略时只计定位步骤的耗时）
+        
+        Returns:
+            结果字典
+        """
+        start_time = start_time or time.time()
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        keyframes, pointcloud, olt = scene.keyframes, scene.pointcloud, scene.olt
+        
+        try:
             # ===== 步骤4: 目标定位 =====
             logger.info("\n[4/5] 目标定位：使用VLM进行grounding...")
             step_start = time.time()
             
+            # 查询只解析一次，定位和结果组装共用
+            if query_analysis is None:
+                query_analysis = self.vlm_client.analyze_query(query)
+            logger.info(
+                f"  查询解析 ({query_analysis.source}, {query_analysis.parse_time:.2f}s): "
+                f"{query_analysis.components}"
+            )
+            parse_stats = self.vlm_client.get_parse_stats()
+            logger.info(
+                f"  无需模型的查询解析比例: {parse_stats['model_free_ratio']:.0%} "
+                f"({parse_stats['queries'] - parse_stats['vlm_calls']}/{parse_stats['queries']})"
+            )
+            
             target_object = self.fusion_alignment.ground_target_object(
-                query, keyframes, olt
+                query, keyframes, olt, query_analysis=query_analysis
             )
             
             if target_object is None:
                 logger.error("  ✗ 未能定位目标物体")
-                return self._create_error_result("未能定位目标物体")
+                return self._create_error_result("未能定位目标物体", query_analysis)
             
             logger.info(f"  ✓ 成功定位: {target_object.class_name} (耗时: {time.time()-step_start:.2f}s)")
             
@@ -242,12 +615,14 @@ class QwenGroundSystem:
             total_time = time.time() - start_time
             
             result = self._create_result(
-                query=query,
+                query_analysis=query_analysis,
                 target_object=target_object,
                 num_frames=len(keyframes),
                 num_objects=len(olt),
                 processing_time=total_time,
-                output_dir=str(output_dir)
+                output_dir=str(output_dir),
+                scene_build_time=scene.build_time,
+                scene_source=scene.source
             )
             
             # 保存结果JSON
@@ -267,20 +642,22 @@ class QwenGroundSystem:
             return self._create_error_result(str(e))
     
     def _create_result(self,
-                      query: str,
+                      query_analysis: QueryAnalysis,
                       target_object: Object3D,
                       num_frames: int,
                       num_objects: int,
                       processing_time: float,
-                      output_dir: str) -> Dict:
+                      output_dir: str,
+                      scene_build_time: Optional[float] = None,
+                      scene_source: Optional[str] = None) -> Dict:
         """创建结果字典"""
-        # 解析查询获取组件
-        query_components = self.vlm_client.extract_query_components(query)
+        query_components = query_analysis.components
         
         return {
             "success": True,
-            "query": query,
+            "query": query_analysis.query,
             "query_components": query_components,
+            "query_analysis": query_analysis.to_dict(),
             "target_object": target_object.class_name,
             "anchor_object": query_components.get("anchor"),
             "spatial_relation": query_components.get("relation"),
@@ -292,8 +669,14 @@ class QwenGroundSystem:
                 "num_frames": num_frames,
                 "num_objects": num_objects,
                 "processing_time": round(processing_time, 2),
+                "scene_build_time": round(scene_build_time, 2) if scene_build_time is not None else None,
+                "scene_source": scene_source,
                 "model": self.model_name,
-                "device": self.device
+                "device": self.device,
+                "query_parse_stats": self.vlm_client.get_parse_stats(),
+                "vlm_stream_stats": self.vlm_client.get_stream_stats(),
+                "vlm_backend_stats": self.vlm_client.get_backend_stats(),
+                "vlm_dedup_stats": self.vlm_client.get_dedup_stats()
             },
             "output_files": {
                 "point_cloud": f"{output_dir}/pointcloud.ply",
@@ -304,13 +687,21 @@ class QwenGroundSystem:
             }
         }
     
-    def _create_error_result(self, error_message: str) -> Dict:
+    def _create_error_result(self,
+                             error_message: str,
+                             query_analysis: Optional[QueryAnalysis] = None) -> Dict:
         """创建错误结果"""
-        return {
+        result = {
             "success": False,
             "error": error_message,
             "target_object": None,
             "3d_bbox": None,
             "confidence": 0.0
         }
+        
+        if query_analysis is not None:
+            result["query_components"] = query_analysis.components
+            result["query_analysis"] = query_analysis.to_dict()
+        
+        return result
 
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+API模式并发与缓存基准测试 - 使用本地模拟vLLM服务器，不需要GPU和网络
+
+比较顺序调用、线程池批量调用和异步并发调用的吞吐量，
+并检查查询解析缓存和图像编码缓存的效果
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.vlm_client import QwenVLMClient
+from utils.query_cache import QueryParseCache
+
+
+QUERIES = [
+    "the red apple on the table",
+    "the chair near the window",
+    "the lamp to the left of the bed that is closest to the door",
+    "a cup which is behind the laptop and next to the plant",
+    "the book on the shelf",
+    "the pillow on the sofa in the corner of the room",
+]
+
+
+def find_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get_json(url):
+    with urllib.request.urlopen(url, timeout=2) as response:
+        return json.loads(response.read())
+
+
+def start_server(args, port):
+    """启动模拟服务器子进程并等待就绪"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_vllm_server.py')
+    process = subprocess.Popen([
+        sys.executable, script,
+        '--port', str(port),
+        '--latency', str(args.latency),
+        '--token_latency', str(args.token_latency),
+    ], stdout=subprocess.DEVNULL)
+    
+    for _ in range(100):
+        try:
+            get_json(f"http://127.0.0.1:{port}/health")
+            return process
+        except OSError:
+            time.sleep(0.1)
+    
+    process.terminate()
+    raise RuntimeError("模拟服务器启动超时")
+
+
+def make_messages(i, frame=None):
+    content = [{"type": "text", "text": f"Describe object {i} in the scene."}]
+    if frame is not None:
+        content.insert(0, {"type": "image", "image": frame})
+    return [{"role": "user", "content": content}]
+
+
+def timed(label, n, fn):
+    start = time.time()
+    fn()
+    elapsed = time.time() - start
+    print(f"  {label:24s} {n:4d} 请求  {elapsed:7.2f}s  {n / elapsed:8.1f} req/s")
+    return {'label': label, 'requests': n, 'time': elapsed, 'throughput': n / elapsed}
+
+
+def run_benchmark(args, api_url):
+    client = QwenVLMClient(
+        use_api=True,
+        api_url=api_url,
+        query_cache=QueryParseCache(),
+        api_max_concurrency=args.concurrency,
+        rule_parse_threshold=args.rule_parse_threshold,
+        lazy_load=True
+    )
+    n = args.requests
+    results = []
+    
+    print("\n生成吞吐量:")
+    results.append(timed("顺序 generate", n, lambda: [
+        client.generate(make_messages(i), max_tokens=args.max_tokens) for i in range(n)
+    ]))
+    results.append(timed("线程池 generate_batch", n, lambda: client.generate_batch(
+        [make_messages(i) for i in range(n)], max_tokens=args.max_tokens
+    )))
+    
+    async def gather():
+        await asyncio.gather(*(
+            client.agenerate(make_messages(i), max_tokens=args.max_tokens) for i in range(n)
+        ))
+        await client.aclose()
+    
+    try:
+        results.append(timed("异步 agenerate", n, lambda: asyncio.run(gather())))
+    except ImportError as e:
+        print(f"  跳过异步测试: {e}")
+    
+    print("\n图像编码缓存（同一帧出现在所有请求中）:")
+    frame = (np.random.default_rng(0).random((720, 1280, 3)) * 255).astype(np.uint8)
+    results.append(timed("同帧 generate_batch", n, lambda: client.generate_batch(
+        [make_messages(i, frame) for i in range(n)], max_tokens=args.max_tokens
+    )))
+    print(f"  编码统计: {client.get_backend_stats()['image_encoder']}")
+    
+    print("\n查询解析缓存:")
+    queries = QUERIES * max(1, n // len(QUERIES))
+    results.append(timed("首次解析", len(queries), lambda: [client.analyze_query(q) for q in queries]))
+    results.append(timed("再次解析", len(queries), lambda: [client.analyze_query(q) for q in queries]))
+    print(f"  解析统计: {client.get_parse_stats()}")
+    
+    client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API模式并发与缓存基准测试（模拟vLLM服务器）')
+    parser.add_argument('--requests', type=int, default=64,
+                       help='每项测试的请求数')
+    parser.add_argument('--concurrency', type=int, default=8,
+                       help='客户端最大并发请求数')
+    parser.add_argument('--max_tokens', type=int, default=32,
+                       help='每次生成的token数')
+    parser.add_argument('--latency', type=float, default=0.05,
+                       help='模拟服务器的首token延迟（秒）')
+    parser.add_argument('--token_latency', type=float, default=0.002,
+                       help='模拟服务器每个输出片段的延迟（秒）')
+    parser.add_argument('--rule_parse_threshold', type=float, default=0.8,
+                       help='规则解析置信度阈值（设为1.1可强制所有查询走VLM）')
+    parser.add_argument('--api_url', type=str, default=None,
+                       help='使用已有的服务器（不启动模拟服务器）')
+    parser.add_argument('--output', type=str, default=None,
+                       help='结果JSON输出路径')
+    
+    args = parser.parse_args()
+    
+    print("=" * 70)
+    print("API模式并发与缓存基准测试")
+    print("=" * 70)
+    
+    process = None
+    if args.api_url:
+        api_url = args.api_url
+    else:
+        port = find_free_port()
+        process = start_server(args, port)
+        api_url = f"http://127.0.0.1:{port}/v1"
+        print(f"模拟服务器: {api_url} (延迟 {args.latency}s + {args.token_latency}s/片段)")
+    
+    try:
+        results = run_benchmark(args, api_url)
+        if process is not None:
+            server_stats = get_json(api_url.replace('/v1', '/stats'))
+            print(f"\n服务端统计: {server_stats}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    
+    print("=" * 70)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+回答解析微基准测试 - 比较逐关键词扫描、平铺的组合正则和trie结构的组合正则（KeywordMatcher）
+
+模拟离线批量处理大量已保存的VLM回答；也可以用 --input 读取实际的回答（JSONL）。
+先检查 CHECK_CASES 中的关系提取结果，模拟回答还会与生成时的关系对比准确率；
+有检查失败时以非零状态退出
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.query_parser import RuleBasedQueryParser
+from utils.response_parser import (
+    RESPONSE_RELATION_PHRASES, RELATION_PRIORITY, extract_relation, parse_grounding_response
+)
+
+
+# 平铺的组合正则（按长度降序的 a|b|c 选择分支），作为trie结构正则的对照
+FLAT_RELATION_PATTERN = re.compile(
+    r'\b(' + '|'.join(
+        re.escape(p) for p in sorted(RESPONSE_RELATION_PHRASES, key=len, reverse=True)
+    ) + r')\b'
+)
+
+# (回答, 期望的关系键)
+CHECK_CASES = [
+    ("In the image, the target cup is on the table", "on"),
+    ("Selected by confidence: the mug is above the shelf", "above"),
+    ("target: chair, located to the left", "left"),
+    ("the object is to the right", "right"),
+    ("Based on the image, the lamp is near the bed", "near"),
+    ("The cup is in front of the laptop", "front"),
+    ("The box is on the left side of the bed", "left"),
+    ("The pillow is underneath the blanket", "below"),
+    ("The content of the image is unclear", None),
+]
+
+
+OBJECTS = ['apple', 'table', 'chair', 'lamp', 'sofa', 'cup', 'laptop', 'book', 'shelf', 'pillow', 'bed']
+FILLER = [
+    'In the image, a room with several objects is shown.',
+    'Based on the visible context, the most likely match is described next.',
+    'There are also other items in the scene that do not match the query.',
+    'Selected by confidence among the candidates.',
+]
+# 生成回答时使用的关系短语（不含值为None的固定搭配）
+RESPONSE_PHRASES = [phrase for phrase, rel in RESPONSE_RELATION_PHRASES.items() if rel]
+
+
+def make_responses(n, seed=0):
+    """生成模拟的VLM回答，返回 (回答列表, 期望的关系键列表)"""
+    rng = random.Random(seed)
+    responses = []
+    expected = []
+    
+    for _ in range(n):
+        target, anchor = rng.sample(OBJECTS, 2)
+        lines = rng.sample(FILLER, rng.randint(1, 3))
+        lines.append(f"target: {target}")
+        lines.append(f"anchor: {anchor}")
+        phrase = rng.choice(RESPONSE_PHRASES)
+        expected.append(RESPONSE_RELATION_PHRASES[phrase])
+        lines.append(f"The {target} is {phrase} the {anchor}.")
+        if rng.random() < 0.5:
+            lines.append(f"bbox: [{rng.randint(0, 500)}, {rng.randint(0, 500)}, "
+                         f"{rng.randint(500, 1000)}, {rng.randint(500, 1000)}]")
+        responses.append("\n".join(lines))
+    
+    return responses, expected
+
+
+def load_responses(path):
+    """读取JSONL中的回答（字段 raw_response / response / text）"""
+    responses = []
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            for field in ('raw_response', 'response', 'text'):
+                if isinstance(record.get(field), str):
+                    responses.append(record[field])
+                    break
+    return responses
+
+
+def legacy_parse(response):
+    """旧实现：每次调用重建关键词列表、按模式字符串搜索、逐关键词扫描小写文本"""
+    result = {"target_object": None, "anchor_object": None, "spatial_relation": None, "bounding_box": None}
+    
+    target_match = re.search(r'target[:\s]+([a-zA-Z\s]+)', response, re.IGNORECASE)
+    if target_match:
+        result["target_object"] = target_match.group(1).strip()
+    
+    anchor_match = re.search(r'anchor[:\s]+([a-zA-Z\s]+)', response, re.IGNORECASE)
+    if anchor_match:
+        result["anchor_object"] = anchor_match.group(1).strip()
+    
+    relations = ['on', 'above', 'below', 'left', 'right', 'near', 'inside', 'behind', 'front']
+    for rel in relations:
+        if rel in response.lower():
+            result["spatial_relation"] = rel
+            break
+    
+    bbox_match = re.search(r'\[(\d+\.?\d*),\s*(\d+\.?\d*),\s*(\d+\.?\d*),\s*(\d+\.?\d*)\]', response)
+    if bbox_match:
+        result["bounding_box"] = [float(x) for x in bbox_match.groups()]
+    
+    return result
+
+
+def legacy_relation(response):
+    for rel in ['on', 'above', 'below', 'left', 'right', 'near', 'inside', 'behind', 'front']:
+        if rel in response.lower():
+            return rel
+    return None
+
+
+def flat_relation(response):
+    found = {RESPONSE_RELATION_PHRASES[phrase] for phrase in FLAT_RELATION_PATTERN.findall(response.lower())}
+    return next((rel for rel in RELATION_PRIORITY if rel in found), None)
+
+
+def check_cases():
+    """检查固定用例，返回失败数"""
+    failures = 0
+    for response, expected in CHECK_CASES:
+        relation = extract_relation(response)
+        ok = relation == expected
+        failures += not ok
+        print(f"  {'✓' if ok else '✗'} {response!r} -> {relation} (期望 {expected})")
+    return failures
+
+
+def bench(label, fn, items, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    
+    per_item = best / len(items) * 1e6
+    print(f"  {label:28s} {best * 1000:9.1f} ms  {per_item:7.2f} µs/条  {len(items) / best:10.0f} 条/s")
+    return {'label': label, 'time': best, 'us_per_item': per_item}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='回答解析微基准测试')
+    parser.add_argument('--num', type=int, default=20000,
+                       help='模拟回答数量')
+    parser.add_argument('--input', type=str, default=None,
+                       help='已保存回答的JSONL文件（替代模拟回答）')
+    parser.add_argument('--repeats', type=int, default=3,
+                       help='重复次数（取最快一次）')
+    parser.add_argument('--output', type=str, default=None,
+                       help='结果JSON输出路径')
+    
+    args = parser.parse_args()
+    
+    expected = None
+    if args.input:
+        responses = load_responses(args.input)
+    else:
+        responses, expected = make_responses(args.num)
+    if not responses:
+        print("没有可解析的回答")
+        return
+    
+    print("=" * 70)
+    print(f"回答解析微基准测试: {len(responses)} 条回答")
+    print("=" * 70)
+    
+    print("\n关系提取检查:")
+    failures = check_cases()
+    
+    results = []
+    
+    print("\n空间关系提取:")
+    results.append(bench("逐关键词 in lower()", legacy_relation, responses, args.repeats))
+    results.append(bench("平铺组合正则", flat_relation, responses, args.repeats))
+    results.append(bench("trie组合正则", extract_relation, responses, args.repeats))
+    
+    print("\n完整回答解析:")
+    results.append(bench("旧实现", legacy_parse, responses, args.repeats))
+    results.append(bench("parse_grounding_response", parse_grounding_response, responses, args.repeats))
+    
+    disagreements = sum(
+        1 for r in responses if extract_relation(r) != flat_relation(r)
+    )
+    print(f"\n平铺与trie组合正则结果不一致: {disagreements} 条")
+    failures += disagreements
+    
+    if expected is not None:
+        # 逐关键词子串扫描会把 "front"、"content" 等词中的 "on" 误判为关系
+        for label, fn in (("旧实现", legacy_relation), ("新实现", extract_relation)):
+            wrong = sum(1 for r, rel in zip(responses, expected) if fn(r) != rel)
+            print(f"{label}关系提取错误: {wrong}/{len(responses)} 条")
+            if fn is extract_relation:
+                failures += wrong
+    
+    print("\n查询规则解析:")
+    queries = [f"the red {a} on the wooden {b}" for a in OBJECTS for b in OBJECTS if a != b]
+    rule_parser = RuleBasedQueryParser()
+    results.append(bench("RuleBasedQueryParser.parse", rule_parser.parse, queries * 20, args.repeats))
+    
+    print("=" * 70)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"结果已保存: {args.output}")
+    
+    if failures:
+        print(f"❌ {failures} 项检查失败")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
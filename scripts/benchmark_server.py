@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+常驻服务基准测试 - 多个并发客户端向 qwenground_server.py 发送查询
+
+先构建（或加载）一次场景，再由 --clients 个线程各发送 --requests 个查询，
+报告客户端观测的延迟分位数、吞吐量以及服务端 /stats
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import http.client
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+QUERIES = [
+    "the red apple on the table",
+    "the chair near the window",
+    "the lamp to the left of the bed",
+    "a cup behind the laptop",
+    "the book on the shelf",
+    "the pillow on the sofa",
+]
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """通过Unix socket连接的HTTP客户端"""
+    
+    def __init__(self, socket_path, timeout=600):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+    
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class ServerClient:
+    """每个线程一个连接（HTTP/1.1 keep-alive）"""
+    
+    def __init__(self, url=None, unix_socket=None, timeout=600):
+        self.url = url
+        self.unix_socket = unix_socket
+        self.timeout = timeout
+        self._local = threading.local()
+    
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.unix_socket:
+                conn = UnixHTTPConnection(self.unix_socket, timeout=self.timeout)
+            else:
+                host = self.url.split("://", 1)[-1].rstrip("/")
+                conn = http.client.HTTPConnection(host, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+    
+    def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        conn = self._connection()
+        
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = json.loads(response.read())
+        except (http.client.HTTPException, OSError):
+            # 连接被服务端关闭时重连一次
+            conn.close()
+            self._local.conn = None
+            conn = self._connection()
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = json.loads(response.read())
+        
+        if response.status >= 400:
+            raise RuntimeError(f"{method} {path} -> {response.status}: {data.get('error')}")
+        return data
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run_clients(client, scene_id, queries, num_clients, num_requests):
+    """并发发送查询，返回每个请求的延迟"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    
+    def worker(worker_id):
+        for i in range(num_requests):
+            query = queries[(worker_id * num_requests + i) % len(queries)]
+            start = time.time()
+            try:
+                client.request("POST", "/query", {"scene_id": scene_id, "query": query})
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.time() - start)
+    
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=num_clients) as executor:
+        list(executor.map(worker, range(num_clients)))
+    return latencies, errors, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='QwenGround常驻服务基准测试')
+    parser.add_argument('--url', type=str, default='http://127.0.0.1:8080',
+                       help='服务地址')
+    parser.add_argument('--unix_socket', type=str, default=None,
+                       help='Unix socket路径（替代 --url）')
+    parser.add_argument('--input_path', type=str, required=True,
+                       help='场景输入（视频文件、图像文件夹或保存的场景目录）')
+    parser.add_argument('--input_type', type=str, choices=['video', 'images'], default='video',
+                       help='输入类型')
+    parser.add_argument('--queries_file', type=str, default=None,
+                       help='查询文件（每行一个查询），默认使用内置查询')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 8],
+                       help='并发客户端数（可指定多个）')
+    parser.add_argument('--requests', type=int, default=8,
+                       help='每个客户端发送的查询数')
+    parser.add_argument('--output', type=str, default=None,
+                       help='结果JSON输出路径')
+    
+    args = parser.parse_args()
+    
+    queries = QUERIES
+    if args.queries_file:
+        with open(args.queries_file, encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    
+    client = ServerClient(url=args.url, unix_socket=args.unix_socket)
+    
+    print("=" * 70)
+    print(f"常驻服务基准测试: {args.unix_socket or args.url}")
+    print("=" * 70)
+    
+    start = time.time()
+    scene = client.request("POST", "/scenes", {
+        "input_path": os.path.abspath(args.input_path),
+        "input_type": args.input_type
+    })
+    print(f"\n场景 {scene['scene_id']}: {scene['num_frames']} 帧, {scene['num_objects']} 物体, "
+          f"来源 {scene['source']}, 构建 {scene['build_time']}s, 请求 {time.time() - start:.2f}s")
+    
+    start = time.time()
+    client.request("POST", "/scenes", {
+        "input_path": os.path.abspath(args.input_path),
+        "input_type": args.input_type
+    })
+    print(f"再次请求同一场景: {time.time() - start:.3f}s")
+    
+    results = []
+    print(f"\n{'客户端':>6s} {'请求':>6s} {'失败':>6s} {'p50':>9s} {'p95':>9s} {'最大':>9s} {'吞吐量':>12s}")
+    for num_clients in args.clients:
+        latencies, errors, elapsed = run_clients(
+            client, scene['scene_id'], queries, num_clients, args.requests
+        )
+        if not latencies:
+            print(f"{num_clients:6d} 全部失败: {errors[:1]}")
+            continue
+        
+        row = {
+            'clients': num_clients,
+            'requests': len(latencies),
+            'errors': len(errors),
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'max': max(latencies),
+            'throughput': len(latencies) / elapsed
+        }
+        results.append(row)
+        print(f"{num_clients:6d} {row['requests']:6d} {row['errors']:6d} {row['p50']:8.3f}s "
+              f"{row['p95']:8.3f}s {row['max']:8.3f}s {row['throughput']:8.2f} q/s")
+    
+    stats = client.request("GET", "/stats")
+    print(f"\n服务端统计:")
+    print(json.dumps(stats, indent=2, ensure_ascii=False))
+    print("=" * 70)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'scene': scene, 'results': results, 'server_stats': stats}, f, indent=2)
+        print(f"结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
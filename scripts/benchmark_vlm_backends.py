@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+本地VLM精度/量化模式基准测试 - 比较加载时间、峰值内存和生成速度（tokens/s）
+
+每种模式在独立子进程中运行，保证峰值内存互不影响
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+# 模式名称 -> (dtype, quantization)
+MODES = {
+    'fp32': ('float32', None),
+    'bf16': ('bfloat16', None),
+    'fp16': ('float16', None),
+    'int8_dynamic': ('float32', 'int8_dynamic'),
+    'int8_weight_only': ('bfloat16', 'int8_weight_only'),
+    'int4_weight_only': ('bfloat16', 'int4_weight_only'),
+}
+
+PROMPT = "Describe the objects on the table and where they are located in the room."
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux上单位为KB，macOS上为字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_worker(args):
+    """子进程：加载一种模式并测量生成速度，结果以JSON输出到stdout"""
+    import torch
+    from utils.transformers_backend import TransformersBackend
+    
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    
+    dtype, quantization = MODES[args.mode]
+    
+    start = time.time()
+    backend = TransformersBackend(
+        model_name=args.model,
+        device=args.device,
+        dtype=dtype,
+        quantization=quantization
+    )
+    backend.load()
+    load_time = time.time() - start
+    
+    messages = [{"role": "user", "content": [{"type": "text", "text": PROMPT}]}]
+    inputs, image_keys = backend._prepare_local_inputs([messages])
+    prompt_length = inputs["input_ids"].shape[1]
+    
+    def generate(num_tokens):
+        # 固定生成长度，使各模式的token数可比
+        with backend._model_lock:
+            output = backend._run_model_generate(
+                inputs, image_keys,
+                max_new_tokens=num_tokens,
+                min_new_tokens=num_tokens,
+                do_sample=False
+            )
+        return output.shape[1] - prompt_length
+    
+    generate(4)  # 预热
+    
+    times, tokens = [], 0
+    for _ in range(args.repeats):
+        if args.device == 'cuda':
+            torch.cuda.synchronize()
+        start = time.time()
+        tokens += generate(args.max_tokens)
+        if args.device == 'cuda':
+            torch.cuda.synchronize()
+        times.append(time.time() - start)
+    
+    result = {
+        'mode': args.mode,
+        'load_time': load_time,
+        'peak_rss_mb': peak_rss_mb(),
+        'tokens_per_sec': tokens / sum(times),
+        'avg_latency': sum(times) / len(times),
+    }
+    if args.device == 'cuda':
+        result['peak_cuda_mb'] = torch.cuda.max_memory_allocated() / (1024 * 1024)
+    
+    print(json.dumps(result))
+
+
+def run_mode(args, mode):
+    """在子进程中运行一种模式"""
+    cmd = [
+        sys.executable, os.path.abspath(__file__), '--worker',
+        '--mode', mode,
+        '--model', args.model,
+        '--device', args.device,
+        '--max_tokens', str(args.max_tokens),
+        '--repeats', str(args.repeats),
+        '--threads', str(args.threads),
+    ]
+    
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=args.timeout)
+    
+    if result.returncode != 0:
+        error = result.stderr.strip().split('\n')[-1] if result.stderr else 'Unknown error'
+        return {'mode': mode, 'error': error}
+    
+    return json.loads(result.stdout.strip().split('\n')[-1])
+
+
+def print_results(results):
+    print("\n" + "=" * 70)
+    print(f"{'模式':18s} {'加载(s)':>9s} {'峰值RSS(MB)':>12s} {'显存(MB)':>10s} {'tokens/s':>9s}")
+    print("=" * 70)
+    
+    for r in results:
+        if 'error' in r:
+            print(f"{r['mode']:18s} 失败: {r['error']}")
+            continue
+        cuda = f"{r['peak_cuda_mb']:.0f}" if 'peak_cuda_mb' in r else '-'
+        print(
+            f"{r['mode']:18s} {r['load_time']:9.1f} {r['peak_rss_mb']:12.0f} "
+            f"{cuda:>10s} {r['tokens_per_sec']:9.2f}"
+        )
+    
+    print("=" * 70)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地VLM精度/量化模式基准测试')
+    parser.add_argument('--model', type=str, default='Qwen/Qwen2-VL-2B-Instruct',
+                       help='模型名称或路径')
+    parser.add_argument('--device', type=str, default='cpu', choices=['cpu', 'cuda'],
+                       help='运行设备')
+    parser.add_argument('--modes', type=str, nargs='+', default=['fp32', 'bf16', 'int8_dynamic'],
+                       choices=list(MODES.keys()),
+                       help='要测试的模式')
+    parser.add_argument('--max_tokens', type=int, default=64,
+                       help='每次生成的token数')
+    parser.add_argument('--repeats', type=int, default=3,
+                       help='每种模式的重复次数')
+    parser.add_argument('--threads', type=int, default=0,
+                       help='torch线程数（0表示默认）')
+    parser.add_argument('--timeout', type=int, default=3600,
+                       help='每种模式的超时时间（秒）')
+    parser.add_argument('--output', type=str, default=None,
+                       help='结果JSON输出路径')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--mode', type=str, choices=list(MODES.keys()), help=argparse.SUPPRESS)
+    
+    args = parser.parse_args()
+    
+    if args.worker:
+        run_worker(args)
+        return
+    
+    print("=" * 70)
+    print(f"VLM基准测试: {args.model} ({args.device})")
+    print("=" * 70)
+    
+    results = []
+    for mode in args.modes:
+        print(f"  运行 {mode} ...")
+        try:
+            results.append(run_mode(args, mode))
+        except subprocess.TimeoutExpired:
+            results.append({'mode': mode, 'error': '超时'})
+    
+    print_results(results)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
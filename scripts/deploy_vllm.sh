@@ -57,6 +57,7 @@ python -m vllm.entrypoints.openai.api_server \
     --dtype auto \
     ${API_KEY:+--api-key "$API_KEY"} \
     --max-model-len 4096 \
+    --enable-prefix-caching \
     --trust-remote-code
 
 # 注意：服务器会持续运行直到手动停止（Ctrl+C）
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+模拟vLLM服务器 - 本地替代 /v1/chat/completions 接口
+
+返回确定性回答（与 MockBackend 相同），可配置延迟和失败率，
+用于在没有GPU和网络的环境中端到端测试API模式的并发、重试和缓存
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.vlm_backend import mock_response, split_chunks
+
+
+class MockVLLMHandler(BaseHTTPRequestHandler):
+    """OpenAI兼容接口的请求处理"""
+    
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+    
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/v1/models':
+            self._send_json(200, {'object': 'list', 'data': [{'id': self.server.model_name, 'object': 'model'}]})
+        elif self.path == '/stats':
+            self._send_json(200, self.server.get_stats())
+        else:
+            self._send_json(404, {'error': f'未知路径: {self.path}'})
+    
+    def do_POST(self):
+        if self.path != '/v1/chat/completions':
+            self._send_json(404, {'error': f'未知路径: {self.path}'})
+            return
+        
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length))
+        except ValueError:
+            self._send_json(400, {'error': '请求体不是合法的JSON'})
+            return
+        
+        self.server.request_started(length)
+        try:
+            if random.random() < self.server.fail_rate:
+                self._send_json(503, {'error': '模拟的服务端错误'})
+                return
+            
+            text = mock_response(payload.get('messages', []))
+            chunks = split_chunks(text, payload.get('max_tokens', 512))
+            
+            time.sleep(self.server.latency)
+            
+            if payload.get('stream'):
+                self._stream(chunks)
+            else:
+                time.sleep(self.server.token_latency * len(chunks))
+                self._send_json(200, {
+                    'id': 'mock',
+                    'object': 'chat.completion',
+                    'model': payload.get('model', self.server.model_name),
+                    'choices': [{
+                        'index': 0,
+                        'message': {'role': 'assistant', 'content': ''.join(chunks)},
+                        'finish_reason': 'stop'
+                    }],
+                    'usage': {'completion_tokens': len(chunks)}
+                })
+        finally:
+            self.server.request_finished()
+    
+    def _stream(self, chunks):
+        """以SSE格式逐片段返回（写完后关闭连接）"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        
+        try:
+            for chunk in chunks:
+                time.sleep(self.server.token_latency)
+                data = {'choices': [{'index': 0, 'delta': {'content': chunk}}]}
+                self.wfile.write(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前断开（如JSON已完整）
+            pass
+
+
+class MockVLLMServer(ThreadingHTTPServer):
+    """多线程模拟服务器，统计请求数和最大并发数"""
+    
+    daemon_threads = True
+    
+    def __init__(self, address, model_name='mock', latency=0.0, token_latency=0.0,
+                 fail_rate=0.0, verbose=False):
+        super().__init__(address, MockVLLMHandler)
+        self.model_name = model_name
+        self.latency = latency
+        self.token_latency = token_latency
+        self.fail_rate = fail_rate
+        self.verbose = verbose
+        
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'in_flight': 0, 'max_in_flight': 0, 'bytes_received': 0}
+    
+    def request_started(self, size):
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['bytes_received'] += size
+            self.stats['in_flight'] += 1
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self.stats['in_flight'])
+    
+    def request_finished(self):
+        with self._lock:
+            self.stats['in_flight'] -= 1
+    
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟vLLM服务器（OpenAI兼容接口）')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                       help='监听地址')
+    parser.add_argument('--port', type=int, default=8000,
+                       help='监听端口')
+    parser.add_argument('--model', type=str, default='Qwen/Qwen2-VL-7B-Instruct',
+                       help='返回的模型名称')
+    parser.add_argument('--latency', type=float, default=0.05,
+                       help='每个请求的首token延迟（秒）')
+    parser.add_argument('--token_latency', type=float, default=0.002,
+                       help='每个输出片段的延迟（秒）')
+    parser.add_argument('--fail_rate', type=float, default=0.0,
+                       help='返回503的概率（测试重试）')
+    parser.add_argument('--verbose', action='store_true',
+                       help='输出每个请求的日志')
+    
+    args = parser.parse_args()
+    
+    server = MockVLLMServer(
+        (args.host, args.port),
+        model_name=args.model,
+        latency=args.latency,
+        token_latency=args.token_latency,
+        fail_rate=args.fail_rate,
+        verbose=args.verbose
+    )
+    
+    print(f"模拟vLLM服务器: http://{args.host}:{args.port}/v1")
+    print(f"  延迟: {args.latency}s + {args.token_latency}s/片段, 失败率: {args.fail_rate}")
+    
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
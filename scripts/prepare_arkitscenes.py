@@ -324,6 +324,45 @@ class ARKitScenesPreparator:
         os.chmod(test_script, 0o755)
         logger.info(f"\n✓ 生成测试脚本: {test_script}")
         logger.info(f"  运行方式: cd {self.output_dir} && ./run_tests.sh")
+        
+        self.generate_batch_manifest(scenes_metadata)
+    
+    def generate_batch_manifest(self, scenes_metadata: List[Dict[str, Any]]):
+        """
+        生成批量运行清单和脚本（scripts/run_batch.py 多进程处理所有场景）
+        
+        Args:
+            scenes_metadata: 场景元数据列表
+        """
+        manifest_file = self.output_dir / "manifest.jsonl"
+        
+        with open(manifest_file, 'w') as f:
+            for metadata in scenes_metadata:
+                f.write(json.dumps({
+                    'scene_id': metadata['video_id'],
+                    'input_path': metadata['images_dir'],
+                    'input_type': 'images',
+                    'queries': metadata['test_queries']
+                }) + "\n")
+        
+        batch_script = self.output_dir / "run_batch.sh"
+        
+        with open(batch_script, 'w') as f:
+            f.write("#!/bin/bash\n\n")
+            f.write("# ARKitScenes批量测试脚本（多进程，每个工作进程只加载一次模型）\n")
+            f.write("# 自动生成，WORKERS 默认使用4个工作进程\n\n")
+            f.write("QWENGROUND_DIR=\"../..\"  # QwenGround项目目录\n")
+            f.write("WORKERS=${WORKERS:-4}\n\n")
+            f.write("python $QWENGROUND_DIR/scripts/run_batch.py \\\n")
+            f.write("    --manifest manifest.jsonl \\\n")
+            f.write("    --output_dir ./batch_outputs \\\n")
+            f.write("    --workers $WORKERS \\\n")
+            f.write("    --device cpu \\\n")
+            f.write("    --resume \"$@\"\n")
+        
+        os.chmod(batch_script, 0o755)
+        logger.info(f"✓ 生成批量运行清单: {manifest_file}")
+        logger.info(f"  运行方式: cd {self.output_dir} && WORKERS=4 ./run_batch.sh")
 
 
 def main():
@@ -414,7 +453,8 @@ def main():
     🚀 下一步:
        1. 查看处理后的数据: ls {args.output_dir}/processed/
        2. 运行测试脚本: cd {args.output_dir} && ./run_tests.sh
-       3. 或手动运行单个测试
+       3. 多进程批量运行: cd {args.output_dir} && WORKERS=4 ./run_batch.sh
+       4. 或手动运行单个测试
     
     📖 示例命令:
        python qwenground_main.py \\
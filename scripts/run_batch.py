@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+数据集批量运行 - 多进程处理场景清单
+
+每个工作进程在启动时加载一次模型（QwenGroundSystem），之后从任务队列中逐个
+领取场景：构建场景一次，批量定位该场景的所有查询。所有结果合并写入 results.jsonl
+（每行一个查询），每个场景的详细结果保存在 output_dir/<scene_id>/ 下。
+
+清单格式（JSONL，每行一个场景；也支持JSON列表）:
+    {"scene_id": "41069025", "input_path": "processed/41069025/images",
+     "input_type": "images", "queries": ["the chair near the table", ...]}
+相对路径相对于清单文件所在目录。省略 scene_id 时由相对路径生成
+（processed/41069025/images -> processed_41069025_images），场景ID不能重复。
+
+使用方法:
+    python scripts/run_batch.py --manifest data/arkitscenes_processed/manifest.jsonl \
+        --output_dir ./outputs/arkitscenes --workers 4 --device cpu
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import multiprocessing as mp
+from pathlib import Path
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# 限制每个工作进程的数学库线程数，避免 workers × 核数 的线程超额订阅；
+# 需在导入torch/numpy之前设置，子进程继承这些环境变量
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]
+
+# 工作进程内的全局状态（由 init_worker 初始化）
+_system = None
+_worker_id = None
+_options = None
+_init_error = None  # 初始化失败时的错误信息，由 process_scene 传回主进程
+
+
+def default_scene_id(input_path, manifest_dir, index):
+    """
+    由输入相对于清单目录的路径生成场景ID
+    
+    只用最后一级名称会让 processed/<id>/images 这类布局的所有场景都得到 "images"
+    """
+    relative = Path(os.path.relpath(input_path, manifest_dir))
+    if input_path.is_file():
+        relative = relative.with_suffix('')
+    parts = [part for part in relative.parts if part not in ('.', '..')]
+    return "_".join(parts) or f"scene_{index:04d}"
+
+
+def load_manifest(path):
+    """
+    读取场景清单，相对路径转换为相对于清单目录的绝对路径
+    
+    Raises:
+        ValueError: 场景ID重复（输出目录和 --resume 都以场景ID区分场景）
+    """
+    path = Path(path)
+    with open(path, encoding='utf-8') as f:
+        if path.suffix == '.json':
+            scenes = json.load(f)
+        else:
+            scenes = [json.loads(line) for line in f if line.strip() and not line.startswith('#')]
+    
+    manifest_dir = path.parent.resolve()
+    for i, scene in enumerate(scenes):
+        input_path = (manifest_dir / scene['input_path']).resolve()
+        scene.setdefault('scene_id', default_scene_id(input_path, manifest_dir, i))
+        scene['scene_id'] = str(scene['scene_id'])
+        scene.setdefault('input_type', 'video')
+        scene['input_path'] = str(input_path)
+    
+    counts = Counter(scene['scene_id'] for scene in scenes)
+    duplicates = sorted(scene_id for scene_id, count in counts.items() if count > 1)
+    if duplicates:
+        raise ValueError(f"清单中的场景ID重复: {', '.join(duplicates)}")
+    return scenes
+
+
+def load_completed(results_file):
+    """
+    读取已有结果中成功处理的场景ID（用于 --resume）
+    
+    失败场景的结果行从文件中删除，这些场景会重新处理，不会产生重复的结果行
+    """
+    if not results_file.exists():
+        return set()
+    with open(results_file, encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    
+    completed = {line['scene_id'] for line in lines if line.get('scene_success')}
+    with open(results_file, 'w', encoding='utf-8') as f:
+        for line in lines:
+            if line['scene_id'] in completed:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return completed
+
+
+def init_worker(worker_counter, options):
+    """
+    工作进程初始化：分配工作进程编号、设置线程数并加载一次模型
+    
+    初始化的异常不能抛出：进程池会不断重启同样失败的工作进程，任务永远不会完成。
+    错误保存在 _init_error 中，由第一个任务传回主进程后终止整个运行
+    """
+    global _worker_id, _options, _init_error
+    
+    with worker_counter.get_lock():
+        _worker_id = worker_counter.value
+        worker_counter.value += 1
+    _options = options
+    
+    try:
+        _load_worker(options)
+    except Exception:
+        _init_error = traceback.format_exc()
+
+
+def _load_worker(options):
+    """配置工作进程日志、设置线程数并加载模型"""
+    global _system
+    import logging
+    
+    # 详细日志写入每个工作进程自己的文件，控制台只输出警告
+    log_dir = Path(options['output_dir']) / "logs"
+    log_dir.mkdir(parents=True, exist_ok=True)
+    formatter = logging.Formatter(
+        f'%(asctime)s - worker {_worker_id} - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    root_logger = logging.getLogger()
+    root_logger.setLevel(getattr(logging, options['log_level'].upper(), logging.INFO))
+    file_handler = logging.FileHandler(log_dir / f"worker_{_worker_id:02d}.log", encoding='utf-8')
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler(sys.stderr)
+    console_handler.setFormatter(formatter)
+    console_handler.setLevel(logging.WARNING)
+    root_logger.addHandler(file_handler)
+    root_logger.addHandler(console_handler)
+    
+    import importlib.util
+    if importlib.util.find_spec("torch") is not None:
+        import torch
+        torch.set_num_threads(options['threads_per_worker'])
+    
+    from qwenground_system import QwenGroundSystem
+    from utils.helpers import load_config
+    
+    start = time.time()
+    config = load_config(options['config']) if options['config'] else None
+    _system = QwenGroundSystem(
+        model_name=options['model_name'],
+        device=options['device'],
+        use_api=options['use_api'],
+        api_url=options['api_url'],
+        api_key=options['api_key'],
+        config=config,
+        scene_cache_dir=options['scene_cache_dir']
+    )
+    # 本地VLM默认延迟加载，这里提前加载，避免第一个场景承担加载时间
+    _system.vlm_client.ensure_model()
+    print(f"[worker {_worker_id}] 模型加载完成 (pid {os.getpid()}, "
+          f"{options['threads_per_worker']} 线程, 耗时 {time.time() - start:.1f}s)", flush=True)
+
+
+def process_scene(scene):
+    """在当前工作进程中处理一个场景的全部查询，返回可写入JSONL的记录"""
+    if _init_error is not None:
+        return {"scene_id": scene['scene_id'], "worker": _worker_id, "init_error": _init_error}
+    
+    start = time.time()
+    output_dir = Path(_options['output_dir']) / scene['scene_id']
+    queries = scene.get('queries', [])
+    
+    try:
+        batch_result = _system.run_batch(
+            scene['input_path'],
+            queries,
+            input_type=scene['input_type'],
+            output_dir=str(output_dir),
+            visualize=_options['visualize'],
+            save_intermediate=_options['save_intermediate']
+        )
+    except Exception as e:
+        # 单个场景失败不影响工作进程继续领取后续场景
+        batch_result = {
+            "success": False,
+            "error": str(e),
+            "num_queries": len(queries),
+            "results": [{"success": False, "query": query, "error": str(e)} for query in queries]
+        }
+    
+    return {
+        "scene_id": scene['scene_id'],
+        "worker": _worker_id,
+        "success": batch_result['success'],
+        "error": batch_result.get('error'),
+        "num_queries": len(queries),
+        "num_succeeded": batch_result.get('num_succeeded', 0),
+        "scene_build_time": batch_result.get('metadata', {}).get('scene_build_time'),
+        "total_time": round(time.time() - start, 2),
+        "results": batch_result['results']
+    }
+
+
+def write_scene_results(f, record):
+    """
+    每个查询写入一行（附带场景ID、场景是否成功和工作进程编号）
+    
+    没有查询的场景写入一行场景记录（query_index 为 None），--resume 才能识别它已处理过
+    """
+    if not record['results']:
+        line = {
+            "scene_id": record['scene_id'],
+            "scene_success": record['success'],
+            "query_index": None,
+            "worker": record['worker'],
+            "success": record['success'],
+            "error": record['error']
+        }
+        f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    
+    for i, result in enumerate(record['results']):
+        line = {
+            "scene_id": record['scene_id'],
+            "scene_success": record['success'],
+            "query_index": i,
+            "worker": record['worker']
+        }
+        line.update(result)
+        f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    f.flush()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='QwenGround数据集批量运行（多进程）')
+    parser.add_argument('--manifest', type=str, required=True,
+                       help='场景清单（JSONL，每行 scene_id/input_path/input_type/queries）')
+    parser.add_argument('--output_dir', type=str, default='./outputs/batch',
+                       help='输出目录')
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                       help='工作进程数')
+    parser.add_argument('--threads_per_worker', type=int, default=None,
+                       help='每个工作进程的torch/BLAS线程数（默认 CPU核数 / 工作进程数）')
+    parser.add_argument('--resume', action='store_true',
+                       help='跳过 results.jsonl 中已成功处理的场景（失败的场景重新处理）')
+    parser.add_argument('--visualize', action='store_true',
+                       help='为每个查询生成可视化（默认关闭）')
+    parser.add_argument('--save_intermediate', action='store_true',
+                       help='保存中间结果')
+    parser.add_argument('--model_name', type=str, default='Qwen/Qwen2-VL-7B-Instruct',
+                       help='VLM模型名称')
+    parser.add_argument('--device', type=str, default='cpu',
+                       help='计算设备 (cuda/cpu)')
+    parser.add_argument('--use_api', action='store_true',
+                       help='使用API模式（所有工作进程共享同一个VLM服务）')
+    parser.add_argument('--api_url', type=str, default='http://localhost:8000/v1',
+                       help='API服务器地址')
+    parser.add_argument('--api_key', type=str, default=None,
+                       help='API密钥')
+    parser.add_argument('--config', type=str, default=None,
+                       help='配置文件路径')
+    parser.add_argument('--scene_cache_dir', type=str, default=None,
+                       help='场景缓存目录（工作进程之间共享）')
+    parser.add_argument('--log_level', type=str, default='INFO',
+                       help='工作进程日志级别（日志写入 output_dir/logs/）')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    
+    try:
+        scenes = load_manifest(args.manifest)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    results_file = output_dir / "results.jsonl"
+    
+    if args.resume:
+        completed = load_completed(results_file)
+        scenes = [scene for scene in scenes if scene['scene_id'] not in completed]
+        print(f"跳过 {len(completed)} 个已成功处理的场景")
+    elif results_file.exists():
+        results_file.unlink()
+    
+    if not scenes:
+        print("没有需要处理的场景")
+        return
+    
+    workers = max(1, min(args.workers, len(scenes)))
+    threads_per_worker = args.threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads_per_worker)
+    
+    options = {
+        'output_dir': str(output_dir),
+        'threads_per_worker': threads_per_worker,
+        'visualize': args.visualize,
+        'save_intermediate': args.save_intermediate,
+        'model_name': args.model_name,
+        'device': args.device,
+        'use_api': args.use_api,
+        'api_url': args.api_url,
+        'api_key': args.api_key,
+        'config': args.config,
+        'scene_cache_dir': args.scene_cache_dir,
+        'log_level': args.log_level
+    }
+    
+    print("=" * 70)
+    print(f"批量运行: {len(scenes)} 个场景, {sum(len(s.get('queries', [])) for s in scenes)} 个查询")
+    print(f"工作进程: {workers} × {threads_per_worker} 线程, 输出: {output_dir}")
+    print("=" * 70)
+    
+    # spawn：工作进程不继承父进程的线程和CUDA状态
+    ctx = mp.get_context("spawn")
+    worker_counter = ctx.Value('i', 0)
+    worker_stats = {}
+    num_done = 0
+    start = time.time()
+    
+    with ctx.Pool(workers, initializer=init_worker, initargs=(worker_counter, options)) as pool, \
+            open(results_file, 'a', encoding='utf-8') as f:
+        # 每次只派发一个场景，空闲的工作进程立即领取下一个（场景耗时差异很大）
+        for record in pool.imap_unordered(process_scene, scenes, chunksize=1):
+            if record.get('init_error'):
+                print(f"\n❌ worker {record['worker']} 初始化失败，终止运行:\n{record['init_error']}", flush=True)
+                pool.terminate()
+                sys.exit(1)
+            
+            write_scene_results(f, record)
+            num_done += 1
+            
+            stats = worker_stats.setdefault(record['worker'], {'scenes': 0, 'queries': 0, 'succeeded': 0, 'busy_time': 0.0})
+            stats['scenes'] += 1
+            stats['queries'] += record['num_queries']
+            stats['succeeded'] += record['num_succeeded']
+            stats['busy_time'] += record['total_time']
+            
+            if record['success']:
+                status = f"构建 {record['scene_build_time']}s ✓"
+            else:
+                status = f"✗ {record['error']}"
+            print(f"[{num_done}/{len(scenes)}] worker {record['worker']} {record['scene_id']}: "
+                  f"{record['num_succeeded']}/{record['num_queries']} 查询成功, "
+                  f"总计 {record['total_time']}s, {status}", flush=True)
+    
+    elapsed = time.time() - start
+    total_queries = sum(s['queries'] for s in worker_stats.values())
+    total_succeeded = sum(s['succeeded'] for s in worker_stats.values())
+    
+    print("\n" + "=" * 70)
+    print(f"{'工作进程':>8s} {'场景':>6s} {'查询':>6s} {'成功':>6s} {'忙碌时间':>10s}")
+    for worker_id in sorted(worker_stats):
+        stats = worker_stats[worker_id]
+        print(f"{worker_id:8d} {stats['scenes']:6d} {stats['queries']:6d} {stats['succeeded']:6d} "
+              f"{stats['busy_time']:9.1f}s")
+    print(f"\n完成 {num_done} 个场景, {total_succeeded}/{total_queries} 个查询成功, "
+          f"耗时 {elapsed:.1f}s ({num_done / elapsed * 60:.2f} 场景/分钟)")
+    print(f"结果: {results_file}")
+    print("=" * 70)
+    
+    summary = {
+        'manifest': str(Path(args.manifest).resolve()),
+        'num_scenes': num_done,
+        'num_queries': total_queries,
+        'num_succeeded': total_succeeded,
+        'workers': workers,
+        'threads_per_worker': threads_per_worker,
+        'elapsed': round(elapsed, 2),
+        'worker_stats': worker_stats
+    }
+    with open(output_dir / "batch_summary.json", 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
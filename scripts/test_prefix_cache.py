@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+测试本地后端的前缀KV缓存
+
+先在不使用前缀缓存的情况下得到纯文本查询解析的参考输出，再依次执行图像调用、
+批量调用，之后用前缀缓存解析同一查询：输出应与参考一致，且前缀缓存没有被禁用。
+（Qwen2-VL从缓存继续生成时沿用上一次调用的M-RoPE位置偏移，图像调用之后位置编码会出错）
+
+使用方法:
+    python scripts/test_prefix_cache.py --model_name Qwen/Qwen2-VL-2B-Instruct --device cpu
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+DEFAULT_IMAGE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..',
+    'data', 'arkitscenes_test', 'processed', '48458663', 'images', 'frame_0000.jpg'
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测试本地后端的前缀KV缓存')
+    parser.add_argument('--model_name', type=str, default='Qwen/Qwen2-VL-2B-Instruct',
+                       help='VLM模型名称')
+    parser.add_argument('--device', type=str, default='cpu',
+                       help='计算设备 (cuda/cpu)')
+    parser.add_argument('--image', type=str, default=DEFAULT_IMAGE,
+                       help='图像调用使用的图像')
+    parser.add_argument('--query', type=str, default='the red cup on the wooden table',
+                       help='查询解析使用的查询')
+    
+    args = parser.parse_args()
+    
+    from PIL import Image
+    from utils.transformers_backend import TransformersBackend
+    from utils.vlm_client import QUERY_PARSE_PROMPT, QUERY_PARSE_PREFIX
+    
+    backend = TransformersBackend(
+        model_name=args.model_name,
+        device=args.device,
+        prefix_prompt=QUERY_PARSE_PREFIX
+    )
+    backend.load()
+    
+    text_messages = [{"role": "user", "content": QUERY_PARSE_PROMPT.format(query=args.query)}]
+    image_messages = [{"role": "user", "content": [
+        {"type": "image", "image": Image.open(args.image).convert("RGB")},
+        {"type": "text", "text": "Describe the objects in this image."}
+    ]}]
+    
+    print("=" * 70)
+    print(f"前缀KV缓存测试: {args.model_name} ({args.device})")
+    print("=" * 70)
+    
+    # 参考输出：不使用前缀缓存（贪婪解码）
+    backend.prefix_caching = False
+    reference = backend.generate(text_messages, max_tokens=64, temperature=0.0)
+    backend.prefix_caching = True
+    print(f"\n参考输出: {reference!r}")
+    
+    failures = 0
+    steps = [
+        ("图像调用之后", lambda: backend.generate(image_messages, max_tokens=16, temperature=0.0)),
+        ("批量调用之后", lambda: backend.generate_batch([text_messages, image_messages], max_tokens=16, temperature=0.0)),
+        ("连续文本调用", lambda: None),
+    ]
+    for label, previous_call in steps:
+        previous_call()
+        hits = backend.prefix_cache_hits
+        output = backend.generate(text_messages, max_tokens=64, temperature=0.0)
+        
+        ok = output == reference and backend.prefix_caching and backend.prefix_cache_hits == hits + 1
+        failures += not ok
+        print(f"{'✓' if ok else '✗'} {label}: {output!r} "
+              f"(前缀缓存 {'启用' if backend.prefix_caching else '已禁用'}, 命中 {backend.prefix_cache_hits})")
+    
+    print("=" * 70)
+    if failures:
+        print(f"❌ {failures} 项测试失败")
+        sys.exit(1)
+    print("✅ 前缀KV缓存输出与不使用缓存时一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,39 @@
 QwenGround Utilities
 """
 
-from .vlm_client import QwenVLMClient
-from .object_detector import ObjectDetector
-from .helpers import setup_logging, load_config, save_json, load_json, check_dependencies
+import importlib
+
+# 导出名称 -> 子模块；子模块在首次访问时才导入（PEP 562），
+# 例如 from utils.helpers import setup_logging 不会导入torch或PIL
+_LAZY_IMPORTS = {
+    'QwenVLMClient': 'vlm_client',
+    'QueryAnalysis': 'vlm_client',
+    'VLMBackend': 'vlm_backend',
+    'OpenAICompatibleBackend': 'vlm_backend',
+    'MockBackend': 'vlm_backend',
+    'TransformersBackend': 'transformers_backend',
+    'ObjectDetector': 'object_detector',
+    'TextEmbedder': 'text_embedder',
+    'QueryParseCache': 'query_cache',
+    'RuleBasedQueryParser': 'query_parser',
+    'setup_logging': 'helpers',
+    'load_config': 'helpers',
+    'save_json': 'helpers',
+    'load_json': 'helpers',
+    'check_dependencies': 'helpers',
+}
 
 __all__ = [
     'QwenVLMClient',
+    'QueryAnalysis',
+    'VLMBackend',
+    'OpenAICompatibleBackend',
+    'TransformersBackend',
+    'MockBackend',
     'ObjectDetector',
+    'TextEmbedder',
+    'QueryParseCache',
+    'RuleBasedQueryParser',
     'setup_logging',
     'load_config',
     'save_json',
@@ -16,3 +42,16 @@ __all__ = [
     'check_dependencies'
 ]
 
+
+def __getattr__(name):
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -2,9 +2,9 @@
 Helper functions and utilities
 """
 
-import yaml
 import json
 import logging
+import importlib.util
 from pathlib import Path
 from typing import Dict, Any, Optional
 import sys
@@ -55,6 +55,8 @@ def load_config(config_path: str) -> Dict[str, Any]:
     Returns:
         配置字典
     """
+    import yaml
+    
     config_path = Path(config_path)
     
     if not config_path.exists():
@@ -99,7 +101,12 @@ def load_json(input_path: str) -> Dict:
 
 
 def check_dependencies():
-    """检查依赖是否安装"""
+    """
+    检查依赖是否安装
+    
+    只用 importlib.util.find_spec 查找模块，不导入（导入torch、open3d等需要数秒）；
+    模块已安装但无法加载的问题会在首次使用时报告。
+    """
     dependencies = {
         'torch': 'PyTorch',
         'cv2': 'OpenCV (opencv-python)',
@@ -115,8 +122,10 @@ def check_dependencies():
     
     for module, name in dependencies.items():
         try:
-            __import__(module)
-        except ImportError:
+            found = importlib.util.find_spec(module) is not None
+        except (ImportError, ValueError):
+            found = False
+        if not found:
             missing.append(name)
     
     if missing:
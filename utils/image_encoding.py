@@ -0,0 +1,171 @@
+"""
+Image Encoding - 发送给VLM API的图像编码
+按Qwen2-VL的像素范围缩放，使用JPEG/WebP压缩，并按帧缓存编码结果
+"""
+
+import io
+import math
+import time
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Tuple, Union
+import numpy as np
+from PIL import Image
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Qwen2-VL的图像patch对齐尺寸和像素范围（与 qwen_vl_utils 的默认值一致）
+IMAGE_FACTOR = 28
+MIN_PIXELS = 256 * 28 * 28
+MAX_PIXELS = 1280 * 28 * 28
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+def smart_resize(height: int,
+                 width: int,
+                 factor: int = IMAGE_FACTOR,
+                 min_pixels: int = MIN_PIXELS,
+                 max_pixels: int = MAX_PIXELS) -> Tuple[int, int]:
+    """
+    计算缩放后的尺寸：宽高为factor的整数倍，总像素在 [min_pixels, max_pixels] 内，
+    并尽量保持宽高比（与Qwen2-VL处理器的缩放规则相同）
+    
+    Returns:
+        (新高度, 新宽度)
+    """
+    h_bar = max(factor, round(height / factor) * factor)
+    w_bar = max(factor, round(width / factor) * factor)
+    
+    if h_bar * w_bar > max_pixels:
+        beta = math.sqrt((height * width) / max_pixels)
+        h_bar = max(factor, math.floor(height / beta / factor) * factor)
+        w_bar = max(factor, math.floor(width / beta / factor) * factor)
+    elif h_bar * w_bar < min_pixels:
+        beta = math.sqrt(min_pixels / (height * width))
+        h_bar = math.ceil(height * beta / factor) * factor
+        w_bar = math.ceil(width * beta / factor) * factor
+    
+    return h_bar, w_bar
+
+
+class ImageEncoder:
+    """
+    图像编码器（输出data URL）
+    
+    服务端会把图像缩放到同样的尺寸，所以在客户端先缩放不影响模型输入，
+    却能显著减小请求体积。同一帧在多个提示中出现时只编码一次。
+    """
+    
+    def __init__(self,
+                 image_format: str = "JPEG",
+                 quality: int = 85,
+                 min_pixels: int = MIN_PIXELS,
+                 max_pixels: int = MAX_PIXELS,
+                 cache_size: int = 64):
+        """
+        Args:
+            image_format: 编码格式 ["JPEG", "WEBP", "PNG"]
+            quality: JPEG/WebP质量 (1-100)
+            min_pixels: 最小像素数
+            max_pixels: 最大像素数
+            cache_size: 编码结果缓存的最大帧数（0表示不缓存）
+        """
+        self.image_format = image_format.upper()
+        if self.image_format == "JPG":
+            self.image_format = "JPEG"
+        if self.image_format not in _MIME_TYPES:
+            raise ValueError(f"不支持的图像格式: {image_format}")
+        
+        self.quality = quality
+        self.min_pixels = min_pixels
+        self.max_pixels = max_pixels
+        self.cache_size = cache_size
+        
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"encoded": 0, "cache_hits": 0, "bytes": 0, "encode_time": 0.0}
+    
+    @staticmethod
+    def frame_hash(image: Union[Image.Image, np.ndarray]) -> str:
+        """计算帧内容哈希（blake2b）"""
+        if isinstance(image, Image.Image):
+            shape, data = f"{image.mode}{image.size}", image.tobytes()
+        else:
+            array = np.ascontiguousarray(image)
+            shape, data = f"{array.dtype}{array.shape}", array.data
+        
+        digest = hashlib.blake2b(shape.encode("utf-8"), digest_size=16)
+        digest.update(data)
+        return digest.hexdigest()
+    
+    def encode(self, image: Union[Image.Image, np.ndarray]) -> str:
+        """
+        编码图像为data URL
+        
+        Args:
+            image: PIL图像或RGB numpy数组
+        
+        Returns:
+            data URL字符串
+        """
+        key = self.frame_hash(image) if self.cache_size > 0 else None
+        
+        if key is not None:
+            with self._lock:
+                url = self._cache.get(key)
+                if url is not None:
+                    self._cache.move_to_end(key)
+                    self.stats["cache_hits"] += 1
+                    return url
+        
+        start = time.time()
+        
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        
+        width, height = image.size
+        new_height, new_width = smart_resize(
+            height, width, min_pixels=self.min_pixels, max_pixels=self.max_pixels
+        )
+        if (new_width, new_height) != (width, height):
+            image = image.resize((new_width, new_height), Image.BICUBIC)
+        
+        if self.image_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        
+        buffer = io.BytesIO()
+        if self.image_format == "PNG":
+            image.save(buffer, format="PNG")
+        else:
+            image.save(buffer, format=self.image_format, quality=self.quality)
+        image_bytes = buffer.getvalue()
+        
+        url = f"data:{_MIME_TYPES[self.image_format]};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+        elapsed = time.time() - start
+        
+        logger.debug(
+            f"图像编码: {width}x{height} -> {new_width}x{new_height} {self.image_format}, "
+            f"{len(image_bytes) / 1024:.1f} KB, {elapsed * 1000:.1f} ms"
+        )
+        
+        with self._lock:
+            self.stats["encoded"] += 1
+            self.stats["bytes"] += len(image_bytes)
+            self.stats["encode_time"] += elapsed
+            
+            if key is not None:
+                self._cache[key] = url
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        
+        return url
+    
+    def get_stats(self) -> Dict:
+        """编码统计（编码次数、缓存命中、总字节数、总耗时）"""
+        with self._lock:
+            return dict(self.stats)
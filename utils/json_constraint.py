@@ -0,0 +1,370 @@
+"""
+JSON Constraint - 基于JSON Schema（子集）的约束解码
+本地模式通过 logits processor 只允许生成合法的JSON前缀，并在对象闭合后强制结束；
+API模式使用 vLLM 的 guided_json / response_format
+"""
+
+import re
+import copy
+from typing import Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+import logging
+
+# torch只在本地模式的logits processor中使用，API模式和schema工具不导入
+if TYPE_CHECKING:
+    import torch
+
+logger = logging.getLogger(__name__)
+
+
+# 查询解析结果
+QUERY_COMPONENTS_SCHEMA: Dict = {
+    "type": "object",
+    "properties": {
+        "target": {"type": "string", "maxLength": 64},
+        "anchor": {"type": ["string", "null"], "maxLength": 64},
+        "relation": {"type": ["string", "null"], "maxLength": 32},
+        "target_attributes": {
+            "type": "array",
+            "items": {"type": "string", "maxLength": 32},
+            "maxItems": 8
+        }
+    },
+    "required": ["target"],
+    "additionalProperties": False
+}
+
+# 多候选验证的回答：{"id": 候选编号}
+GROUNDING_ANSWER_SCHEMA: Dict = {
+    "type": "object",
+    "properties": {
+        "id": {"type": "integer"}
+    },
+    "required": ["id"],
+    "additionalProperties": False
+}
+
+
+def grounding_answer_schema(valid_ids: Sequence[int]) -> Dict:
+    """生成只允许给定候选编号的回答schema"""
+    schema = copy.deepcopy(GROUNDING_ANSWER_SCHEMA)
+    schema["properties"]["id"]["enum"] = [int(i) for i in valid_ids]
+    return schema
+
+
+class _Incomplete(Exception):
+    """输入在合法位置结束（是合法前缀）"""
+
+
+class _Invalid(Exception):
+    """输入不可能是合法JSON"""
+
+
+_WHITESPACE = " \t\n\r"
+_INTEGER = re.compile(r"-?(0|[1-9]\d*)")
+_INTEGER_PREFIX = re.compile(r"-?(0|[1-9]\d*)?")
+_NUMBER = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?")
+_NUMBER_PREFIX = re.compile(r"-?((0|[1-9]\d*)(\.\d*)?([eE][+-]?\d*)?)?")
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class JSONPrefixValidator:
+    """
+    JSON前缀校验器
+    
+    支持的schema子集：type（可为列表）、properties、required、
+    additionalProperties、items、enum、maxLength、maxItems。
+    """
+    
+    def __init__(self, schema: Dict, max_whitespace: int = 8):
+        """
+        Args:
+            schema: JSON Schema
+            max_whitespace: 连续空白字符的上限（防止模型无限输出空白）
+        """
+        self.schema = schema
+        self.max_whitespace = max_whitespace
+    
+    def check(self, text: str) -> str:
+        """
+        校验文本
+        
+        Returns:
+            "complete"（完整且合法）、"partial"（合法前缀）或 "invalid"
+        """
+        try:
+            end = self._value(self.schema, text, self._skip_ws(text, 0))
+        except _Incomplete:
+            return "partial"
+        except _Invalid:
+            return "invalid"
+        
+        return "complete" if not text[end:].strip(_WHITESPACE) else "invalid"
+    
+    def is_valid_prefix(self, text: str) -> bool:
+        return self.check(text) != "invalid"
+    
+    def is_complete(self, text: str) -> bool:
+        return self.check(text) == "complete"
+    
+    # ===== 递归下降解析 =====
+    
+    def _skip_ws(self, text: str, i: int) -> int:
+        start = i
+        while i < len(text) and text[i] in _WHITESPACE:
+            i += 1
+        if i - start > self.max_whitespace:
+            raise _Invalid()
+        return i
+    
+    @staticmethod
+    def _peek(text: str, i: int) -> str:
+        if i >= len(text):
+            raise _Incomplete()
+        return text[i]
+    
+    def _value(self, schema: Dict, text: str, i: int) -> int:
+        types = schema.get("type")
+        if isinstance(types, str):
+            types = [types]
+        allowed = set(types) if types else {"object", "array", "string", "integer", "number", "boolean", "null"}
+        
+        ch = self._peek(text, i)
+        
+        if ch == "{" and "object" in allowed:
+            return self._object(schema, text, i)
+        if ch == "[" and "array" in allowed:
+            return self._array(schema, text, i)
+        if ch == '"' and "string" in allowed:
+            return self._string(schema, text, i)[0]
+        if (ch == "-" or ch.isdigit()) and ("integer" in allowed or "number" in allowed):
+            return self._number(schema, text, i, integer="number" not in allowed)
+        if ch in "tf" and "boolean" in allowed:
+            return self._literal("true" if ch == "t" else "false", text, i)
+        if ch == "n" and "null" in allowed:
+            return self._literal("null", text, i)
+        
+        raise _Invalid()
+    
+    @staticmethod
+    def _literal(word: str, text: str, i: int) -> int:
+        part = text[i:i + len(word)]
+        if not word.startswith(part):
+            raise _Invalid()
+        if len(part) < len(word):
+            raise _Incomplete()
+        return i + len(word)
+    
+    def _string(self, schema: Dict, text: str, i: int) -> Tuple[int, str]:
+        enum = schema.get("enum")
+        max_length = schema.get("maxLength")
+        chars: List[str] = []
+        i += 1
+        
+        while True:
+            if max_length is not None and len(chars) > max_length:
+                raise _Invalid()
+            
+            if i >= len(text):
+                partial = "".join(chars)
+                if enum is not None and not any(str(e).startswith(partial) for e in enum):
+                    raise _Invalid()
+                raise _Incomplete()
+            
+            ch = text[i]
+            
+            if ch == '"':
+                value = "".join(chars)
+                if enum is not None and value not in enum:
+                    raise _Invalid()
+                return i + 1, value
+            
+            if ch == "\\":
+                if i + 1 >= len(text):
+                    raise _Incomplete()
+                esc = text[i + 1]
+                if esc == "u":
+                    digits = text[i + 2:i + 6]
+                    if not all(c in "0123456789abcdefABCDEF" for c in digits):
+                        raise _Invalid()
+                    if len(digits) < 4:
+                        raise _Incomplete()
+                    chars.append(chr(int(digits, 16)))
+                    i += 6
+                elif esc in _ESCAPES:
+                    chars.append(_ESCAPES[esc])
+                    i += 2
+                else:
+                    raise _Invalid()
+            elif ord(ch) < 0x20:
+                raise _Invalid()
+            else:
+                chars.append(ch)
+                i += 1
+    
+    def _number(self, schema: Dict, text: str, i: int, integer: bool) -> int:
+        j = i
+        while j < len(text) and text[j] in "-+.eE0123456789":
+            j += 1
+        token = text[i:j]
+        enum = schema.get("enum")
+        
+        if j >= len(text):
+            # 数字可能还没写完
+            if not (_INTEGER_PREFIX if integer else _NUMBER_PREFIX).fullmatch(token):
+                raise _Invalid()
+            if enum is not None and not any(str(e).startswith(token) for e in enum):
+                raise _Invalid()
+            raise _Incomplete()
+        
+        if not (_INTEGER if integer else _NUMBER).fullmatch(token):
+            raise _Invalid()
+        if enum is not None and float(token) not in enum:
+            raise _Invalid()
+        return j
+    
+    def _object(self, schema: Dict, text: str, i: int) -> int:
+        properties = schema.get("properties", {})
+        required = set(schema.get("required", []))
+        additional = schema.get("additionalProperties", not properties)
+        seen = set()
+        
+        i = self._skip_ws(text, i + 1)
+        if self._peek(text, i) == "}":
+            if not required <= seen:
+                raise _Invalid()
+            return i + 1
+        
+        while True:
+            if self._peek(text, i) != '"':
+                raise _Invalid()
+            
+            key_schema = {} if additional else {"enum": [k for k in properties if k not in seen]}
+            i, key = self._string(key_schema, text, i)
+            if key in seen:
+                raise _Invalid()
+            seen.add(key)
+            
+            i = self._skip_ws(text, i)
+            if self._peek(text, i) != ":":
+                raise _Invalid()
+            i = self._skip_ws(text, i + 1)
+            i = self._value(properties.get(key, {}), text, i)
+            i = self._skip_ws(text, i)
+            
+            ch = self._peek(text, i)
+            if ch == ",":
+                i = self._skip_ws(text, i + 1)
+            elif ch == "}":
+                if not required <= seen:
+                    raise _Invalid()
+                return i + 1
+            else:
+                raise _Invalid()
+    
+    def _array(self, schema: Dict, text: str, i: int) -> int:
+        items = schema.get("items", {})
+        max_items = schema.get("maxItems")
+        count = 0
+        
+        i = self._skip_ws(text, i + 1)
+        if self._peek(text, i) == "]":
+            return i + 1
+        
+        while True:
+            count += 1
+            if max_items is not None and count > max_items:
+                raise _Invalid()
+            
+            i = self._value(items, text, i)
+            i = self._skip_ws(text, i)
+            
+            ch = self._peek(text, i)
+            if ch == ",":
+                i = self._skip_ws(text, i + 1)
+            elif ch == "]":
+                return i + 1
+            else:
+                raise _Invalid()
+
+
+class JSONSchemaLogitsProcessor:
+    """
+    约束解码的 logits processor（用于 transformers 的 generate）
+    
+    每一步只检查得分最高的 top_k 个候选token，屏蔽会使输出变为非法JSON的token；
+    JSON对象闭合后只允许结束符。候选全部非法时不做约束，避免卡死。
+    """
+    
+    def __init__(self,
+                 tokenizer,
+                 schema: Dict,
+                 prompt_length: int,
+                 eos_token_ids: Sequence[int],
+                 top_k: int = 20):
+        """
+        Args:
+            tokenizer: 分词器
+            schema: JSON Schema
+            prompt_length: 输入提示的token长度（之后为生成部分）
+            eos_token_ids: 结束符token ID
+            top_k: 每步检查的候选token数
+        """
+        self.tokenizer = tokenizer
+        self.validator = JSONPrefixValidator(schema)
+        self.prompt_length = prompt_length
+        self.eos_token_ids = list(eos_token_ids)
+        self.top_k = top_k
+    
+    def __call__(self, input_ids: "torch.LongTensor", scores: "torch.FloatTensor") -> "torch.FloatTensor":
+        import torch
+        
+        for row in range(input_ids.shape[0]):
+            generated = input_ids[row, self.prompt_length:].tolist()
+            state = self.validator.check(self._decode(generated))
+            
+            if state != "partial":
+                # 已完整（或已无法挽回）：强制结束
+                if state == "invalid":
+                    logger.debug("约束解码遇到非法前缀，提前结束")
+                eos_scores = scores[row, self.eos_token_ids].clone()
+                scores[row] = float("-inf")
+                scores[row, self.eos_token_ids] = eos_scores
+                continue
+            
+            candidates = torch.topk(scores[row], min(self.top_k, scores.shape[-1])).indices.tolist()
+            allowed = [
+                token_id for token_id in candidates
+                if token_id not in self.eos_token_ids
+                and self.validator.is_valid_prefix(self._decode(generated + [token_id]))
+            ]
+            
+            if not allowed:
+                continue
+            
+            allowed_scores = scores[row, allowed].clone()
+            scores[row] = float("-inf")
+            scores[row, allowed] = allowed_scores
+        
+        return scores
+    
+    def _decode(self, token_ids: List[int]) -> str:
+        return self.tokenizer.decode(token_ids, skip_special_tokens=True)
+
+
+def api_constraint_fields(schema: Dict, mode: str = "guided_json", name: str = "answer") -> Dict:
+    """
+    生成API请求中的约束解码字段
+    
+    Args:
+        schema: JSON Schema
+        mode: "guided_json"（vLLM扩展字段）、"response_format"（OpenAI json_schema格式）或 "none"
+        name: response_format 中的schema名称
+    
+    Returns:
+        需要合并到请求体的字段
+    """
+    if mode == "guided_json":
+        return {"guided_json": schema}
+    if mode == "response_format":
+        return {"response_format": {"type": "json_schema", "json_schema": {"name": name, "schema": schema}}}
+    return {}
@@ -0,0 +1,142 @@
+"""
+Micro Batcher - 并发请求的动态批处理
+在短时间窗口内收集并发调用，合并成一个批次执行后再分发结果
+"""
+
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, List, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    微批处理调度器
+    
+    调用方通过 submit() 提交请求并阻塞等待结果；后台线程收到第一个请求后
+    最多等待 timeout_ms 毫秒或凑满 max_batch_size 个请求，然后把同一分组
+    （如相同温度参数）的请求交给 process_fn 一次处理。
+    """
+    
+    def __init__(self,
+                 process_fn: Callable[[Hashable, List[Any]], List[Any]],
+                 max_batch_size: int = 8,
+                 timeout_ms: float = 10.0,
+                 name: str = "micro-batcher"):
+        """
+        Args:
+            process_fn: 批处理函数 (分组键, 请求列表) -> 结果列表（与请求一一对应）
+            max_batch_size: 最大批次大小
+            timeout_ms: 收集一个批次的最长等待时间（毫秒）
+            name: 后台线程名称
+        """
+        self.process_fn = process_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.timeout = timeout_ms / 1000.0
+        
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.stats = {"requests": 0, "batches": 0, "max_batch": 0}
+        
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+    
+    def submit(self, item: Any, group: Hashable = None) -> Any:
+        """
+        提交请求并等待结果
+        
+        Args:
+            item: 请求内容
+            group: 分组键，只有相同分组的请求会合并
+        
+        Returns:
+            该请求对应的结果（批处理异常会在这里重新抛出）
+        """
+        future: Future = Future()
+        
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("MicroBatcher已关闭")
+            self._queue.append((group, item, future))
+            self._cond.notify()
+        
+        return future.result()
+    
+    def _next_batch(self):
+        """取出下一个批次（需持有锁）：以队首请求的分组为准"""
+        group = self._queue[0][0]
+        batch, rest = [], deque()
+        
+        while self._queue:
+            entry = self._queue.popleft()
+            if entry[0] == group and len(batch) < self.max_batch_size:
+                batch.append(entry)
+            else:
+                rest.append(entry)
+        
+        self._queue = rest
+        return group, batch
+    
+    def _count_group(self, group: Hashable) -> int:
+        return sum(1 for entry in self._queue if entry[0] == group)
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._queue:
+                    return
+                
+                # 等待更多同组请求，直到凑满批次或超时
+                deadline = time.time() + self.timeout
+                group = self._queue[0][0]
+                while self._count_group(group) < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                
+                group, batch = self._next_batch()
+            
+            self._process(group, batch)
+    
+    def _process(self, group: Hashable, batch: List):
+        items = [item for _, item, _ in batch]
+        
+        try:
+            results = self.process_fn(group, items)
+            if len(results) != len(items):
+                raise RuntimeError(f"批处理结果数量不匹配: {len(results)} != {len(items)}")
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+        
+        self.stats["requests"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+        
+        if len(batch) > 1:
+            logger.debug(f"合并批处理: {len(batch)} 个请求")
+    
+    def get_stats(self) -> Dict:
+        """批处理统计（请求数、批次数、平均/最大批次大小）"""
+        stats = dict(self.stats)
+        stats["avg_batch"] = stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+    
+    def close(self):
+        """停止后台线程（已排队的请求仍会处理完）"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
@@ -0,0 +1,74 @@
+"""
+Model Prefetcher - 后台预加载模型
+在关键帧提取等前置阶段运行时提前加载YOLO、MiDaS和VLM
+"""
+
+import time
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ModelPrefetcher:
+    """
+    模型预加载器
+    
+    在后台线程中按顺序调用各模型的加载函数。加载函数需自行保证线程安全和幂等
+    （已加载时直接返回），因此首次使用时若预加载尚未完成，调用方会在加载锁上等待，
+    而不会重复加载。预加载失败只记录日志，首次使用时会重新尝试并抛出异常。
+    """
+    
+    def __init__(self, loaders: List[Tuple[str, Callable[[], None]]]):
+        """
+        Args:
+            loaders: [(名称, 加载函数)]，按列表顺序加载（先用到的模型放在前面）
+        """
+        self.loaders = loaders
+        self.load_times: Dict[str, float] = {}
+        self.errors: Dict[str, Exception] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._done = {name: threading.Event() for name, _ in loaders}
+    
+    def start(self):
+        """启动后台预加载线程"""
+        if self._thread is not None:
+            return
+        
+        self._thread = threading.Thread(target=self._run, name="model-prefetch", daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        for name, loader in self.loaders:
+            start = time.time()
+            try:
+                loader()
+                self.load_times[name] = time.time() - start
+                logger.info(f"预加载完成: {name} ({self.load_times[name]:.2f}s)")
+            except Exception as e:
+                self.errors[name] = e
+                logger.warning(f"预加载失败: {name}: {e}")
+            finally:
+                self._done[name].set()
+    
+    def wait(self, name: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """
+        等待预加载完成
+        
+        Args:
+            name: 模型名称（None表示全部）
+            timeout: 超时时间（秒）
+        
+        Returns:
+            是否在超时前完成
+        """
+        events = [self._done[name]] if name is not None else list(self._done.values())
+        deadline = None if timeout is None else time.time() + timeout
+        
+        for event in events:
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            if not event.wait(remaining):
+                return False
+        
+        return True
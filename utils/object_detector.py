@@ -3,6 +3,7 @@ Object Detector - 使用YOLOv8进行2D物体检测
 """
 
 import cv2
+import threading
 import numpy as np
 from typing import List, Dict, Tuple, Optional
 import logging
@@ -18,49 +19,61 @@ class ObjectDetector:
                  model_name: str = "yolov8x.pt",
                  conf_threshold: float = 0.25,
                  iou_threshold: float = 0.5,
-                 device: str = "cuda"):
+                 device: str = "cuda",
+                 batch_size: int = 8):
         """
         Args:
             model_name: YOLO模型名称
             conf_threshold: 置信度阈值
             iou_threshold: NMS的IoU阈值
             device: 设备
+            batch_size: 批量检测时每次送入模型的图像数
         """
         self.model_name = model_name
         self.conf_threshold = conf_threshold
         self.iou_threshold = iou_threshold
         self.device = device
+        self.batch_size = batch_size
         self.model = None
+        self._init_lock = threading.Lock()
     
     def initialize(self):
         """初始化YOLO模型"""
         if self.model is not None:
             return
         
-        try:
-            from ultralytics import YOLO
+        # 可能被后台预加载线程和首次使用同时调用
+        with self._init_lock:
+            if self.model is not None:
+                return
             
-            logger.info(f"加载YOLO模型: {self.model_name}")
-            self.model = YOLO(self.model_name)
-            
-            # 移至指定设备
-            if self.device == "cuda":
-                import torch
-                if torch.cuda.is_available():
-                    self.model.to(self.device)
-                else:
-                    logger.warning("CUDA不可用，使用CPU")
-                    self.device = "cpu"
-            
-            logger.info("YOLO模型加载完成")
+            try:
+                from ultralytics import YOLO
+                
+                logger.info(f"加载YOLO模型: {self.model_name}")
+                model = YOLO(self.model_name)
+                
+                # 移至指定设备
+                if self.device == "cuda":
+                    import torch
+                    if torch.cuda.is_available():
+                        model.to(self.device)
+                    else:
+                        logger.warning("CUDA不可用，使用CPU")
+                        self.device = "cpu"
+                
+                # 完全初始化后再赋值，避免其他线程看到未就绪的模型
+                self.model = model
+                
+                logger.info("YOLO模型加载完成")
             
-        except ImportError:
-            logger.error("无法导入ultralytics")
-            logger.error("请运行: pip install ultralytics")
-            raise
-        except Exception as e:
-            logger.error(f"YOLO模型加载失败: {e}")
-            raise
+            except ImportError:
+                logger.error("无法导入ultralytics")
+                logger.error("请运行: pip install ultralytics")
+                raise
+            except Exception as e:
+                logger.error(f"YOLO模型加载失败: {e}")
+                raise
     
     def detect(self, image: np.ndarray) -> List[Dict]:
         """
@@ -90,38 +103,44 @@ class ObjectDetector:
             verbose=False
         )
         
-        detections = []
         h, w = image.shape[:2]
-        
+        detections = []
         for result in results:
-            boxes = result.boxes
-            
-            for i in range(len(boxes)):
-                # 获取边界框
-                xyxy = boxes.xyxy[i].cpu().numpy()
-                x1, y1, x2, y2 = xyxy
-                
-                # 归一化坐标
-                x1_norm, y1_norm = x1 / w, y1 / h
-                x2_norm, y2_norm = x2 / w, y2 / h
-                
-                # 获取类别和置信度
-                class_id = int(boxes.cls[i].cpu().numpy())
-                confidence = float(boxes.conf[i].cpu().numpy())
-                class_name = result.names[class_id]
-                
-                detections.append({
-                    "class_name": class_name,
-                    "class_id": class_id,
-                    "confidence": confidence,
-                    "bbox": [float(x1), float(y1), float(x2), float(y2)],
-                    "bbox_norm": [float(x1_norm), float(y1_norm), 
-                                 float(x2_norm), float(y2_norm)]
-                })
+            detections.extend(self._parse_result(result, h, w))
         
         logger.debug(f"检测到 {len(detections)} 个物体")
         return detections
     
+    def _parse_result(self, result, h: int, w: int) -> List[Dict]:
+        """将单张图像的YOLO结果转换为检测字典列表"""
+        detections = []
+        boxes = result.boxes
+        
+        for i in range(len(boxes)):
+            # 获取边界框
+            xyxy = boxes.xyxy[i].cpu().numpy()
+            x1, y1, x2, y2 = xyxy
+            
+            # 归一化坐标
+            x1_norm, y1_norm = x1 / w, y1 / h
+            x2_norm, y2_norm = x2 / w, y2 / h
+            
+            # 获取类别和置信度
+            class_id = int(boxes.cls[i].cpu().numpy())
+            confidence = float(boxes.conf[i].cpu().numpy())
+            class_name = result.names[class_id]
+            
+            detections.append({
+                "class_name": class_name,
+                "class_id": class_id,
+                "confidence": confidence,
+                "bbox": [float(x1), float(y1), float(x2), float(y2)],
+                "bbox_norm": [float(x1_norm), float(y1_norm), 
+                             float(x2_norm), float(y2_norm)]
+            })
+        
+        return detections
+    
     def detect_batch(self, images: List[np.ndarray]) -> List[List[Dict]]:
         """
         批量检测
@@ -137,9 +156,19 @@ class ObjectDetector:
         
         all_detections = []
         
-        for image in images:
-            detections = self.detect(image)
-            all_detections.append(detections)
+        # 按batch_size分块送入模型，一次前向处理多张图像
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            results = self.model.predict(
+                chunk,
+                conf=self.conf_threshold,
+                iou=self.iou_threshold,
+                verbose=False
+            )
+            
+            for image, result in zip(chunk, results):
+                h, w = image.shape[:2]
+                all_detections.append(self._parse_result(result, h, w))
         
         return all_detections
     
@@ -0,0 +1,156 @@
+"""
+Query Parse Cache - 查询解析结果缓存
+内存LRU + SQLite持久化存储
+"""
+
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueryParseCache:
+    """
+    查询解析缓存
+    
+    键为 (规范化查询文本, 模型名称, 版本) 的哈希。版本通常取提示词模板的哈希，
+    模板变化后旧条目自动失效；可选TTL控制条目的最长有效期。
+    """
+    
+    def __init__(self,
+                 db_path: Optional[str] = None,
+                 max_entries: int = 1024,
+                 ttl: Optional[float] = None,
+                 version: str = ""):
+        """
+        Args:
+            db_path: SQLite数据库路径（None表示只使用内存缓存）
+            max_entries: 内存LRU的最大条目数
+            ttl: 条目有效期（秒，None表示永不过期）
+            version: 缓存版本（变化时旧条目失效）
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        
+        if db_path:
+            self._open_db(Path(db_path).expanduser())
+    
+    def _open_db(self, db_path: Path):
+        """打开（或创建）SQLite数据库，并清理其他版本的条目"""
+        try:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_cache ("
+                "key TEXT PRIMARY KEY, version TEXT, components TEXT, created_at REAL)"
+            )
+            self._conn.execute("DELETE FROM query_cache WHERE version != ?", (self.version,))
+            self._conn.commit()
+            logger.info(f"查询解析缓存: {db_path}")
+        except sqlite3.Error as e:
+            logger.warning(f"无法打开查询缓存数据库，仅使用内存缓存: {e}")
+            self._conn = None
+    
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """规范化查询文本：小写、合并空白、去除首尾标点"""
+        query = re.sub(r"\s+", " ", query.strip().lower())
+        return query.strip(" .,!?;:\"'")
+    
+    def make_key(self, query: str, model_name: str) -> str:
+        """计算缓存键"""
+        raw = f"{self.version}\x00{model_name}\x00{self.normalize_query(query)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+    
+    def get(self, query: str, model_name: str) -> Optional[Dict]:
+        """
+        查找缓存
+        
+        Returns:
+            缓存的查询组件（副本），未命中返回None
+        """
+        key = self.make_key(query, model_name)
+        
+        with self._lock:
+            entry = self._memory.get(key)
+            
+            if entry is None and self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT components, created_at FROM query_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._remember(key, entry)
+            
+            if entry is not None and self._expired(entry[1]):
+                self._forget(key)
+                entry = None
+            
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return json.loads(entry[0])
+    
+    def put(self, query: str, model_name: str, components: Dict):
+        """写入缓存"""
+        key = self.make_key(query, model_name)
+        entry = (json.dumps(components, ensure_ascii=False), time.time())
+        
+        with self._lock:
+            self._remember(key, entry)
+            
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?, ?)",
+                        (key, self.version, entry[0], entry[1])
+                    )
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"查询缓存写入失败: {e}")
+    
+    def _remember(self, key: str, entry: tuple):
+        """写入内存LRU（需持有锁）"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+    
+    def _forget(self, key: str):
+        """删除条目（需持有锁）"""
+        self._memory.pop(key, None)
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM query_cache WHERE key = ?", (key,))
+            self._conn.commit()
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM query_cache")
+                self._conn.commit()
+    
+    def __len__(self) -> int:
+        return len(self._memory)
@@ -0,0 +1,303 @@
+"""
+Rule-based Query Parser - 基于规则的查询解析
+解析 "the red apple on the wooden table" 这类简单查询，并给出置信度
+"""
+
+import re
+from typing import Iterable, List, Dict, Set, Tuple, Optional
+import logging
+
+from utils.text_embedder import DEFAULT_CONCEPTS
+
+logger = logging.getLogger(__name__)
+
+
+# 空间关系短语 -> 关系键
+# inside/behind/front 不在 ObjectLookupTable 能按坐标判断的关系中（见 EVALUATED_RELATIONS）
+RELATION_PHRASES: Dict[str, str] = {
+    'on top of': 'on',
+    'on': 'on',
+    'atop': 'on',
+    'above': 'above',
+    'over': 'above',
+    'below': 'below',
+    'under': 'below',
+    'underneath': 'below',
+    'beneath': 'below',
+    'near': 'near',
+    'next to': 'near',
+    'beside': 'near',
+    'close to': 'near',
+    'by': 'near',
+    'to the left of': 'left',
+    'on the left of': 'left',
+    'on the left side of': 'left',
+    'left of': 'left',
+    'to the right of': 'right',
+    'on the right of': 'right',
+    'on the right side of': 'right',
+    'right of': 'right',
+    'in front of': 'front',
+    'behind': 'behind',
+    'inside': 'inside',
+    'in': 'inside',
+    'within': 'inside',
+}
+
+# ObjectLookupTable.SPATIAL_RELATIONS：其余关系键的规则解析置信度降到阈值以下，交给VLM
+EVALUATED_RELATIONS = {'on', 'above', 'below', 'left', 'right', 'near'}
+
+# 表示方位或区域而不是物体的词（"on the left"、"in the corner" 没有锚点物体）
+POSITION_WORDS = {
+    'left', 'right', 'front', 'back', 'top', 'bottom', 'side', 'middle', 'center', 'centre',
+    'corner', 'edge', 'end', 'background', 'foreground',
+}
+
+# 序数词和比较性描述：需要在多个同类物体之间比较，规则解析无法表达
+ORDINALS = {
+    'first', 'second', 'third', 'fourth', 'fifth', 'last', 'next', 'other', 'another', 'only',
+}
+# 以 -est/-most 结尾但不是最高级的名词
+NON_SUPERLATIVES = {'chest', 'vest', 'nest', 'forest', 'guest', 'west', 'east', 'pest', 'crest', 'test', 'rest'}
+
+COLORS = {
+    'red', 'blue', 'green', 'yellow', 'black', 'white', 'brown', 'gray', 'grey',
+    'orange', 'purple', 'pink', 'beige', 'silver', 'golden', 'gold', 'dark', 'light',
+}
+
+MATERIALS = {
+    'wooden', 'wood', 'metal', 'metallic', 'plastic', 'glass', 'leather', 'fabric',
+    'ceramic', 'paper', 'stone', 'marble', 'steel', 'cardboard',
+}
+
+SIZES = {'big', 'small', 'large', 'tiny', 'tall', 'short', 'long', 'little', 'round', 'square'}
+
+# 同时可作名词的修饰词：紧挨中心词时可能是物体名称的一部分（"paper towel"、"light switch"）
+NOUN_MODIFIERS = {
+    'glass', 'paper', 'light', 'wood', 'stone', 'metal', 'plastic', 'leather', 'fabric',
+    'ceramic', 'steel', 'marble', 'cardboard', 'gold', 'silver', 'orange',
+}
+
+# 含修饰词的多词类别名（YOLOv8/COCO类别名），与概念词表中的多词名称一起作为整体保留
+DETECTOR_COMPOUND_NAMES = {
+    'traffic light', 'fire hydrant', 'stop sign', 'parking meter', 'sports ball', 'baseball bat',
+    'baseball glove', 'tennis racket', 'wine glass', 'hot dog', 'potted plant', 'dining table',
+    'cell phone', 'teddy bear', 'hair drier',
+}
+
+DETERMINERS = {'the', 'a', 'an', 'this', 'that', 'these', 'those', 'some', 'my', 'its'}
+
+# 查询开头的指令性短语（"find the chair" -> "the chair"）
+COMMAND_PREFIXES = (
+    'find', 'locate', 'show me', 'show', 'where is', "where's", 'point to', 'select', 'detect',
+)
+
+# 表明查询含有从句/动作描述，规则解析不可靠
+CLAUSE_MARKERS = {
+    'that', 'which', 'who', 'whose', 'where', 'when', 'while', 'with', 'without',
+    'is', 'are', 'was', 'were', 'has', 'have', 'and', 'or', 'but', 'not',
+    'sitting', 'standing', 'lying', 'holding', 'hanging', 'placed', 'located',
+}
+
+
+class KeywordMatcher:
+    """
+    多关键词匹配（带词边界）
+    
+    所有关键词先建成一棵trie（与Aho–Corasick相同的共享前缀结构），再编译为一个嵌套正则，
+    例如 on / on top of / over -> o(?:n(?: top of)?|ver)。匹配在正则引擎中一次扫描完成，
+    不会对每个关键词分别尝试；同一位置优先匹配最长的关键词。
+    关键词和待匹配文本都应为小写（调用方只需对文本做一次 lower()）。
+    """
+    
+    def __init__(self, keywords: Iterable[str], word_boundary: bool = True):
+        """
+        Args:
+            keywords: 关键词（可以是含空格的短语）
+            word_boundary: 是否要求匹配两侧为词边界
+        """
+        trie: Dict = {}
+        for keyword in keywords:
+            node = trie
+            for ch in keyword.lower():
+                node = node.setdefault(ch, {})
+            node[""] = True
+        
+        body = self._trie_pattern(trie) or "(?!)"
+        boundary = r"\b" if word_boundary else ""
+        # 第1组为匹配到的关键词
+        self.pattern = re.compile(f"{boundary}({body}){boundary}")
+    
+    @classmethod
+    def _trie_pattern(cls, node: Dict) -> str:
+        branches = [re.escape(ch) + cls._trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        
+        group = "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            # 关键词可以在此结束：贪婪的可选组使更长的关键词优先
+            return group + "?"
+        return branches[0] if len(branches) == 1 else group
+    
+    def find_all(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        查找所有关键词（从左到右、不重叠）
+        
+        Returns:
+            [(起始位置, 结束位置, 关键词)]
+        """
+        return [(m.start(1), m.end(1), m.group(1)) for m in self.pattern.finditer(text)]
+    
+    def find_first(self, text: str) -> Optional[str]:
+        """返回最先出现的关键词（没有时为None）"""
+        match = self.pattern.search(text)
+        return match.group(1) if match else None
+
+
+def default_compound_names() -> Set[str]:
+    """检测器类别和概念词表中的多词物体名称"""
+    names = set(DETECTOR_COMPOUND_NAMES)
+    for concept, synonyms in DEFAULT_CONCEPTS.items():
+        names.update(name for name in [concept, *synonyms] if ' ' in name)
+    return names
+
+
+class RuleBasedQueryParser:
+    """基于规则的查询解析器（无模型调用）"""
+    
+    # 空间关系短语的组合正则（trie结构，长短语优先，带词边界）
+    _relation_pattern = KeywordMatcher(RELATION_PHRASES).pattern
+    _command_pattern = re.compile(
+        r'^(?:' + '|'.join(re.escape(p) for p in COMMAND_PREFIXES) + r')\b\s*'
+    )
+    _clean_pattern = re.compile(r"[^a-z0-9\s'-]")
+    _space_pattern = re.compile(r'\s+')
+    
+    def __init__(self, compound_names: Optional[Iterable[str]] = None):
+        """
+        Args:
+            compound_names: 多词物体名称（默认为检测器类别和概念词表中的多词名称），
+                其中的颜色/材质/尺寸词不会被当作属性去掉
+        """
+        names = default_compound_names() if compound_names is None else compound_names
+        self.compound_names = {name.lower() for name in names}
+    
+    def parse(self, query: str) -> Tuple[Dict, float]:
+        """
+        解析查询
+        
+        Args:
+            query: 自然语言查询
+        
+        Returns:
+            (组件, 置信度)，置信度在 [0, 1] 之间
+        """
+        result = {
+            "target": None,
+            "anchor": None,
+            "relation": None,
+            "target_attributes": []
+        }
+        
+        # 非英文查询（如中文）交给VLM
+        if not query.isascii():
+            result["target"] = query.strip()
+            return result, 0.0
+        
+        text = self._clean_pattern.sub(' ', query.lower())
+        text = self._space_pattern.sub(' ', text).strip()
+        text = self._command_pattern.sub('', text)
+        
+        confidence = 1.0
+        relations = list(self._relation_pattern.finditer(text))
+        
+        if relations:
+            first = relations[0]
+            result["relation"] = RELATION_PHRASES[first.group(1)]
+            target_text = text[:first.start()]
+            anchor_text = text[first.end():]
+            
+            if len(relations) > 1:
+                # 多个关系短语（嵌套描述），只按第一个切分
+                confidence -= 0.5
+                anchor_text = anchor_text[:relations[1].start() - first.end()]
+        else:
+            target_text, anchor_text = text, ""
+        
+        target, attributes, target_penalty = self._parse_noun_phrase(target_text)
+        result["target"] = target
+        result["target_attributes"] = attributes
+        confidence -= target_penalty
+        
+        if result["relation"]:
+            anchor, _, anchor_penalty = self._parse_noun_phrase(anchor_text)
+            result["anchor"] = anchor
+            confidence -= anchor_penalty
+            if not anchor or anchor in POSITION_WORDS:
+                # "the mug on the left"、"the table in the corner"：没有锚点物体
+                confidence -= 0.5
+            if result["relation"] not in EVALUATED_RELATIONS:
+                confidence -= 0.5
+        
+        if not target:
+            result["target"] = query.strip()
+            confidence = 0.0
+        
+        return result, max(0.0, min(1.0, confidence))
+    
+    @staticmethod
+    def _is_comparative(word: str) -> bool:
+        """是否为序数词或最高级（-est/-most）"""
+        if word in ORDINALS:
+            return True
+        return len(word) > 4 and word.endswith(('est', 'most')) and word not in NON_SUPERLATIVES
+    
+    def _parse_noun_phrase(self, text: str) -> Tuple[Optional[str], List[str], float]:
+        """
+        解析名词短语
+        
+        Returns:
+            (中心词短语, 属性列表, 置信度惩罚)
+        """
+        words = text.split()
+        penalty = 0.0
+        
+        while words and words[0] in DETERMINERS:
+            words = words[1:]
+        
+        # 已知的多词名称（"wine glass"、"traffic light"）合并为一个词，不拆出属性
+        tokens = []
+        i = 0
+        while i < len(words):
+            if i + 1 < len(words) and f"{words[i]} {words[i + 1]}" in self.compound_names:
+                tokens.append(f"{words[i]} {words[i + 1]}")
+                i += 2
+            else:
+                tokens.append(words[i])
+                i += 1
+        
+        is_modifier = [w in COLORS or w in MATERIALS or w in SIZES for w in tokens]
+        attributes = [w for w, modifier in zip(tokens, is_modifier) if modifier]
+        head = [w for w, modifier in zip(tokens, is_modifier) if not modifier]
+        
+        # 修饰词可能是未知多词名称的一部分（"paper towel"、"light switch"、短语以修饰词结尾），
+        # 降低置信度交给VLM判断
+        for idx, w in enumerate(tokens):
+            if not is_modifier[idx] or not head:
+                continue
+            before_head = idx + 1 < len(tokens) and not is_modifier[idx + 1] and w in NOUN_MODIFIERS
+            after_head = idx == len(tokens) - 1 and idx > 0 and not is_modifier[idx - 1]
+            if before_head or after_head:
+                penalty += 0.3
+                break
+        
+        if any(self._is_comparative(w) for w in head):
+            # "the largest table"、"the second chair"
+            penalty += 0.5
+        if any(w in CLAUSE_MARKERS or w in DETERMINERS for w in head):
+            penalty += 0.5
+        if len(head) > 2:
+            penalty += 0.3
+        
+        return (" ".join(head) or None), attributes, penalty
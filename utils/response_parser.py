@@ -0,0 +1,114 @@
+"""
+Response Parser - VLM回答的解析
+所有正则和关键词表在导入时编译一次（关系短语使用trie结构的组合正则 KeywordMatcher），
+适合离线批量处理大量已保存的VLM回答
+"""
+
+import re
+import json
+from typing import Dict, List, Optional
+import logging
+
+from utils.query_parser import RELATION_PHRASES, KeywordMatcher
+
+logger = logging.getLogger(__name__)
+
+
+# 回答中的空间关系短语 -> 关系键
+# 与查询解析不同：不含 "in"/"by"（回答里多为普通介词，如 "In the image"、"Selected by"），
+# 但包含单独的 left/right/front（如 "located to the left"）；值为None的短语只用于吞掉
+# "based on" 这类不表示关系的固定搭配
+RESPONSE_RELATION_PHRASES: Dict[str, Optional[str]] = {
+    **{phrase: rel for phrase, rel in RELATION_PHRASES.items() if phrase not in ('in', 'by')},
+    'left': 'left',
+    'right': 'right',
+    'front': 'front',
+    'based on': None,
+    'depending on': None,
+}
+
+# 回答中出现多个关系时按此优先级选取（与旧的逐关键词扫描顺序一致）
+RELATION_PRIORITY = ('on', 'above', 'below', 'left', 'right', 'near', 'inside', 'behind', 'front')
+
+# 空间关系短语匹配器（trie结构的组合正则）
+RELATION_MATCHER = KeywordMatcher(RESPONSE_RELATION_PHRASES)
+
+_TARGET_PATTERN = re.compile(r'target[:\s]+([a-zA-Z\s]+)', re.IGNORECASE)
+_ANCHOR_PATTERN = re.compile(r'anchor[:\s]+([a-zA-Z\s]+)', re.IGNORECASE)
+_BBOX_PATTERN = re.compile(r'\[(\d+\.?\d*),\s*(\d+\.?\d*),\s*(\d+\.?\d*),\s*(\d+\.?\d*)\]')
+
+_JSON_OBJECT_PATTERN = re.compile(r'\{.*?\}', re.DOTALL)
+_CANDIDATE_PATTERNS = (
+    re.compile(r'\[(\d+)\]'),
+    re.compile(r'(?<![\d.])(\d+)(?!\d|\.\d)'),
+)
+
+
+def parse_grounding_response(response: str) -> Dict:
+    """
+    解析VLM的grounding响应
+    
+    Args:
+        response: VLM生成的文本
+    
+    Returns:
+        解析结果字典
+    """
+    # 尝试提取结构化信息
+    result = {
+        "target_object": None,
+        "anchor_object": None,
+        "spatial_relation": None,
+        "bounding_box": None,
+        "confidence": 0.5,
+        "raw_response": response
+    }
+    
+    # 提取目标物体
+    target_match = _TARGET_PATTERN.search(response)
+    if target_match:
+        result["target_object"] = target_match.group(1).strip()
+    
+    # 提取锚点物体
+    anchor_match = _ANCHOR_PATTERN.search(response)
+    if anchor_match:
+        result["anchor_object"] = anchor_match.group(1).strip()
+    
+    # 提取空间关系（按词匹配，多个关系时按优先级选取）
+    result["spatial_relation"] = extract_relation(response)
+    
+    # 提取边界框坐标（如果有）
+    bbox_match = _BBOX_PATTERN.search(response)
+    if bbox_match:
+        result["bounding_box"] = [float(x) for x in bbox_match.groups()]
+    
+    return result
+
+
+def extract_relation(response: str) -> Optional[str]:
+    """提取回答中的空间关系键（没有时为None）"""
+    found = {RESPONSE_RELATION_PHRASES[phrase] for phrase in RELATION_MATCHER.pattern.findall(response.lower())}
+    for relation in RELATION_PRIORITY:
+        if relation in found:
+            return relation
+    return None
+
+
+def parse_candidate_id(response: str, valid_ids: List[int]) -> Optional[int]:
+    """从VLM回答中解析候选编号（JSON、[编号] 或第一个合法数字）"""
+    json_match = _JSON_OBJECT_PATTERN.search(response)
+    if json_match:
+        try:
+            value = int(json.loads(json_match.group(0)).get("id"))
+            if value in valid_ids:
+                return value
+        except (ValueError, TypeError, AttributeError):
+            pass
+    
+    for pattern in _CANDIDATE_PATTERNS:
+        for match in pattern.finditer(response):
+            value = int(match.group(1))
+            if value in valid_ids:
+                return value
+    
+    return None
@@ -0,0 +1,164 @@
+"""
+Single Flight - 并发相同请求的去重
+同一时刻多个调用方发起完全相同的VLM请求时，只执行一次生成，所有调用方共享结果；
+提供线程版本（SingleFlight）和asyncio版本（AsyncSingleFlight）
+"""
+
+import json
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+import numpy as np
+from PIL import Image
+import logging
+
+from utils.image_encoding import ImageEncoder
+
+logger = logging.getLogger(__name__)
+
+
+def _canonical(obj: Any) -> Any:
+    """转换为可稳定序列化的结构（图像替换为内容哈希）"""
+    if isinstance(obj, dict):
+        return {str(k): _canonical(v) for k, v in sorted(obj.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(v) for v in obj]
+    if isinstance(obj, (Image.Image, np.ndarray)):
+        return {"__image__": ImageEncoder.frame_hash(obj)}
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    return repr(obj)
+
+
+def request_key(messages: List[Dict], max_tokens: int, temperature: float, **extra) -> str:
+    """
+    计算请求的去重键
+    
+    Args:
+        messages: 消息列表（图像按内容哈希，路径/URL按字符串）
+        max_tokens: 最大生成token数
+        temperature: 温度参数
+        **extra: 其他影响输出的参数（如约束解码的schema）
+    
+    Returns:
+        请求哈希
+    """
+    payload = _canonical({
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "extra": extra
+    })
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SingleFlight:
+    """
+    线程版本：相同键的并发调用只执行一次
+    
+    第一个调用方执行函数，其余调用方阻塞等待并得到同一结果（或同一异常）；
+    调用完成后键即被移除，之后的调用会重新执行（这里只合并在途请求，不做缓存）。
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.stats = {"calls": 0, "shared": 0}
+    
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        执行（或加入在途的）调用
+        
+        Args:
+            key: 去重键
+            fn: 无参数的调用函数
+        
+        Returns:
+            调用结果
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            else:
+                self.stats["shared"] += 1
+        
+        if not leader:
+            logger.debug(f"合并相同的在途请求: {key}")
+            return future.result()
+        
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats)
+
+
+class AsyncSingleFlight:
+    """
+    asyncio版本：相同键的并发协程共享同一个任务
+    
+    任务在首个调用方所在的事件循环中运行；等待方通过 asyncio.shield 等待，
+    某个等待方被取消不会取消其他调用方共享的任务。不同事件循环之间不共享任务。
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks: Dict[Tuple[int, str], asyncio.Task] = {}
+        self.stats = {"calls": 0, "shared": 0}
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行（或加入在途的）调用
+        
+        Args:
+            key: 去重键
+            fn: 返回协程的无参数函数
+        
+        Returns:
+            调用结果
+        """
+        loop = asyncio.get_running_loop()
+        task_key = (id(loop), key)
+        
+        with self._lock:
+            self.stats["calls"] += 1
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = loop.create_task(fn())
+                self._tasks[task_key] = task
+                task.add_done_callback(lambda t: self._finish(task_key, t))
+            else:
+                self.stats["shared"] += 1
+                logger.debug(f"合并相同的在途请求: {key}")
+        
+        return await asyncio.shield(task)
+    
+    def _finish(self, task_key: Tuple[int, str], task: asyncio.Task):
+        with self._lock:
+            if self._tasks.get(task_key) is task:
+                del self._tasks[task_key]
+        
+        # 所有等待方都已取消时避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,206 @@
+"""
+Text Embedder - 物体类别名称的文本嵌入
+用于OLT中的开放词汇候选匹配
+"""
+
+import re
+import zlib
+import threading
+import numpy as np
+from typing import List, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# 概念词表：规范类别名 -> 同义词/近义词
+# 规范类别名与YOLOv8 (COCO) 的类别名保持一致
+DEFAULT_CONCEPTS: Dict[str, List[str]] = {
+    "person": ["people", "man", "woman", "human", "boy", "girl", "child"],
+    "laptop": ["computer", "notebook", "macbook"],
+    "cell phone": ["phone", "mobile", "cellphone", "smartphone", "iphone"],
+    "bottle": ["container", "flask"],
+    "cup": ["mug", "glass", "teacup"],
+    "wine glass": ["goblet"],
+    "chair": ["seat", "stool", "armchair"],
+    "couch": ["sofa", "settee", "loveseat"],
+    "dining table": ["table", "desk"],
+    "bed": ["mattress"],
+    "tv": ["television", "monitor", "screen", "display"],
+    "potted plant": ["plant", "houseplant", "flower pot", "flowerpot"],
+    "book": ["books", "novel", "notebook"],
+    "keyboard": ["keypad"],
+    "mouse": ["computer mouse"],
+    "remote": ["remote control", "controller"],
+    "refrigerator": ["fridge"],
+    "oven": ["stove", "cooker"],
+    "sink": ["basin", "washbasin"],
+    "backpack": ["rucksack", "schoolbag", "bag"],
+    "handbag": ["purse", "bag"],
+    "suitcase": ["luggage"],
+    "teddy bear": ["toy", "stuffed animal", "plush"],
+    "bowl": ["dish"],
+    "clock": ["watch", "alarm clock"],
+    "vase": ["jar"],
+}
+
+
+class TextEmbedder:
+    """
+    文本嵌入器
+    
+    默认使用无需模型的哈希字符n-gram嵌入，并通过概念词表把同义词映射到
+    同一方向；指定 model_name 时改用本地 sentence-transformers 模型。
+    所有向量均L2归一化，点积即余弦相似度。
+    """
+    
+    def __init__(self,
+                 model_name: Optional[str] = None,
+                 dim: int = 512,
+                 concepts: Optional[Dict[str, List[str]]] = None,
+                 concept_weight: float = 2.0):
+        """
+        Args:
+            model_name: 本地句向量模型名称（可选，例如 "all-MiniLM-L6-v2"）
+            dim: 哈希嵌入的字符n-gram维度（每个概念另有一个专用维度）
+            concepts: 概念词表（默认使用 DEFAULT_CONCEPTS）
+            concept_weight: 概念信号相对字符n-gram的权重
+        """
+        self.model_name = model_name
+        self.ngram_dim = dim
+        self.concept_weight = concept_weight
+        self.model = None
+        
+        # 词 -> 所属概念列表（一个词可能属于多个概念，如 "bag"）
+        self._term_to_concepts: Dict[str, List[str]] = {}
+        for concept, synonyms in (concepts or DEFAULT_CONCEPTS).items():
+            for term in [concept] + synonyms:
+                self._term_to_concepts.setdefault(term.lower(), []).append(concept)
+        
+        # 概念 -> 专用维度（排在字符n-gram维度之后，不与其他概念或n-gram共用）
+        self._concept_index: Dict[str, int] = {
+            concept: dim + i for i, concept in enumerate(concepts or DEFAULT_CONCEPTS)
+        }
+        self.dim = dim + len(self._concept_index)
+        
+        self._cache: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+    
+    def _load_model(self):
+        """加载本地句向量模型"""
+        try:
+            from sentence_transformers import SentenceTransformer
+            
+            logger.info(f"加载文本嵌入模型: {self.model_name}")
+            self.model = SentenceTransformer(self.model_name)
+        except ImportError:
+            logger.warning("未安装sentence-transformers，使用哈希n-gram嵌入")
+            self.model_name = None
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        计算文本嵌入
+        
+        Args:
+            texts: 文本列表
+        
+        Returns:
+            (N, D) 归一化嵌入矩阵
+        """
+        if self.model_name and self.model is None:
+            self._load_model()
+        
+        keys = [self._normalize(t) for t in texts]
+        
+        with self._lock:
+            missing = sorted({k for k in keys if k not in self._cache})
+        
+        if missing:
+            if self.model is not None:
+                vectors = self.model.encode(missing, normalize_embeddings=True)
+            else:
+                vectors = [self._hash_embed(k) for k in missing]
+            
+            with self._lock:
+                for key, vec in zip(missing, vectors):
+                    self._cache[key] = np.asarray(vec, dtype=np.float32)
+        
+        if not keys:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        
+        return np.stack([self._cache[k] for k in keys])
+    
+    def embed_one(self, text: str) -> np.ndarray:
+        """计算单个文本的嵌入"""
+        return self.embed([text])[0]
+    
+    def _normalize(self, text: str) -> str:
+        """规范化文本：小写、去除标点和冠词、复数转单数"""
+        text = re.sub(r"[^a-z0-9\s]", " ", text.lower())
+        words = [self._singularize(w) for w in text.split() if w not in ("the", "a", "an")]
+        return " ".join(words)
+    
+    def _singularize(self, word: str) -> str:
+        """简单的英文复数还原（chairs -> chair, boxes -> box）"""
+        if len(word) <= 3 or word.endswith("ss") or word in self._term_to_concepts:
+            return word
+        if re.search(r"(s|x|ch|sh)es$", word):
+            return word[:-2]
+        if word.endswith("ies"):
+            return word[:-3] + "y"
+        if word.endswith("s"):
+            return word[:-1]
+        return word
+    
+    def _hash_embed(self, text: str) -> np.ndarray:
+        """哈希字符n-gram嵌入 + 概念信号"""
+        vec = np.zeros(self.dim, dtype=np.float32)
+        
+        # 字符trigram（每个词前后加边界符）
+        for word in text.split():
+            padded = f"<{word}>"
+            for i in range(len(padded) - 2):
+                vec[zlib.crc32(padded[i:i + 3].encode("utf-8")) % self.ngram_dim] += 1.0
+        
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec /= norm
+        
+        # 概念信号：整句和单词都尝试匹配，同一概念的词映射到同一方向
+        concepts = set(self._term_to_concepts.get(text, []))
+        if not concepts:
+            for word in text.split():
+                concepts.update(self._term_to_concepts.get(word, []))
+        
+        for concept in concepts:
+            vec[self._concept_index[concept]] += self.concept_weight / len(concepts)
+        
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec /= norm
+        
+        return vec
+    
+    def find_concept_collisions(self, min_score: float) -> List[Tuple[str, str, float]]:
+        """
+        检查概念词表：属于不同概念的两个词的相似度不应达到候选匹配阈值
+        
+        Args:
+            min_score: 候选匹配的最小余弦相似度
+        
+        Returns:
+            [(词, 词, 相似度)]，相似度不低于 min_score 的词对
+        """
+        terms = sorted(self._term_to_concepts)
+        vectors = self.embed(terms)
+        scores = vectors @ vectors.T
+        
+        collisions = []
+        for i, term_a in enumerate(terms):
+            for j in range(i + 1, len(terms)):
+                term_b = terms[j]
+                if set(self._term_to_concepts[term_a]) & set(self._term_to_concepts[term_b]):
+                    continue
+                if scores[i, j] >= min_score:
+                    collisions.append((term_a, term_b, float(scores[i, j])))
+        return collisions
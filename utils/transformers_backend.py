@@ -0,0 +1,623 @@
+"""
+Transformers Backend - 本地transformers推理后端
+加载Qwen2-VL模型并提供单条/批量/流式/约束解码生成，
+包含动态批处理、视觉输入缓存、前缀KV缓存和量化选项
+"""
+
+import copy
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import torch
+import logging
+
+from utils.vlm_backend import VLMBackend
+from utils.micro_batcher import MicroBatcher
+from utils.vision_cache import PixelCache, CachedVisionEncoder
+from utils.json_constraint import JSONSchemaLogitsProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class TransformersBackend(VLMBackend):
+    """本地Qwen2-VL模型（transformers）"""
+    
+    name = "transformers"
+    
+    def __init__(self,
+                 model_name: str = "Qwen/Qwen2-VL-7B-Instruct",
+                 device: str = "cuda",
+                 batch_max_size: int = 1,
+                 batch_timeout_ms: float = 10.0,
+                 pixel_cache_size: int = 16,
+                 vision_cache_size: int = 0,
+                 prefix_prompt: Optional[str] = None,
+                 dtype: str = "auto",
+                 quantization: Optional[str] = None):
+        """
+        Args:
+            model_name: 模型名称或路径（也可以是预量化的AWQ/GPTQ检查点）
+            device: 设备 (cuda/cpu)
+            batch_max_size: 动态批处理的最大批次大小（1表示不合并）
+            batch_timeout_ms: 收集一个批次的最长等待时间（毫秒）
+            pixel_cache_size: 缓存的预处理图像帧数（0表示不缓存）
+            vision_cache_size: 缓存的视觉编码器输出帧数（0表示不缓存）
+            prefix_prompt: 需要预计算KV缓存的固定提示词前缀（None表示不启用）
+            dtype: 模型精度 ["auto", "float16", "bfloat16", "float32"]
+            quantization: 量化方式 [None, "int8_dynamic", "int8_weight_only", "int4_weight_only"]
+        """
+        self.model_name = model_name
+        self.device = device
+        self.pixel_cache_size = pixel_cache_size
+        self.vision_cache_size = vision_cache_size
+        self.prefix_prompt = prefix_prompt
+        self.prefix_caching = prefix_prompt is not None
+        self.dtype = dtype
+        self.quantization = quantization
+        
+        self.model = None
+        self.processor = None
+        self.pixel_cache = None
+        self.vision_encoder_cache = None
+        self._prefix_ids = None
+        self._prefix_kv = None
+        self.prefix_cache_hits = 0
+        self._model_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._model_ready = False
+        
+        # 动态批处理：合并并发的 generate 调用
+        self.batcher = None
+        if batch_max_size > 1:
+            self.batcher = MicroBatcher(
+                self._process_local_batch,
+                max_batch_size=batch_max_size,
+                timeout_ms=batch_timeout_ms,
+                name="vlm-batcher"
+            )
+    
+    def load(self):
+        """确保模型已加载（首次调用时加载，线程安全）"""
+        if self._model_ready:
+            return
+        
+        with self._load_lock:
+            if self._model_ready:
+                return
+            self._load_local_model()
+            self._model_ready = True
+    
+    def _load_local_model(self):
+        """加载本地模型"""
+        try:
+            from transformers import Qwen2VLForConditionalGeneration, AutoProcessor
+            
+            logger.info(f"加载模型: {self.model_name}")
+            
+            torch_dtype = self._resolve_dtype()
+            logger.info(f"精度: {torch_dtype}, 量化: {self.quantization or '无'}")
+            
+            # 预量化的检查点（如AWQ/GPTQ）由transformers根据其配置自动加载
+            model = Qwen2VLForConditionalGeneration.from_pretrained(
+                self.model_name,
+                torch_dtype=torch_dtype,
+                device_map="auto"
+            )
+            
+            self.processor = AutoProcessor.from_pretrained(self.model_name)
+            # 批量生成需要左侧填充
+            self.processor.tokenizer.padding_side = "left"
+            
+            if self.device == "cuda" and torch.cuda.is_available():
+                model = model.to(self.device)
+            
+            model.eval()
+            self.model = self._quantize_model(model)
+            self._setup_vision_cache()
+            logger.info("模型加载完成")
+        
+        except ImportError as e:
+            logger.error("无法导入transformers或qwen-vl模块")
+            logger.error("请运行: pip install transformers qwen-vl-utils")
+            raise
+        except Exception as e:
+            logger.error(f"模型加载失败: {e}")
+            raise
+    
+    def _resolve_dtype(self) -> torch.dtype:
+        """
+        确定模型加载精度
+        
+        auto: CUDA上为float16，CPU上为float32；int8动态量化要求float32权重
+        """
+        if self.quantization == "int8_dynamic":
+            return torch.float32
+        
+        if self.dtype == "auto":
+            return torch.float16 if self.device == "cuda" else torch.float32
+        
+        dtypes = {"float16": torch.float16, "bfloat16": torch.bfloat16, "float32": torch.float32}
+        if self.dtype not in dtypes:
+            raise ValueError(f"不支持的精度: {self.dtype}")
+        
+        if self.dtype == "float16" and self.device != "cuda":
+            logger.warning("CPU上float16推理很慢，建议使用bfloat16")
+        
+        return dtypes[self.dtype]
+    
+    def _quantize_model(self, model):
+        """
+        对已加载的模型做权重量化（不依赖bitsandbytes）
+        
+        - int8_dynamic: torch.ao 动态量化（nn.Linear 权重int8，仅CPU）
+        - int8_weight_only / int4_weight_only: torchao 仅权重量化（需安装torchao）
+        """
+        if not self.quantization:
+            return model
+        
+        if self.quantization == "int8_dynamic":
+            if self.device == "cuda":
+                raise ValueError("int8_dynamic 量化只支持CPU推理")
+            
+            return torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        
+        if self.quantization in ("int8_weight_only", "int4_weight_only"):
+            try:
+                from torchao.quantization import quantize_, int8_weight_only, int4_weight_only
+            except ImportError:
+                logger.error(f"{self.quantization} 量化需要torchao")
+                logger.error("请运行: pip install torchao")
+                raise
+            
+            config = int8_weight_only() if self.quantization == "int8_weight_only" else int4_weight_only()
+            quantize_(model, config)
+            return model
+        
+        raise ValueError(f"不支持的量化方式: {self.quantization}")
+    
+    def _setup_vision_cache(self):
+        """初始化预处理像素缓存，并按需包装视觉编码器"""
+        if self.pixel_cache_size > 0:
+            self.pixel_cache = PixelCache(self.processor, max_entries=self.pixel_cache_size)
+        
+        if self.vision_cache_size <= 0 or self.pixel_cache is None:
+            return
+        
+        # 新版transformers把视觉编码器放在 model.model.visual
+        owner = self.model.model if hasattr(getattr(self.model, "model", None), "visual") else self.model
+        
+        try:
+            self.vision_encoder_cache = CachedVisionEncoder(
+                owner.visual,
+                merge_size=self.processor.image_processor.merge_size,
+                max_entries=self.vision_cache_size
+            )
+            owner.visual = self.vision_encoder_cache
+        except Exception as e:
+            logger.warning(f"无法启用视觉编码缓存: {e}")
+            self.vision_encoder_cache = None
+    
+    def generate(self,
+                 messages: List[Dict],
+                 max_tokens: int = 512,
+                 temperature: float = 0.1) -> str:
+        self.load()
+        
+        if self.batcher is not None:
+            return self.batcher.submit((messages, max_tokens), group=temperature)
+        else:
+            # 本地模型不支持并发调用
+            with self._model_lock:
+                return self._generate_local(messages, max_tokens, temperature)
+    
+    def generate_batch(self,
+                       messages_list: List[List[Dict]],
+                       max_tokens: Union[int, List[int]] = 512,
+                       temperature: float = 0.1) -> List[str]:
+        if isinstance(max_tokens, int):
+            max_tokens = [max_tokens] * len(messages_list)
+        
+        if not messages_list:
+            return []
+        
+        self.load()
+        with self._model_lock:
+            return self._generate_local_batch(messages_list, max_tokens, temperature)
+    
+    def _process_local_batch(self, temperature: float, items: List[Tuple[List[Dict], int]]) -> List[str]:
+        """MicroBatcher的批处理函数"""
+        with self._model_lock:
+            if len(items) == 1:
+                messages, max_tokens = items[0]
+                return [self._generate_local(messages, max_tokens, temperature)]
+            
+            return self._generate_local_batch(
+                [messages for messages, _ in items],
+                [max_tokens for _, max_tokens in items],
+                temperature
+            )
+    
+    def _generate_local_batch(self,
+                             messages_list: List[List[Dict]],
+                             max_tokens: List[int],
+                             temperature: float) -> List[str]:
+        """本地模型批量生成（左侧填充，按各自的 max_tokens 截断输出）"""
+        try:
+            inputs, image_keys = self._prepare_local_inputs(messages_list)
+            
+            generated_ids = self._run_model_generate(
+                inputs,
+                image_keys,
+                max_new_tokens=max(max_tokens),
+                temperature=temperature,
+                do_sample=temperature > 0
+            )
+            
+            # 左侧填充后所有输入长度相同
+            prompt_length = inputs.input_ids.shape[1]
+            generated_ids_trimmed = [
+                out_ids[prompt_length:prompt_length + limit]
+                for out_ids, limit in zip(generated_ids, max_tokens)
+            ]
+            
+            return self.processor.batch_decode(
+                generated_ids_trimmed,
+                skip_special_tokens=True,
+                clean_up_tokenization_spaces=False
+            )
+        
+        except Exception as e:
+            logger.error(f"批量生成失败: {e}")
+            raise
+    
+    def _prepare_local_inputs(self, messages_list: List[List[Dict]]):
+        """
+        把一个或多个对话转换为本地模型输入张量
+        
+        图像的预处理结果按帧缓存；命中缓存时只需对文本分词，
+        并按 image_grid_thw 手动展开图像占位token。
+        
+        Returns:
+            (模型输入, 各图像的缓存键；未使用缓存时为None)
+        """
+        from qwen_vl_utils import process_vision_info
+        
+        # 准备输入
+        texts = [
+            self.processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+            for messages in messages_list
+        ]
+        
+        elements = [
+            item for messages in messages_list for msg in messages
+            if isinstance(msg["content"], list)
+            for item in msg["content"] if item.get("type") in ("image", "video") or "video" in item
+        ]
+        
+        use_cache = (
+            self.pixel_cache is not None and elements
+            and all(item.get("type") == "image" for item in elements)
+        )
+        
+        if not use_cache:
+            # 处理图像
+            image_inputs, video_inputs = process_vision_info(messages_list)
+            
+            inputs = self.processor(
+                text=texts,
+                images=image_inputs,
+                videos=video_inputs,
+                padding=True,
+                return_tensors="pt"
+            )
+            
+            return inputs.to(self.device), None
+        
+        try:
+            keys, pixel_values, grids = zip(*(self.pixel_cache.get(item) for item in elements))
+            
+            inputs = self.processor.tokenizer(
+                self._expand_image_tokens(texts, grids),
+                padding=True,
+                return_tensors="pt"
+            )
+            inputs["pixel_values"] = torch.cat(pixel_values, dim=0)
+            inputs["image_grid_thw"] = torch.cat(grids, dim=0)
+            
+            return inputs.to(self.device), list(keys)
+        
+        except Exception as e:
+            logger.warning(f"像素缓存不可用，改用处理器逐次预处理: {e}")
+            self.pixel_cache = None
+            return self._prepare_local_inputs(messages_list)
+    
+    def _expand_image_tokens(self, texts: List[str], grids: List[torch.Tensor]) -> List[str]:
+        """把每个图像占位token展开为该图像对应的token数（与处理器的规则一致）"""
+        image_token = getattr(self.processor, "image_token", "<|image_pad|>")
+        merge_length = self.processor.image_processor.merge_size ** 2
+        grid_iter = iter(grids)
+        
+        expanded = []
+        for text in texts:
+            parts = text.split(image_token)
+            out = parts[0]
+            for part in parts[1:]:
+                num_tokens = int(next(grid_iter).prod()) // merge_length
+                out += image_token * num_tokens + part
+            expanded.append(out)
+        
+        return expanded
+    
+    def _run_model_generate(self, inputs, image_keys: Optional[List[str]], **generate_kwargs):
+        """调用 model.generate（需持有 _model_lock），并为视觉编码缓存设置图像键"""
+        if self.vision_encoder_cache is not None:
+            self.vision_encoder_cache.set_image_keys(image_keys)
+        
+        try:
+            with torch.no_grad():
+                # 纯文本输入以固定提示词开头时，从前缀KV缓存继续计算
+                past_key_values = None
+                if "pixel_values" not in inputs:
+                    past_key_values = self._get_prefix_cache(inputs["input_ids"])
+                
+                if past_key_values is not None:
+                    try:
+                        self._reset_rope_deltas(inputs["input_ids"].shape[0], inputs["input_ids"].device)
+                        output = self.model.generate(
+                            **inputs, past_key_values=past_key_values, **generate_kwargs
+                        )
+                        self.prefix_cache_hits += 1
+                        return output
+                    except Exception as e:
+                        logger.warning(f"前缀KV缓存不可用，已禁用: {e}")
+                        self.prefix_caching = False
+                
+                return self.model.generate(**inputs, **generate_kwargs)
+        finally:
+            if self.vision_encoder_cache is not None:
+                self.vision_encoder_cache.set_image_keys(None)
+    
+    def _reset_rope_deltas(self, batch_size: int, device: torch.device):
+        """
+        把模型保存的M-RoPE位置偏移重置为0（纯文本输入的偏移）
+        
+        Qwen2-VL只在 cache_position 从0开始时重新计算位置偏移，否则沿用上一次调用的
+        rope_deltas。从前缀KV缓存继续生成时第一步就不是从0开始，若上一次是图像或批量调用，
+        纯文本输入会使用错误的位置编码。偏移所在的属性随transformers版本不同，
+        可能在外层模型或 model.model 上。
+        """
+        deltas = torch.zeros((batch_size, 1), dtype=torch.long, device=device)
+        for module in (self.model, getattr(self.model, "model", None)):
+            if module is not None and hasattr(module, "rope_deltas"):
+                module.rope_deltas = deltas
+    
+    def _get_prefix_cache(self, input_ids: torch.Tensor):
+        """
+        返回与输入前缀匹配的KV缓存副本（需持有 _model_lock）
+        
+        Returns:
+            DynamicCache副本；前缀不匹配或未启用时返回None
+        """
+        if not self.prefix_caching or input_ids.shape[0] != 1:
+            return None
+        
+        if self._prefix_ids is None:
+            try:
+                self._build_prefix_cache()
+            except Exception as e:
+                logger.warning(f"无法预计算前缀KV缓存，已禁用: {e}")
+                self.prefix_caching = False
+                return None
+        
+        prefix_len = self._prefix_ids.shape[1]
+        if input_ids.shape[1] <= prefix_len:
+            return None
+        if not torch.equal(input_ids[0, :prefix_len], self._prefix_ids[0].to(input_ids.device)):
+            return None
+        
+        # generate 会原地扩展缓存，每次使用副本
+        return copy.deepcopy(self._prefix_kv)
+    
+    def _build_prefix_cache(self):
+        """预计算固定提示词前缀（对话模板 + 前缀文本）的KV缓存"""
+        sentinel = "\x00QUERY\x00"
+        text = self.processor.apply_chat_template(
+            [{"role": "user", "content": self.prefix_prompt + sentinel}],
+            tokenize=False,
+            add_generation_prompt=True
+        )
+        prefix_text = text[:text.index(sentinel)]
+        
+        prefix_ids = self.processor.tokenizer(prefix_text, return_tensors="pt").input_ids.to(self.device)
+        outputs = self.model(input_ids=prefix_ids, use_cache=True)
+        
+        self._prefix_ids = prefix_ids
+        self._prefix_kv = outputs.past_key_values
+        logger.info(f"提示词前缀KV缓存: {prefix_ids.shape[1]} tokens")
+    
+    def get_vision_cache_stats(self) -> Dict:
+        """视觉输入缓存统计"""
+        return {
+            "pixel_cache": self.pixel_cache.get_stats() if self.pixel_cache else None,
+            "vision_encoder_cache": (
+                self.vision_encoder_cache.get_stats() if self.vision_encoder_cache else None
+            )
+        }
+    
+    def get_stats(self) -> Dict:
+        stats = self.get_vision_cache_stats()
+        stats["prefix_cache_hits"] = self.prefix_cache_hits
+        stats["batcher"] = self.batcher.get_stats() if self.batcher else None
+        return stats
+    
+    def _generate_local(self,
+                       messages: List[Dict],
+                       max_tokens: int,
+                       temperature: float) -> str:
+        """本地模型生成"""
+        try:
+            inputs, image_keys = self._prepare_local_inputs([messages])
+            
+            # 生成
+            generated_ids = self._run_model_generate(
+                inputs,
+                image_keys,
+                max_new_tokens=max_tokens,
+                temperature=temperature,
+                do_sample=temperature > 0
+            )
+            
+            # 解码
+            generated_ids_trimmed = [
+                out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
+            ]
+            
+            output_text = self.processor.batch_decode(
+                generated_ids_trimmed,
+                skip_special_tokens=True,
+                clean_up_tokenization_spaces=False
+            )[0]
+            
+            return output_text
+        
+        except Exception as e:
+            logger.error(f"生成失败: {e}")
+            raise
+    
+    def generate_stream(self,
+                        messages: List[Dict],
+                        max_tokens: int = 512,
+                        temperature: float = 0.1) -> Iterator[str]:
+        """本地模型流式生成（TextIteratorStreamer + 后台生成线程）"""
+        from transformers import TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
+        
+        class _StopOnEvent(StoppingCriteria):
+            def __init__(self, event: threading.Event):
+                self.event = event
+            
+            def __call__(self, input_ids, scores, **kwargs) -> bool:
+                return self.event.is_set()
+        
+        self.load()
+        inputs, image_keys = self._prepare_local_inputs([messages])
+        streamer = TextIteratorStreamer(
+            self.processor.tokenizer,
+            skip_prompt=True,
+            skip_special_tokens=True,
+            clean_up_tokenization_spaces=False
+        )
+        stop_event = threading.Event()
+        errors = []
+        
+        def run():
+            try:
+                with self._model_lock:
+                    self._run_model_generate(
+                        inputs,
+                        image_keys,
+                        max_new_tokens=max_tokens,
+                        temperature=temperature,
+                        do_sample=temperature > 0,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([_StopOnEvent(stop_event)])
+                    )
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+        
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        
+        try:
+            for chunk in streamer:
+                if chunk:
+                    yield chunk
+        finally:
+            # 调用方提前停止时通知生成线程结束
+            stop_event.set()
+            thread.join()
+        
+        if errors:
+            logger.error(f"生成失败: {errors[0]}")
+            raise errors[0]
+    
+    def generate_json(self,
+                      messages: List[Dict],
+                      schema: Dict,
+                      max_tokens: int = 512,
+                      temperature: float = 0.1) -> str:
+        """约束解码：logits processor 只允许合法的JSON前缀"""
+        from transformers import LogitsProcessorList
+        
+        self.load()
+        with self._model_lock:
+            inputs, image_keys = self._prepare_local_inputs([messages])
+            prompt_length = inputs.input_ids.shape[1]
+            
+            processor = JSONSchemaLogitsProcessor(
+                self.processor.tokenizer, schema, prompt_length, self._eos_token_ids()
+            )
+            
+            generated_ids = self._run_model_generate(
+                inputs,
+                image_keys,
+                max_new_tokens=max_tokens,
+                temperature=temperature,
+                do_sample=temperature > 0,
+                logits_processor=LogitsProcessorList([processor])
+            )
+        
+        return self.processor.batch_decode(
+            generated_ids[:, prompt_length:],
+            skip_special_tokens=True,
+            clean_up_tokenization_spaces=False
+        )[0]
+    
+    def generate_json_batch(self,
+                            messages_list: List[List[Dict]],
+                            schema: Dict,
+                            max_tokens: int = 512,
+                            temperature: float = 0.1) -> List[str]:
+        """批量约束解码（左侧填充后一次生成，每一行分别约束为合法JSON）"""
+        from transformers import LogitsProcessorList
+        
+        if not messages_list:
+            return []
+        
+        self.load()
+        with self._model_lock:
+            inputs, image_keys = self._prepare_local_inputs(messages_list)
+            # 左侧填充后所有输入长度相同
+            prompt_length = inputs.input_ids.shape[1]
+            
+            processor = JSONSchemaLogitsProcessor(
+                self.processor.tokenizer, schema, prompt_length, self._eos_token_ids()
+            )
+            
+            generated_ids = self._run_model_generate(
+                inputs,
+                image_keys,
+                max_new_tokens=max_tokens,
+                temperature=temperature,
+                do_sample=temperature > 0,
+                logits_processor=LogitsProcessorList([processor])
+            )
+        
+        return self.processor.batch_decode(
+            generated_ids[:, prompt_length:],
+            skip_special_tokens=True,
+            clean_up_tokenization_spaces=False
+        )
+    
+    def _eos_token_ids(self) -> List[int]:
+        eos_token_ids = self.model.generation_config.eos_token_id
+        if eos_token_ids is None:
+            eos_token_ids = self.processor.tokenizer.eos_token_id
+        if isinstance(eos_token_ids, int):
+            eos_token_ids = [eos_token_ids]
+        return list(eos_token_ids)
+    
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
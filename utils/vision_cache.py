@@ -0,0 +1,177 @@
+"""
+Vision Cache - 本地Qwen2-VL的视觉输入缓存
+缓存预处理后的像素张量（pixel_values / image_grid_thw），并可选缓存视觉编码器输出，
+同一关键帧出现在多个提示中时只需重新计算文本部分
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import torch
+import logging
+
+from utils.image_encoding import ImageEncoder
+
+logger = logging.getLogger(__name__)
+
+
+# 影响预处理结果的图像元素字段
+_RESIZE_KEYS = ("min_pixels", "max_pixels", "resized_height", "resized_width")
+
+
+def image_element_key(element: Dict) -> str:
+    """
+    计算消息中图像元素的缓存键（帧内容哈希 + 分辨率参数）
+    
+    Args:
+        element: 消息内容中的图像元素，如 {"type": "image", "image": img}
+    """
+    image = element.get("image", element.get("image_url"))
+    
+    if isinstance(image, str):
+        content = f"path:{image}"
+    elif hasattr(image, "tobytes") or isinstance(image, np.ndarray):
+        content = ImageEncoder.frame_hash(image)
+    else:
+        content = f"object:{id(image)}"
+    
+    resize = ",".join(f"{k}={element[k]}" for k in _RESIZE_KEYS if k in element)
+    return hashlib.blake2b(f"{content}|{resize}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _LRU:
+    """线程安全的简单LRU"""
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: str):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key: str, value: Any):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class PixelCache:
+    """预处理像素张量缓存：图像键 -> (pixel_values, image_grid_thw)"""
+    
+    def __init__(self, processor, max_entries: int = 16):
+        """
+        Args:
+            processor: Qwen2-VL的 AutoProcessor
+            max_entries: 最大缓存帧数
+        """
+        self.processor = processor
+        self._cache = _LRU(max_entries)
+    
+    def get(self, element: Dict) -> Tuple[str, torch.Tensor, torch.Tensor]:
+        """
+        获取图像元素的预处理结果（未命中时计算并缓存）
+        
+        Returns:
+            (图像键, pixel_values, image_grid_thw)
+        """
+        from qwen_vl_utils import fetch_image
+        
+        key = image_element_key(element)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return (key,) + cached
+        
+        image = fetch_image(element)
+        features = self.processor.image_processor(images=[image], return_tensors="pt")
+        value = (features["pixel_values"], features["image_grid_thw"])
+        self._cache.put(key, value)
+        
+        return (key,) + value
+    
+    def get_stats(self) -> Dict:
+        return {"entries": len(self._cache), "hits": self._cache.hits, "misses": self._cache.misses}
+
+
+class CachedVisionEncoder(torch.nn.Module):
+    """
+    视觉编码器包装：按图像缓存编码输出
+    
+    调用前通过 set_image_keys() 设置本次输入中各图像的键（与 grid_thw 顺序一致）；
+    未设置键或切分失败时直接调用原始编码器。
+    """
+    
+    def __init__(self, visual: torch.nn.Module, merge_size: int = 2, max_entries: int = 32):
+        """
+        Args:
+            visual: 原始视觉编码器（model.visual）
+            merge_size: 空间合并尺寸（每 merge_size² 个patch合并为一个token）
+            max_entries: 最大缓存图像数
+        """
+        super().__init__()
+        self.inner = visual
+        self.merge_size = merge_size
+        self._cache = _LRU(max_entries)
+        self._keys: Optional[List[str]] = None
+        self.enabled = True
+    
+    def __getattr__(self, name: str):
+        # 透传原始编码器的属性（如 get_dtype、dtype）
+        try:
+            return super().__getattr__(name)
+        except AttributeError:
+            return getattr(super().__getattr__("inner"), name)
+    
+    def set_image_keys(self, keys: Optional[List[str]]):
+        self._keys = keys
+    
+    def forward(self, pixel_values: torch.Tensor, grid_thw: torch.Tensor, **kwargs) -> torch.Tensor:
+        keys, self._keys = self._keys, None
+        
+        if not self.enabled or keys is None or len(keys) != len(grid_thw):
+            return self.inner(pixel_values, grid_thw=grid_thw, **kwargs)
+        
+        try:
+            patch_counts = grid_thw.prod(dim=-1).tolist()
+            chunks = torch.split(pixel_values, patch_counts, dim=0)
+            outputs = []
+            
+            for key, chunk, grid in zip(keys, chunks, grid_thw):
+                embeds = self._cache.get(key)
+                if embeds is None:
+                    embeds = self.inner(chunk, grid_thw=grid.unsqueeze(0), **kwargs)
+                    self._cache.put(key, embeds)
+                outputs.append(embeds)
+            
+            return torch.cat(outputs, dim=0)
+        
+        except Exception as e:
+            logger.warning(f"视觉编码缓存失败，已禁用: {e}")
+            self.enabled = False
+            self._cache.clear()
+            return self.inner(pixel_values, grid_thw=grid_thw, **kwargs)
+    
+    def get_stats(self) -> Dict:
+        return {"entries": len(self._cache), "hits": self._cache.hits, "misses": self._cache.misses}
@@ -0,0 +1,385 @@
+"""
+vLLM API Client - OpenAI兼容接口的HTTP客户端
+同步调用使用连接池复用的 requests.Session，异步调用使用 aiohttp；
+两者都支持并发上限和带抖动的指数退避重试
+"""
+
+import time
+import json
+import random
+import asyncio
+import threading
+from typing import List, Dict, Optional, Iterator
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# 可重试的HTTP状态码（限流和服务端错误）
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# SSE流结束标记
+_SSE_DONE = object()
+
+
+class APIError(RuntimeError):
+    """API调用失败"""
+    
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+    
+    @property
+    def retryable(self) -> bool:
+        return self.status is None or self.status in RETRYABLE_STATUS
+
+
+class VLLMAPIClient:
+    """vLLM (OpenAI兼容) chat/completions 客户端"""
+    
+    def __init__(self,
+                 api_url: str,
+                 model_name: str,
+                 api_key: Optional[str] = None,
+                 max_concurrency: int = 8,
+                 max_retries: int = 3,
+                 timeout: float = 60.0,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 8.0):
+        """
+        Args:
+            api_url: API服务器地址（如 http://localhost:8000/v1）
+            model_name: 模型名称
+            api_key: API密钥
+            max_concurrency: 同时在途的最大请求数（也是连接池大小）
+            max_retries: 失败后的最大重试次数
+            timeout: 单次请求超时（秒）
+            backoff_base: 退避基准时间（秒）
+            backoff_max: 单次退避的最长时间（秒）
+        """
+        self.api_url = api_url.rstrip("/")
+        self.model_name = model_name
+        self.api_key = api_key
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(0, max_retries)
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        
+        # 同步：连接池会话 + 并发信号量
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        
+        # 异步：aiohttp会话和信号量绑定到创建它们的事件循环
+        self._async_session = None
+        self._async_semaphore = None
+        self._async_loop = None
+    
+    @property
+    def endpoint(self) -> str:
+        return f"{self.api_url}/chat/completions"
+    
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+    
+    def build_payload(self,
+                      api_messages: List[Dict],
+                      max_tokens: int,
+                      temperature: float,
+                      **extra) -> Dict:
+        """构建请求体"""
+        payload = {
+            "model": self.model_name,
+            "messages": api_messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        payload.update(extra)
+        return payload
+    
+    def _backoff(self, attempt: int) -> float:
+        """指数退避 + 全抖动（full jitter）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+    
+    @staticmethod
+    def _log_request(body: bytes, start: float, stage: str):
+        """记录请求体大小和上传（到收到响应）耗时"""
+        logger.debug(f"API请求: {len(body) / 1024:.1f} KB, {stage}耗时 {time.time() - start:.2f}s")
+    
+    @staticmethod
+    def _extract_content(result: Dict) -> str:
+        try:
+            return result["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise APIError(f"无法解析API响应: {e}", status=200) from e
+    
+    # ===== 同步接口 =====
+    
+    def _get_session(self):
+        """获取（或创建）连接池会话"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=1,
+                        pool_maxsize=self.max_concurrency
+                    )
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    session.headers.update(self._headers())
+                    self._session = session
+        
+        return self._session
+    
+    def chat(self,
+             api_messages: List[Dict],
+             max_tokens: int = 512,
+             temperature: float = 0.7,
+             **extra) -> str:
+        """
+        同步调用 chat/completions
+        
+        Args:
+            api_messages: API格式的消息列表
+            max_tokens: 最大生成token数
+            temperature: 温度参数
+            **extra: 其他请求字段
+        
+        Returns:
+            生成的文本
+        """
+        import requests
+        
+        payload = self.build_payload(api_messages, max_tokens, temperature, **extra)
+        body = json.dumps(payload).encode("utf-8")
+        session = self._get_session()
+        
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._semaphore:
+                    request_start = time.time()
+                    response = session.post(self.endpoint, data=body, timeout=self.timeout)
+                    self._log_request(body, request_start, "响应")
+                
+                if response.status_code >= 400:
+                    raise APIError(
+                        f"HTTP {response.status_code}: {response.text[:200]}",
+                        status=response.status_code
+                    )
+                
+                return self._extract_content(response.json())
+            
+            except (requests.ConnectionError, requests.Timeout, APIError) as e:
+                retryable = not isinstance(e, APIError) or e.retryable
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                
+                delay = self._backoff(attempt)
+                logger.warning(f"API调用失败，{delay:.2f}s后重试 ({attempt + 1}/{self.max_retries}): {e}")
+                time.sleep(delay)
+    
+    def chat_stream(self,
+                    api_messages: List[Dict],
+                    max_tokens: int = 512,
+                    temperature: float = 0.7,
+                    **extra) -> Iterator[str]:
+        """
+        流式调用 chat/completions（SSE）
+        
+        只在收到第一个片段之前重试；提前关闭迭代器会断开连接，服务端随之中止生成。
+        
+        Yields:
+            增量文本片段
+        """
+        import requests
+        
+        payload = self.build_payload(api_messages, max_tokens, temperature, stream=True, **extra)
+        body = json.dumps(payload).encode("utf-8")
+        session = self._get_session()
+        received = False
+        
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._semaphore:
+                    request_start = time.time()
+                    response = session.post(
+                        self.endpoint, data=body, timeout=self.timeout, stream=True
+                    )
+                    self._log_request(body, request_start, "响应头")
+                    
+                    with response:
+                        if response.status_code >= 400:
+                            raise APIError(
+                                f"HTTP {response.status_code}: {response.text[:200]}",
+                                status=response.status_code
+                            )
+                        
+                        for line in response.iter_lines(decode_unicode=True):
+                            chunk = self._parse_sse_line(line)
+                            if chunk is None:
+                                continue
+                            if chunk is _SSE_DONE:
+                                return
+                            received = True
+                            yield chunk
+                return
+            
+            except (requests.ConnectionError, requests.Timeout, APIError) as e:
+                retryable = not isinstance(e, APIError) or e.retryable
+                if received or not retryable or attempt >= self.max_retries:
+                    raise
+                
+                delay = self._backoff(attempt)
+                logger.warning(f"API调用失败，{delay:.2f}s后重试 ({attempt + 1}/{self.max_retries}): {e}")
+                time.sleep(delay)
+    
+    @staticmethod
+    def _parse_sse_line(line: Optional[str]):
+        """
+        解析一行SSE数据
+        
+        Returns:
+            增量文本；流结束返回 _SSE_DONE；无内容的行返回None
+        """
+        if not line or not line.startswith("data:"):
+            return None
+        
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return _SSE_DONE
+        
+        try:
+            delta = json.loads(data)["choices"][0].get("delta", {})
+        except (ValueError, KeyError, IndexError) as e:
+            raise APIError(f"无法解析SSE数据: {e}", status=200) from e
+        
+        return delta.get("content") or None
+    
+    # ===== 异步接口 =====
+    
+    def _get_async_session(self):
+        """获取当前事件循环上的aiohttp会话（保持长连接）"""
+        loop = asyncio.get_running_loop()
+        
+        if self._async_session is None or self._async_session.closed or self._async_loop is not loop:
+            try:
+                import aiohttp
+            except ImportError as e:
+                raise ImportError("异步API调用需要aiohttp: pip install aiohttp") from e
+            
+            # 事件循环变化（如多次 asyncio.run）：旧会话的连接属于旧循环，先释放再新建
+            self._release_async_session()
+            
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                keepalive_timeout=30
+            )
+            self._async_session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self._headers(),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._async_loop = loop
+        
+        return self._async_session
+    
+    async def achat(self,
+                    api_messages: List[Dict],
+                    max_tokens: int = 512,
+                    temperature: float = 0.7,
+                    **extra) -> str:
+        """
+        异步调用 chat/completions（参数同 chat）
+        
+        Returns:
+            生成的文本
+        """
+        session = self._get_async_session()
+        payload = self.build_payload(api_messages, max_tokens, temperature, **extra)
+        body = json.dumps(payload).encode("utf-8")
+        
+        import aiohttp
+        
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._async_semaphore:
+                    request_start = time.time()
+                    async with session.post(self.endpoint, data=body) as response:
+                        self._log_request(body, request_start, "响应头")
+                        if response.status >= 400:
+                            text = await response.text()
+                            raise APIError(f"HTTP {response.status}: {text[:200]}", status=response.status)
+                        
+                        result = await response.json(content_type=None)
+                
+                return self._extract_content(result)
+            
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError, APIError) as e:
+                retryable = not isinstance(e, APIError) or e.retryable
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                
+                delay = self._backoff(attempt)
+                logger.warning(f"API调用失败，{delay:.2f}s后重试 ({attempt + 1}/{self.max_retries}): {e}")
+                await asyncio.sleep(delay)
+    
+    def _release_async_session(self):
+        """
+        释放当前的异步会话（不要求在其事件循环中调用）
+        
+        旧循环仍可运行时把关闭操作提交给它；旧循环已关闭时无法再等待关闭协程，
+        只同步关闭连接器中的连接。
+        """
+        session, loop = self._async_session, self._async_loop
+        self._async_session = None
+        self._async_semaphore = None
+        self._async_loop = None
+        
+        if session is None or session.closed:
+            return
+        
+        if loop is not None and not loop.is_closed():
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(session.close(), loop)
+            else:
+                loop.run_until_complete(session.close())
+            return
+        
+        connector = session.connector
+        session.detach()
+        if connector is not None and not connector.closed:
+            try:
+                connector.close()
+            except RuntimeError as e:
+                logger.debug(f"关闭旧事件循环上的连接失败: {e}")
+    
+    async def aclose(self):
+        """关闭异步会话"""
+        if self._async_session is None:
+            return
+        
+        if self._async_loop is asyncio.get_running_loop():
+            session = self._async_session
+            self._async_session = None
+            self._async_semaphore = None
+            self._async_loop = None
+            if not session.closed:
+                await session.close()
+        else:
+            self._release_async_session()
+    
+    def close(self):
+        """关闭同步会话和异步会话"""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+        self._release_async_session()
@@ -0,0 +1,372 @@
+"""
+VLM Backend - VLM推理后端接口
+QwenVLMClient 负责查询解析、缓存和统计，具体的推理交给后端：
+本地transformers（TransformersBackend）、OpenAI兼容HTTP服务（OpenAICompatibleBackend）
+和不需要模型的确定性模拟后端（MockBackend）
+"""
+
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Union
+import numpy as np
+from PIL import Image
+import logging
+
+from utils.vllm_api import VLLMAPIClient, APIError
+from utils.image_encoding import ImageEncoder
+from utils.query_parser import RuleBasedQueryParser
+from utils.json_constraint import api_constraint_fields
+
+logger = logging.getLogger(__name__)
+
+
+class VLMBackend(ABC):
+    """
+    VLM推理后端
+    
+    子类至少实现 generate 和 generate_stream；批量、异步和约束解码有基于它们的默认实现，
+    后端有更高效的方式时（如服务端并发、logits约束）再覆盖。
+    消息格式与 QwenVLMClient.generate 相同。
+    """
+    
+    name = "base"
+    
+    def load(self):
+        """加载模型（需幂等且线程安全，可由后台预加载线程调用）"""
+    
+    @abstractmethod
+    def generate(self,
+                 messages: List[Dict],
+                 max_tokens: int = 512,
+                 temperature: float = 0.1) -> str:
+        """生成响应"""
+    
+    @abstractmethod
+    def generate_stream(self,
+                        messages: List[Dict],
+                        max_tokens: int = 512,
+                        temperature: float = 0.1) -> Iterator[str]:
+        """流式生成响应（提前关闭迭代器应中止生成）"""
+    
+    def generate_batch(self,
+                       messages_list: List[List[Dict]],
+                       max_tokens: Union[int, List[int]] = 512,
+                       temperature: float = 0.1) -> List[str]:
+        """批量生成响应（默认逐个生成）"""
+        if isinstance(max_tokens, int):
+            max_tokens = [max_tokens] * len(messages_list)
+        
+        return [
+            self.generate(messages, limit, temperature)
+            for messages, limit in zip(messages_list, max_tokens)
+        ]
+    
+    async def agenerate(self,
+                        messages: List[Dict],
+                        max_tokens: int = 512,
+                        temperature: float = 0.1) -> str:
+        """异步生成响应（默认在线程中执行 generate）"""
+        return await asyncio.to_thread(self.generate, messages, max_tokens, temperature)
+    
+    def generate_json(self,
+                      messages: List[Dict],
+                      schema: Dict,
+                      max_tokens: int = 512,
+                      temperature: float = 0.1) -> str:
+        """
+        约束解码生成JSON（默认不做约束，由调用方解析和校验）
+        
+        Returns:
+            原始输出文本
+        """
+        return self.generate(messages, max_tokens, temperature)
+    
+    def get_stats(self) -> Dict:
+        """后端统计（缓存命中、批处理等）"""
+        return {}
+    
+    def close(self):
+        """释放连接、后台线程等资源"""
+    
+    async def aclose(self):
+        """在事件循环中释放资源（默认与 close 相同）"""
+        self.close()
+
+
+class OpenAICompatibleBackend(VLMBackend):
+    """OpenAI兼容的 chat/completions HTTP服务（vLLM等）"""
+    
+    name = "openai"
+    
+    def __init__(self,
+                 api_url: str,
+                 model_name: str,
+                 api_key: Optional[str] = None,
+                 max_concurrency: int = 8,
+                 max_retries: int = 3,
+                 timeout: float = 60.0,
+                 image_encoder: Optional[ImageEncoder] = None,
+                 guided_mode: str = "guided_json"):
+        """
+        Args:
+            api_url: API服务器地址
+            model_name: 模型名称
+            api_key: API密钥
+            max_concurrency: 同时在途的最大请求数
+            max_retries: 失败后的最大重试次数
+            timeout: 单次请求超时（秒）
+            image_encoder: 图像编码器（可选，默认JPEG并限制在Qwen2-VL像素范围内）
+            guided_mode: 约束解码方式 ["guided_json", "response_format", "none"]
+        """
+        self.api_client = VLLMAPIClient(
+            api_url=api_url,
+            model_name=model_name,
+            api_key=api_key,
+            max_concurrency=max_concurrency,
+            max_retries=max_retries,
+            timeout=timeout
+        )
+        self.image_encoder = image_encoder or ImageEncoder()
+        self.guided_mode = guided_mode
+    
+    def generate(self,
+                 messages: List[Dict],
+                 max_tokens: int = 512,
+                 temperature: float = 0.1) -> str:
+        """通过API生成（连接池复用，失败自动重试）"""
+        try:
+            api_messages = self.convert_messages(messages)
+            return self.api_client.chat(api_messages, max_tokens, temperature)
+        except Exception as e:
+            logger.error(f"API调用失败: {e}")
+            raise
+    
+    def generate_stream(self,
+                        messages: List[Dict],
+                        max_tokens: int = 512,
+                        temperature: float = 0.1) -> Iterator[str]:
+        api_messages = self.convert_messages(messages)
+        yield from self.api_client.chat_stream(api_messages, max_tokens, temperature)
+    
+    def generate_batch(self,
+                       messages_list: List[List[Dict]],
+                       max_tokens: Union[int, List[int]] = 512,
+                       temperature: float = 0.1) -> List[str]:
+        """服务端做连续批处理，这里只需要并发发送"""
+        if isinstance(max_tokens, int):
+            max_tokens = [max_tokens] * len(messages_list)
+        
+        if not messages_list:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=self.api_client.max_concurrency) as executor:
+            return list(executor.map(
+                lambda args: self.generate(args[0], args[1], temperature),
+                zip(messages_list, max_tokens)
+            ))
+    
+    async def agenerate(self,
+                        messages: List[Dict],
+                        max_tokens: int = 512,
+                        temperature: float = 0.1) -> str:
+        """多个请求可以同时在途"""
+        api_messages = self.convert_messages(messages)
+        try:
+            return await self.api_client.achat(api_messages, max_tokens, temperature)
+        except Exception as e:
+            logger.error(f"API调用失败: {e}")
+            raise
+    
+    def generate_json(self,
+                      messages: List[Dict],
+                      schema: Dict,
+                      max_tokens: int = 512,
+                      temperature: float = 0.1) -> str:
+        """使用 guided_json / response_format 约束（服务端不支持时自动关闭）"""
+        api_messages = self.convert_messages(messages)
+        constraint = api_constraint_fields(schema, self.guided_mode)
+        
+        try:
+            return self.api_client.chat(api_messages, max_tokens, temperature, **constraint)
+        except APIError as e:
+            if not constraint or e.status != 400:
+                raise
+            logger.warning(f"服务端不支持约束解码 ({self.guided_mode})，已关闭: {e}")
+            self.guided_mode = "none"
+            return self.api_client.chat(api_messages, max_tokens, temperature)
+    
+    def convert_messages(self, messages: List[Dict]) -> List[Dict]:
+        """转换消息格式为API格式"""
+        api_messages = []
+        
+        for msg in messages:
+            role = msg["role"]
+            content = msg["content"]
+            
+            if isinstance(content, str):
+                api_messages.append({"role": role, "content": content})
+            elif isinstance(content, list):
+                # 处理多模态内容
+                converted_content = []
+                
+                for item in content:
+                    if item["type"] == "text":
+                        converted_content.append({
+                            "type": "text",
+                            "text": item["text"]
+                        })
+                    elif item["type"] == "image":
+                        # 转换图像为base64
+                        image = item["image"]
+                        if isinstance(image, str):
+                            # 已经是路径或URL
+                            converted_content.append({
+                                "type": "image_url",
+                                "image_url": {"url": image}
+                            })
+                        else:
+                            # PIL Image或numpy array
+                            image_url = self._image_to_base64(image)
+                            converted_content.append({
+                                "type": "image_url",
+                                "image_url": {"url": image_url}
+                            })
+                
+                api_messages.append({"role": role, "content": converted_content})
+        
+        return api_messages
+    
+    def _image_to_base64(self, image: Union[Image.Image, np.ndarray]) -> str:
+        """转换图像为base64编码的data URL（缩放、压缩并按帧缓存）"""
+        return self.image_encoder.encode(image)
+    
+    def get_stats(self) -> Dict:
+        return {"image_encoder": self.image_encoder.get_stats()}
+    
+    async def aclose(self):
+        await self.api_client.aclose()
+    
+    def close(self):
+        self.api_client.close()
+
+
+# ===== 模拟后端 =====
+
+# 多候选验证提示词中的候选编号列表
+_CANDIDATE_IDS = re.compile(r"候选编号:\s*\[([\d,\s]*)\]")
+
+# 查询解析提示词中查询所在的位置
+_QUERY_MARKER = "查询:\n"
+
+_rule_parser = RuleBasedQueryParser()
+
+
+def mock_response(messages: List[Dict]) -> str:
+    """
+    模拟VLM回答（确定性，不依赖模型）
+    
+    - 查询解析提示词：返回规则解析得到的JSON
+    - 多候选验证提示词：返回第一个候选编号 {"id": N}
+    - 其他：返回基于提示词哈希的固定文本
+    
+    Args:
+        messages: 消息列表（本地格式或API格式均可，只读取文本部分）
+    """
+    texts = []
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            texts.extend(item.get("text", "") for item in content if item.get("type") == "text")
+    text = "\n".join(texts)
+    
+    if _QUERY_MARKER in text:
+        query = text.rsplit(_QUERY_MARKER, 1)[1].strip()
+        return json.dumps(_rule_parser.parse(query)[0], ensure_ascii=False)
+    
+    match = _CANDIDATE_IDS.search(text)
+    if match and match.group(1).strip():
+        return json.dumps({"id": int(match.group(1).split(",")[0])})
+    
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=4).hexdigest()
+    return f"mock response {digest}"
+
+
+def split_chunks(text: str, max_tokens: int, chunk_chars: int = 4) -> List[str]:
+    """把文本切成模拟token片段（每片 chunk_chars 个字符，最多 max_tokens 片）"""
+    chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+    return chunks[:max(0, max_tokens)]
+
+
+class MockBackend(VLMBackend):
+    """
+    进程内模拟后端
+    
+    按固定延迟返回确定性回答，用于在没有GPU和网络的环境中测试流水线、
+    缓存和并发逻辑。延迟模型：首token延迟 latency + 每个片段 token_latency。
+    """
+    
+    name = "mock"
+    
+    def __init__(self,
+                 responder: Optional[Callable[[List[Dict]], str]] = None,
+                 latency: float = 0.0,
+                 token_latency: float = 0.0,
+                 chunk_chars: int = 4):
+        """
+        Args:
+            responder: 回答函数 (消息列表) -> 文本（默认 mock_response）
+            latency: 每次调用的首token延迟（秒）
+            token_latency: 每个输出片段的延迟（秒）
+            chunk_chars: 每个模拟token片段的字符数
+        """
+        self.responder = responder or mock_response
+        self.latency = latency
+        self.token_latency = token_latency
+        self.chunk_chars = chunk_chars
+        self.stats = {"calls": 0, "chunks": 0}
+        self._lock = threading.Lock()
+    
+    def _respond(self, messages: List[Dict], max_tokens: int) -> List[str]:
+        chunks = split_chunks(self.responder(messages), max_tokens, self.chunk_chars)
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["chunks"] += len(chunks)
+        return chunks
+    
+    def generate(self,
+                 messages: List[Dict],
+                 max_tokens: int = 512,
+                 temperature: float = 0.1) -> str:
+        chunks = self._respond(messages, max_tokens)
+        time.sleep(self.latency + self.token_latency * len(chunks))
+        return "".join(chunks)
+    
+    def generate_stream(self,
+                        messages: List[Dict],
+                        max_tokens: int = 512,
+                        temperature: float = 0.1) -> Iterator[str]:
+        chunks = self._respond(messages, max_tokens)
+        time.sleep(self.latency)
+        for chunk in chunks:
+            time.sleep(self.token_latency)
+            yield chunk
+    
+    async def agenerate(self,
+                        messages: List[Dict],
+                        max_tokens: int = 512,
+                        temperature: float = 0.1) -> str:
+        chunks = self._respond(messages, max_tokens)
+        await asyncio.sleep(self.latency + self.token_latency * len(chunks))
+        return "".join(chunks)
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats)
@@ -3,18 +3,142 @@ VLM Client - Qwen2-VL模型客户端
 支持本地部署和API调用
 """
 
-import torch
-from typing import List, Dict, Optional, Union, Tuple
-import numpy as np
+from typing import List, Dict, Optional, Union, Tuple, Iterator
+from dataclasses import dataclass, asdict
 import logging
-from PIL import Image
-import base64
-import io
-import re
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.query_cache import QueryParseCache
+from utils.query_parser import RuleBasedQueryParser
+from utils.image_encoding import ImageEncoder
+from utils.json_constraint import JSONPrefixValidator, QUERY_COMPONENTS_SCHEMA
+from utils.vlm_backend import VLMBackend, OpenAICompatibleBackend
+from utils.response_parser import parse_grounding_response
+from utils.single_flight import SingleFlight, AsyncSingleFlight, request_key
 
 logger = logging.getLogger(__name__)
 
 
+_QUERY_COMPONENTS_VALIDATOR = JSONPrefixValidator(QUERY_COMPONENTS_SCHEMA)
+
+
+def is_valid_query_components(result) -> bool:
+    """查询解析结果是否符合 QUERY_COMPONENTS_SCHEMA 且目标物体非空"""
+    if not isinstance(result, dict):
+        return False
+    target = result.get("target")
+    if not isinstance(target, str) or not target.strip():
+        return False
+    return _QUERY_COMPONENTS_VALIDATOR.is_complete(json.dumps(result, ensure_ascii=False))
+
+
+# 查询解析提示词模板
+# 固定的说明部分在前、查询在最后一行，使不同查询共享尽可能长的前缀
+# （本地模式复用前缀KV缓存，API模式利用vLLM的前缀缓存）
+QUERY_PARSE_PROMPT = """分析查询，提取目标物体、锚点物体和空间关系。
+
+请以JSON格式返回：
+{{
+    "target": "目标物体名称",
+    "anchor": "锚点物体名称（如果有）",
+    "relation": "空间关系（如果有，例如on/above/near等）",
+    "target_attributes": ["颜色", "材质等属性"]
+}}
+
+只返回JSON，不要其他文字。
+
+查询:
+{query}"""
+
+# 固定前缀（查询之前的部分），本地模式预计算其KV缓存
+QUERY_PARSE_PREFIX = QUERY_PARSE_PROMPT[:QUERY_PARSE_PROMPT.index("{query}")].format()
+
+# 模板版本：模板变化时查询解析缓存自动失效
+QUERY_PARSE_PROMPT_VERSION = hashlib.sha1(QUERY_PARSE_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
+@dataclass
+class QueryAnalysis:
+    """查询解析结果（每次运行只解析一次，在定位、结果组装和日志中复用）"""
+    query: str
+    components: Dict  # {"target", "anchor", "relation", "target_attributes"}
+    source: str = "vlm"  # 解析来源: vlm / rules / cache
+    parse_time: float = 0.0  # 解析耗时（秒）
+    
+    @property
+    def target(self) -> str:
+        return (self.components.get("target") or "").strip()
+    
+    @property
+    def anchor(self) -> str:
+        return (self.components.get("anchor") or "").strip()
+    
+    @property
+    def relation(self) -> Optional[str]:
+        return self.components.get("relation") or None
+    
+    def to_dict(self) -> Dict:
+        """转换为字典（用于序列化）"""
+        return asdict(self)
+
+
+class JSONObjectDetector:
+    """
+    流式JSON对象完整性检测
+    
+    逐片段累积文本并跟踪花括号深度（忽略字符串内的括号和转义字符），
+    第一个顶层对象闭合时返回其文本。
+    """
+    
+    def __init__(self):
+        self.text = ""
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.start = -1
+        self.result: Optional[str] = None
+    
+    def feed(self, chunk: str) -> Optional[str]:
+        """
+        输入一个文本片段
+        
+        Returns:
+            完整的JSON对象文本，尚未完整时返回None
+        """
+        if self.result is not None:
+            return self.result
+        
+        offset = len(self.text)
+        self.text += chunk
+        
+        for i, ch in enumerate(chunk, start=offset):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"' and self.depth > 0:
+                self.in_string = True
+            elif ch == "{":
+                if self.depth == 0:
+                    self.start = i
+                self.depth += 1
+            elif ch == "}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.text = self.text[:i + 1]
+                    self.result = self.text[self.start:]
+                    return self.result
+        
+        return None
+
+
 class QwenVLMClient:
     """Qwen2-VL视觉-语言模型客户端"""
     
@@ -23,7 +147,25 @@ class QwenVLMClient:
                  device: str = "cuda",
                  use_api: bool = False,
                  api_url: Optional[str] = None,
-                 api_key: Optional[str] = None):
+                 api_key: Optional[str] = None,
+                 query_cache: Optional[QueryParseCache] = None,
+                 rule_parse_threshold: float = 0.8,
+                 api_max_concurrency: int = 8,
+                 api_max_retries: int = 3,
+                 api_timeout: float = 60.0,
+                 image_encoder: Optional[ImageEncoder] = None,
+                 batch_max_size: int = 1,
+                 batch_timeout_ms: float = 10.0,
+                 pixel_cache_size: int = 16,
+                 vision_cache_size: int = 0,
+                 prefix_caching: bool = True,
+                 constrained_decoding: bool = True,
+                 api_guided_mode: str = "guided_json",
+                 lazy_load: bool = False,
+                 dtype: str = "auto",
+                 quantization: Optional[str] = None,
+                 backend: Optional[VLMBackend] = None,
+                 single_flight: bool = True):
         """
         Args:
             model_name: 模型名称
@@ -31,47 +173,80 @@ class QwenVLMClient:
             use_api: 是否使用API模式（vLLM服务器）
             api_url: API服务器地址
             api_key: API密钥
+            query_cache: 查询解析缓存（可选，默认仅内存LRU）
+            rule_parse_threshold: 规则解析置信度阈值（低于该值时调用VLM解析）
+            api_max_concurrency: API模式下同时在途的最大请求数
+            api_max_retries: API调用失败后的最大重试次数
+            api_timeout: 单次API请求超时（秒）
+            image_encoder: API模式的图像编码器（可选，默认JPEG并限制在Qwen2-VL像素范围内）
+            batch_max_size: 本地模式动态批处理的最大批次大小（1表示不合并）
+            batch_timeout_ms: 收集一个批次的最长等待时间（毫秒）
+            pixel_cache_size: 本地模式缓存的预处理图像帧数（0表示不缓存）
+            vision_cache_size: 本地模式缓存的视觉编码器输出帧数（0表示不缓存）
+            prefix_caching: 本地模式是否复用查询解析提示词前缀的KV缓存
+            constrained_decoding: 是否对JSON输出使用约束解码
+            api_guided_mode: API模式的约束方式 ["guided_json", "response_format", "none"]
+            lazy_load: 本地模式是否延迟到首次生成时才加载模型
+            dtype: 本地模型精度 ["auto", "float16", "bfloat16", "float32"]
+            quantization: 本地模型量化方式 [None, "int8_dynamic", "int8_weight_only", "int4_weight_only"]
+            backend: 自定义推理后端（如 MockBackend）；为None时按 use_api 选择
+                OpenAICompatibleBackend 或 TransformersBackend，上面的后端参数随之生效
+            single_flight: 是否合并并发的相同请求（相同消息、图像、max_tokens和温度只生成一次）
         """
         self.model_name = model_name
         self.device = device
         self.use_api = use_api
         self.api_url = api_url or "http://localhost:8000/v1"
         self.api_key = api_key
+        self.query_cache = query_cache or QueryParseCache(version=QUERY_PARSE_PROMPT_VERSION)
+        self.rule_parser = RuleBasedQueryParser()
+        self.rule_parse_threshold = rule_parse_threshold
+        self.constrained_decoding = constrained_decoding
         
-        self.model = None
-        self.processor = None
+        # 查询解析统计
+        self.parse_stats = {"queries": 0, "cache_hits": 0, "rule_resolved": 0, "vlm_calls": 0}
+        self.stream_stats = {"streams": 0, "early_stops": 0, "ttft_total": 0.0,
+                             "time_total": 0.0, "chunks_saved": 0}
+        self._stats_lock = threading.Lock()
         
-        if not use_api:
-            self._load_local_model()
-    
-    def _load_local_model(self):
-        """加载本地模型"""
-        try:
-            from transformers import Qwen2VLForConditionalGeneration, AutoProcessor
-            
-            logger.info(f"加载模型: {self.model_name}")
-            
-            self.model = Qwen2VLForConditionalGeneration.from_pretrained(
-                self.model_name,
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                device_map="auto"
+        # 并发相同请求去重（线程和asyncio两种调用方式分别处理）
+        self.single_flight = SingleFlight() if single_flight else None
+        self.async_single_flight = AsyncSingleFlight() if single_flight else None
+        
+        if backend is not None:
+            self.backend = backend
+        elif use_api:
+            self.backend = OpenAICompatibleBackend(
+                api_url=self.api_url,
+                model_name=model_name,
+                api_key=api_key,
+                max_concurrency=api_max_concurrency,
+                max_retries=api_max_retries,
+                timeout=api_timeout,
+                image_encoder=image_encoder,
+                guided_mode=api_guided_mode
             )
-            
-            self.processor = AutoProcessor.from_pretrained(self.model_name)
-            
-            if self.device == "cuda" and torch.cuda.is_available():
-                self.model = self.model.to(self.device)
-            
-            self.model.eval()
-            logger.info("模型加载完成")
-            
-        except ImportError as e:
-            logger.error("无法导入transformers或qwen-vl模块")
-            logger.error("请运行: pip install transformers qwen-vl-utils")
-            raise
-        except Exception as e:
-            logger.error(f"模型加载失败: {e}")
-            raise
+        else:
+            # 本地后端依赖torch/transformers，只在使用时导入
+            from utils.transformers_backend import TransformersBackend
+            self.backend = TransformersBackend(
+                model_name=model_name,
+                device=device,
+                batch_max_size=batch_max_size,
+                batch_timeout_ms=batch_timeout_ms,
+                pixel_cache_size=pixel_cache_size,
+                vision_cache_size=vision_cache_size,
+                prefix_prompt=QUERY_PARSE_PREFIX if prefix_caching else None,
+                dtype=dtype,
+                quantization=quantization
+            )
+        
+        if not lazy_load:
+            self.ensure_model()
+    
+    def ensure_model(self):
+        """确保后端模型已加载（首次调用时加载，线程安全，可由后台预加载线程调用）"""
+        self.backend.load()
     
     def generate(self,
                 messages: List[Dict],
@@ -88,160 +263,206 @@ class QwenVLMClient:
         Returns:
             生成的文本
         """
-        if self.use_api:
-            return self._generate_via_api(messages, max_tokens, temperature)
-        else:
-            return self._generate_local(messages, max_tokens, temperature)
+        if self.single_flight is None:
+            return self.backend.generate(messages, max_tokens, temperature)
+        
+        return self.single_flight.do(
+            request_key(messages, max_tokens, temperature),
+            lambda: self.backend.generate(messages, max_tokens, temperature)
+        )
     
-    def _generate_local(self,
-                       messages: List[Dict],
-                       max_tokens: int,
-                       temperature: float) -> str:
-        """本地模型生成"""
-        try:
-            from qwen_vl_utils import process_vision_info
-            
-            # 准备输入
-            text = self.processor.apply_chat_template(
-                messages, tokenize=False, add_generation_prompt=True
-            )
-            
-            # 处理图像
-            image_inputs, video_inputs = process_vision_info(messages)
-            
-            inputs = self.processor(
-                text=[text],
-                images=image_inputs,
-                videos=video_inputs,
-                padding=True,
-                return_tensors="pt"
-            )
-            
-            inputs = inputs.to(self.device)
-            
-            # 生成
-            with torch.no_grad():
-                generated_ids = self.model.generate(
-                    **inputs,
-                    max_new_tokens=max_tokens,
-                    temperature=temperature,
-                    do_sample=temperature > 0
-                )
-            
-            # 解码
-            generated_ids_trimmed = [
-                out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
-            ]
-            
-            output_text = self.processor.batch_decode(
-                generated_ids_trimmed,
-                skip_special_tokens=True,
-                clean_up_tokenization_spaces=False
-            )[0]
-            
-            return output_text
-            
-        except Exception as e:
-            logger.error(f"生成失败: {e}")
-            raise
-    
-    def _generate_via_api(self,
-                         messages: List[Dict],
-                         max_tokens: int,
-                         temperature: float) -> str:
-        """通过vLLM API生成"""
+    def generate_batch(self,
+                       messages_list: List[List[Dict]],
+                       max_tokens: Union[int, List[int]] = 512,
+                       temperature: float = 0.1) -> List[str]:
+        """
+        批量生成响应
+        
+        Args:
+            messages_list: 多个对话的消息列表
+            max_tokens: 最大生成token数（可为每个对话单独指定）
+            temperature: 温度参数
+        
+        Returns:
+            与输入一一对应的生成文本
+        """
+        return self.backend.generate_batch(messages_list, max_tokens, temperature)
+    
+    async def agenerate(self,
+                        messages: List[Dict],
+                        max_tokens: int = 512,
+                        temperature: float = 0.1) -> str:
+        """
+        异步生成响应（参数同 generate）
+        
+        API模式下多个请求可以同时在途；本地模式在线程中执行，模型调用串行化。
+        """
+        if self.async_single_flight is None:
+            return await self.backend.agenerate(messages, max_tokens, temperature)
+        
+        return await self.async_single_flight.do(
+            request_key(messages, max_tokens, temperature),
+            lambda: self.backend.agenerate(messages, max_tokens, temperature)
+        )
+    
+    def generate_stream(self,
+                        messages: List[Dict],
+                        max_tokens: int = 512,
+                        temperature: float = 0.1) -> Iterator[str]:
+        """
+        流式生成响应
+        
+        提前关闭返回的迭代器（break / close()）会中止生成：API模式断开连接，
+        本地模式通过 StoppingCriteria 在下一个token处停止。
+        
+        Args:
+            messages: 消息列表（格式同 generate）
+            max_tokens: 最大生成token数
+            temperature: 温度参数
+        
+        Yields:
+            增量文本片段
+        """
+        yield from self.backend.generate_stream(messages, max_tokens, temperature)
+    
+    def generate_until_json(self,
+                            messages: List[Dict],
+                            max_tokens: int = 512,
+                            temperature: float = 0.1) -> str:
+        """
+        流式生成，解析出第一个完整JSON对象后立即停止
+        
+        Returns:
+            截至JSON对象结束的文本（未出现完整对象时为全部输出）
+        """
+        detector = JSONObjectDetector()
+        start = time.time()
+        first_token_time = None
+        chunks = 0
+        early_stop = False
+        
+        stream = self.generate_stream(messages, max_tokens, temperature)
         try:
-            import requests
-            
-            # 转换消息格式
-            api_messages = self._convert_messages_for_api(messages)
-            
-            headers = {
-                "Content-Type": "application/json",
-            }
-            
-            if self.api_key:
-                headers["Authorization"] = f"Bearer {self.api_key}"
-            
-            payload = {
-                "model": self.model_name,
-                "messages": api_messages,
-                "max_tokens": max_tokens,
-                "temperature": temperature
-            }
-            
-            response = requests.post(
-                f"{self.api_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60
+            for chunk in stream:
+                if first_token_time is None:
+                    first_token_time = time.time() - start
+                chunks += 1
+                
+                if detector.feed(chunk) is not None:
+                    early_stop = True
+                    break
+        finally:
+            stream.close()
+        
+        with self._stats_lock:
+            self.stream_stats["streams"] += 1
+            self.stream_stats["ttft_total"] += first_token_time or 0.0
+            self.stream_stats["time_total"] += time.time() - start
+            if early_stop:
+                self.stream_stats["early_stops"] += 1
+                self.stream_stats["chunks_saved"] += max(0, max_tokens - chunks)
+        
+        if early_stop:
+            logger.debug(
+                f"JSON已完整，提前停止生成: {chunks} 个片段 (上限 {max_tokens} tokens), "
+                f"首token {first_token_time:.3f}s"
             )
-            
-            response.raise_for_status()
-            result = response.json()
-            
-            return result["choices"][0]["message"]["content"]
-            
-        except Exception as e:
-            logger.error(f"API调用失败: {e}")
-            raise
+        
+        return detector.text
     
-    def _convert_messages_for_api(self, messages: List[Dict]) -> List[Dict]:
-        """转换消息格式为API格式"""
-        api_messages = []
+    def get_stream_stats(self) -> Dict:
+        """
+        流式生成统计
         
-        for msg in messages:
-            role = msg["role"]
-            content = msg["content"]
-            
-            if isinstance(content, str):
-                api_messages.append({"role": role, "content": content})
-            elif isinstance(content, list):
-                # 处理多模态内容
-                converted_content = []
-                
-                for item in content:
-                    if item["type"] == "text":
-                        converted_content.append({
-                            "type": "text",
-                            "text": item["text"]
-                        })
-                    elif item["type"] == "image":
-                        # 转换图像为base64
-                        image = item["image"]
-                        if isinstance(image, str):
-                            # 已经是路径或URL
-                            converted_content.append({
-                                "type": "image_url",
-                                "image_url": {"url": image}
-                            })
-                        else:
-                            # PIL Image或numpy array
-                            image_url = self._image_to_base64(image)
-                            converted_content.append({
-                                "type": "image_url",
-                                "image_url": {"url": image_url}
-                            })
-                
-                api_messages.append({"role": role, "content": converted_content})
+        Returns:
+            流式调用次数、提前停止次数、平均首token延迟和节省的生成片段数
+        """
+        with self._stats_lock:
+            stats = dict(self.stream_stats)
         
-        return api_messages
+        n = stats["streams"]
+        stats["avg_ttft"] = stats.pop("ttft_total") / n if n else 0.0
+        stats["avg_time"] = stats.pop("time_total") / n if n else 0.0
+        return stats
     
-    def _image_to_base64(self, image: Union[Image.Image, np.ndarray]) -> str:
-        """转换图像为base64编码"""
-        if isinstance(image, np.ndarray):
-            image = Image.fromarray(image)
+    def get_dedup_stats(self) -> Dict:
+        """
+        并发请求去重统计
         
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        image_bytes = buffer.getvalue()
-        base64_str = base64.b64encode(image_bytes).decode('utf-8')
+        Returns:
+            线程/异步调用次数和共享在途结果的次数
+        """
+        if self.single_flight is None:
+            return {"enabled": False}
         
-        return f"data:image/png;base64,{base64_str}"
+        return {
+            "enabled": True,
+            "sync": self.single_flight.get_stats(),
+            "async": self.async_single_flight.get_stats()
+        }
+    
+    def get_backend_stats(self) -> Dict:
+        """推理后端统计（视觉/前缀缓存、批处理、图像编码等）"""
+        stats = self.backend.get_stats()
+        stats["backend"] = self.backend.name
+        return stats
+    
+    def generate_json(self,
+                      messages: List[Dict],
+                      schema: Dict,
+                      max_tokens: int = 512,
+                      temperature: float = 0.1) -> Tuple[Optional[Dict], str]:
+        """
+        生成符合schema的JSON对象
+        
+        启用约束解码时，本地模式用 logits processor 限制输出并在对象闭合后结束，
+        API模式使用 guided_json / response_format；否则流式生成并在JSON完整后停止。
+        
+        Args:
+            messages: 消息列表
+            schema: JSON Schema（支持的子集见 JSONPrefixValidator）
+            max_tokens: 最大生成token数
+            temperature: 温度参数
+        
+        Returns:
+            (解析出的对象（失败为None）, 原始输出文本)
+        """
+        if not self.constrained_decoding:
+            response = self.generate_until_json(messages, max_tokens, temperature)
+        elif self.single_flight is None:
+            response = self.backend.generate_json(messages, schema, max_tokens, temperature)
+        else:
+            response = self.single_flight.do(
+                request_key(messages, max_tokens, temperature, schema=schema),
+                lambda: self.backend.generate_json(messages, schema, max_tokens, temperature)
+            )
+        
+        detector = JSONObjectDetector()
+        object_text = detector.feed(response)
+        if object_text is None:
+            return None, response
+        
+        try:
+            result = json.loads(object_text)
+        except json.JSONDecodeError:
+            return None, response
+        
+        if not JSONPrefixValidator(schema).is_complete(object_text):
+            logger.debug(f"JSON输出不符合schema: {object_text}")
+        
+        return (result if isinstance(result, dict) else None), response
+    
+    def close(self):
+        """释放后端资源（API连接、批处理线程）"""
+        self.backend.close()
+    
+    async def aclose(self):
+        """在事件循环中释放后端资源（关闭异步API会话）"""
+        await self.backend.aclose()
     
     def parse_grounding_response(self, response: str) -> Dict:
         """
-        解析VLM的grounding响应
+        解析VLM的grounding响应（正则和关键词表预编译，见 utils/response_parser.py）
         
         Args:
             response: VLM生成的文本
@@ -249,39 +470,27 @@ class QwenVLMClient:
         Returns:
             解析结果字典
         """
-        # 尝试提取结构化信息
-        result = {
-            "target_object": None,
-            "anchor_object": None,
-            "spatial_relation": None,
-            "bounding_box": None,
-            "confidence": 0.5,
-            "raw_response": response
-        }
-        
-        # 提取目标物体
-        target_match = re.search(r'target[:\s]+([a-zA-Z\s]+)', response, re.IGNORECASE)
-        if target_match:
-            result["target_object"] = target_match.group(1).strip()
-        
-        # 提取锚点物体
-        anchor_match = re.search(r'anchor[:\s]+([a-zA-Z\s]+)', response, re.IGNORECASE)
-        if anchor_match:
-            result["anchor_object"] = anchor_match.group(1).strip()
+        return parse_grounding_response(response)
+    
+    def analyze_query(self, query: str) -> QueryAnalysis:
+        """
+        解析查询并记录来源和耗时
         
-        # 提取空间关系
-        relations = ['on', 'above', 'below', 'left', 'right', 'near', 'inside', 'behind', 'front']
-        for rel in relations:
-            if rel in response.lower():
-                result["spatial_relation"] = rel
-                break
+        Args:
+            query: 自然语言查询
         
-        # 提取边界框坐标（如果有）
-        bbox_match = re.search(r'\[(\d+\.?\d*),\s*(\d+\.?\d*),\s*(\d+\.?\d*),\s*(\d+\.?\d*)\]', response)
-        if bbox_match:
-            result["bounding_box"] = [float(x) for x in bbox_match.groups()]
+        Returns:
+            QueryAnalysis
+        """
+        start = time.time()
+        components, source = self._parse_query(query)
         
-        return result
+        return QueryAnalysis(
+            query=query,
+            components=components,
+            source=source,
+            parse_time=time.time() - start
+        )
     
     def extract_query_components(self, query: str) -> Dict:
         """
@@ -293,84 +502,171 @@ class QwenVLMClient:
         Returns:
             提取的组件
         """
-        messages = [{
-            "role": "user",
-            "content": f"""分析以下查询，提取目标物体、锚点物体和空间关系。
-            
-查询: "{query}"
-
-请以JSON格式返回：
-{{
-    "target": "目标物体名称",
-    "anchor": "锚点物体名称（如果有）",
-    "relation": "空间关系（如果有，例如on/above/near等）",
-    "target_attributes": ["颜色", "材质等属性"]
-}}
-
-只返回JSON，不要其他文字。"""
-        }]
+        return self._parse_query(query)[0]
+    
+    def analyze_queries(self, queries: List[str], max_workers: int = 8) -> List[QueryAnalysis]:
+        """
+        批量解析查询（同一场景的多个查询）
         
-        try:
-            response = self.generate(messages, max_tokens=200, temperature=0.1)
-            
-            # 尝试解析JSON
-            import json
-            # 提取JSON部分
-            json_match = re.search(r'\{[^}]+\}', response, re.DOTALL)
-            if json_match:
-                result = json.loads(json_match.group(0))
-                return result
+        缓存和规则能解析的查询逐条处理；其余查询的VLM调用一起提交：
+        本地模式合并为一次批量生成，API/模拟后端并发请求（服务端连续批处理）。
+        重复的查询只解析一次。
+        
+        Args:
+            queries: 查询列表
+            max_workers: API模式下同时在途的解析请求数
+        
+        Returns:
+            与输入一一对应的QueryAnalysis
+        """
+        start = time.time()
+        unique = list(dict.fromkeys(queries))
+        resolved: Dict[str, Tuple[Dict, str]] = {}
+        pending: Dict[str, Dict] = {}  # 需要VLM解析的查询 -> 规则解析结果（回退用）
+        
+        for query in unique:
+            components, source, rule_result = self._parse_query_without_vlm(query)
+            if components is not None:
+                resolved[query] = (components, source)
             else:
-                # 回退到简单解析
-                return self._simple_query_parsing(query)
+                pending[query] = rule_result
+        
+        if pending:
+            logger.info(f"批量VLM查询解析: {len(pending)}/{len(unique)} 个查询")
+            pending_queries = list(pending)
+            
+            if self.backend.name == "transformers":
+                # 本地模型：左侧填充后一次生成（启用约束解码时每行约束为合法JSON），输出按JSON对象截取
+                messages_list = [self._query_parse_messages(q) for q in pending_queries]
+                try:
+                    if self.constrained_decoding:
+                        responses = self.backend.generate_json_batch(
+                            messages_list, QUERY_COMPONENTS_SCHEMA, max_tokens=200, temperature=0.1
+                        )
+                    else:
+                        responses = self.backend.generate_batch(messages_list, max_tokens=200, temperature=0.1)
+                except Exception as e:
+                    logger.warning(f"批量查询解析失败，使用规则解析结果: {e}")
+                    responses = [""] * len(pending_queries)
                 
-        except Exception as e:
-            logger.warning(f"查询解析失败，使用简单方法: {e}")
-            return self._simple_query_parsing(query)
+                for query, response in zip(pending_queries, responses):
+                    object_text = JSONObjectDetector().feed(response)
+                    try:
+                        result = json.loads(object_text) if object_text else None
+                    except json.JSONDecodeError:
+                        result = None
+                    resolved[query] = self._finish_vlm_parse(
+                        query, result if isinstance(result, dict) else None, response, pending[query]
+                    )
+            else:
+                workers = max(1, min(max_workers, len(pending_queries)))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    parsed = executor.map(
+                        lambda q: self._parse_query_with_vlm(q, pending[q]), pending_queries
+                    )
+                    resolved.update(zip(pending_queries, parsed))
+        
+        # 批量解析的耗时平均分摊到各个查询
+        parse_time = (time.time() - start) / max(len(unique), 1)
+        return [
+            QueryAnalysis(
+                query=query,
+                components=resolved[query][0],
+                source=resolved[query][1],
+                parse_time=parse_time
+            )
+            for query in queries
+        ]
     
-    def _simple_query_parsing(self, query: str) -> Dict:
-        """简单的查询解析（基于规则）"""
-        result = {
-            "target": None,
-            "anchor": None,
-            "relation": None,
-            "target_attributes": []
-        }
+    def _parse_query(self, query: str) -> Tuple[Dict, str]:
+        """解析查询，返回 (组件, 来源)"""
+        components, source, rule_result = self._parse_query_without_vlm(query)
+        if components is not None:
+            return components, source
         
-        # 提取空间关系
-        relations = {
-            'on': ['on', 'on top of'],
-            'above': ['above', 'over'],
-            'below': ['below', 'under', 'beneath'],
-            'near': ['near', 'next to', 'beside'],
-            'left': ['left of', 'to the left'],
-            'right': ['right of', 'to the right'],
-            'inside': ['inside', 'in', 'within']
-        }
+        return self._parse_query_with_vlm(query, rule_result)
+    
+    def _parse_query_without_vlm(self, query: str) -> Tuple[Optional[Dict], str, Dict]:
+        """
+        用缓存和规则解析查询
         
-        query_lower = query.lower()
-        for rel_key, rel_phrases in relations.items():
-            for phrase in rel_phrases:
-                if phrase in query_lower:
-                    result["relation"] = rel_key
-                    # 分割查询
-                    parts = query_lower.split(phrase)
-                    if len(parts) == 2:
-                        result["target"] = parts[0].strip()
-                        result["anchor"] = parts[1].strip()
-                    break
-            if result["relation"]:
-                break
+        Returns:
+            (组件（需要VLM时为None）, 来源, 规则解析结果)
+        """
+        self._count_parse("queries")
         
-        # 如果没有找到关系，假设整个查询是目标
-        if not result["target"]:
-            result["target"] = query.strip()
+        # 缓存命中时跳过VLM
+        cached = self.query_cache.get(query, self.model_name)
+        if cached is not None and not is_valid_query_components(cached):
+            # 旧版本写入的无效结果：当作未命中，重新解析后覆盖
+            logger.debug(f"忽略缓存中无效的查询解析结果: {cached!r}")
+            cached = None
+        if cached is not None:
+            self._count_parse("cache_hits")
+            return cached, "cache", cached
         
-        # 提取颜色属性
-        colors = ['red', 'blue', 'green', 'yellow', 'black', 'white', 'brown', 'gray', 'orange']
-        for color in colors:
-            if color in query_lower:
-                result["target_attributes"].append(color)
+        # 规则解析置信度足够时不调用VLM
+        rule_result, confidence = self.rule_parser.parse(query)
+        if confidence >= self.rule_parse_threshold:
+            self._count_parse("rule_resolved")
+            return rule_result, "rules", rule_result
         
-        return result
-
+        logger.debug(f"规则解析置信度 {confidence:.2f} 低于阈值，调用VLM: {query}")
+        return None, "vlm", rule_result
+    
+    def _query_parse_messages(self, query: str) -> List[Dict]:
+        return [{
+            "role": "user",
+            "content": QUERY_PARSE_PROMPT.format(query=query)
+        }]
+    
+    def _parse_query_with_vlm(self, query: str, rule_result: Dict) -> Tuple[Dict, str]:
+        """调用VLM解析查询，失败时回退到规则解析结果"""
+        try:
+            result, response = self.generate_json(
+                self._query_parse_messages(query), QUERY_COMPONENTS_SCHEMA, max_tokens=200, temperature=0.1
+            )
+        except Exception as e:
+            self._count_parse("vlm_calls")
+            logger.warning(f"查询解析失败，使用规则解析结果: {e}")
+            return rule_result, "rules"
+        
+        return self._finish_vlm_parse(query, result, response, rule_result)
+    
+    def _finish_vlm_parse(self,
+                          query: str,
+                          result: Optional[Dict],
+                          response: str,
+                          rule_result: Dict) -> Tuple[Dict, str]:
+        """记录VLM解析结果，符合schema且有目标物体时写入缓存"""
+        self._count_parse("vlm_calls")
+        
+        if result is not None and is_valid_query_components(result):
+            self.query_cache.put(query, self.model_name, result)
+            return result, "vlm"
+        
+        # 回退到规则解析结果（不缓存，下次仍会调用VLM）
+        logger.warning(f"VLM返回的JSON无效或缺少目标物体，使用规则解析结果: {response!r}")
+        return rule_result, "rules"
+    
+    def _count_parse(self, key: str):
+        with self._stats_lock:
+            self.parse_stats[key] += 1
+    
+    def get_parse_stats(self) -> Dict:
+        """
+        查询解析统计
+        
+        Returns:
+            各来源计数及无需调用模型的比例
+        """
+        with self._stats_lock:
+            stats = dict(self.parse_stats)
+        
+        total = stats["queries"]
+        stats["model_free_ratio"] = (total - stats["vlm_calls"]) / total if total else 0.0
+        return stats
+    
+    def _simple_query_parsing(self, query: str) -> Dict:
+        """简单的查询解析（基于规则）"""
+        return self.rule_parser.parse(query)[0]